@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+相似度计算性能基准测试
+对比纯Python逐对计算、NumPy批量计算、分块Top-K检索以及量化检索的性能，
+统计吞吐量（向量/秒）、单查询延迟分位数和峰值内存，并将结果写入JSON文件，
+便于在版本之间对比发现性能回退
+
+用法示例:
+    python benchmark_similarity.py --dims 384 768 --sizes 10000 100000 --output bench.json
+    python benchmark_similarity.py --sizes 10000 --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from similarity_algorithms import (
+    DEFAULT_BLOCK_SIZE,
+    batch_cosine_similarity,
+    batch_dot_product,
+    batch_euclidean_distance,
+    cosine_similarity,
+    dot_product,
+    euclidean_distance,
+)
+from top_k_search import top_k_search
+from quantization import QuantizedIndex
+
+
+DEFAULT_DIMS = [384, 768, 1536]
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+# 纯Python实现在大语料上过慢，只在前N个向量上计时并按吞吐量折算
+PYTHON_MAX_CORPUS = 2000
+
+# 峰值内存在单独的跟踪轮次中统计，只需少量查询
+MEMORY_PROBE_QUERIES = 3
+
+# 对比基线时，吞吐量下降超过该比例即视为性能回退
+DEFAULT_REGRESSION_TOLERANCE = 0.2
+
+SCALAR_FUNCTIONS = {
+    "cosine": cosine_similarity,
+    "dot": dot_product,
+    "euclidean": euclidean_distance,
+}
+
+BATCH_FUNCTIONS = {
+    "cosine": batch_cosine_similarity,
+    "dot": batch_dot_product,
+    "euclidean": batch_euclidean_distance,
+}
+
+
+def create_corpus(path: str, n_vectors: int, dim: int, seed: int = 0,
+                  block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """
+    分块生成随机语料并写入内存映射文件，避免大语料一次性占满内存
+
+    Args:
+        path: 语料文件路径
+        n_vectors: 向量数量
+        dim: 向量维度
+        seed: 随机种子
+        block_size: 每次生成的向量数
+
+    Returns:
+        np.ndarray: 只读的内存映射语料矩阵
+    """
+    rng = np.random.default_rng(seed)
+    corpus = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n_vectors, dim))
+    for start in range(0, n_vectors, block_size):
+        end = min(start + block_size, n_vectors)
+        corpus[start:end] = rng.standard_normal((end - start, dim), dtype=np.float32)
+    corpus.flush()
+    del corpus
+    return np.load(path, mmap_mode="r")
+
+
+def measure(run_query: Callable[[np.ndarray], object], queries: np.ndarray,
+            vectors_per_query: int) -> Dict[str, float]:
+    """
+    逐个查询计时并统计吞吐量、延迟分位数和峰值内存
+
+    tracemalloc 的分配钩子会显著拖慢计时（纯Python路径约慢一倍），
+    因此计时轮次关闭跟踪，峰值内存在之后的单独轮次中统计
+
+    Args:
+        run_query: 处理单个查询的函数
+        queries: 形状为 (q, dim) 的查询矩阵
+        vectors_per_query: 每个查询实际比较的语料向量数
+
+    Returns:
+        dict: 性能指标
+    """
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        run_query(query)
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        for query in queries[:MEMORY_PROBE_QUERIES]:
+            run_query(query)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    return {
+        "vectors_per_sec": vectors_per_query * len(latencies) / latencies.sum(),
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50) * 1000),
+            "p95": float(np.percentile(latencies, 95) * 1000),
+            "p99": float(np.percentile(latencies, 99) * 1000),
+        },
+        "peak_memory_mb": peak / 1024 / 1024,
+    }
+
+
+def benchmark_case(corpus: np.ndarray, queries: np.ndarray, k: int,
+                   methods: List[str]) -> List[Dict]:
+    """
+    在一组语料和查询上运行所有选中的方法
+
+    Args:
+        corpus: 形状为 (n, dim) 的语料矩阵
+        queries: 形状为 (q, dim) 的查询矩阵
+        k: Top-K检索返回的结果数
+        methods: 需要测试的方法类别
+
+    Returns:
+        List[Dict]: 每个方法一条结果记录
+    """
+    records = []
+    n_vectors = corpus.shape[0]
+
+    if "python" in methods:
+        python_corpus = np.asarray(corpus[:PYTHON_MAX_CORPUS]).tolist()
+        python_queries = queries.tolist()
+        for metric, func in SCALAR_FUNCTIONS.items():
+            stats = measure(
+                lambda query: [func(query, doc) for doc in python_corpus],
+                python_queries,
+                len(python_corpus),
+            )
+            records.append({"method": f"python_{metric}", **stats})
+
+    if "batch" in methods:
+        for metric, func in BATCH_FUNCTIONS.items():
+            stats = measure(lambda query: func(query, corpus), queries, n_vectors)
+            records.append({"method": f"batch_{metric}", **stats})
+
+    if "topk" in methods:
+        for metric in BATCH_FUNCTIONS:
+            stats = measure(
+                lambda query: top_k_search(query, corpus, k=k, metric=metric),
+                queries,
+                n_vectors,
+            )
+            records.append({"method": f"topk_{metric}", **stats})
+
+    if "quantized" in methods:
+        for method in ("int8", "binary"):
+            index = QuantizedIndex(corpus, method=method)
+            stats = measure(lambda query: index.search(query, k=k), queries, n_vectors)
+            stats["compression_ratio"] = index.memory_usage()["compression_ratio"]
+            records.append({"method": f"quantized_{method}", **stats})
+            del index
+
+    return records
+
+
+def run_benchmarks(dims: List[int], sizes: List[int], n_queries: int, k: int,
+                   methods: List[str], work_dir: str) -> Dict:
+    """
+    遍历所有维度和语料规模运行基准测试
+
+    Returns:
+        dict: 包含运行环境和全部结果的报告
+    """
+    results = []
+    for dim in dims:
+        for size in sizes:
+            path = os.path.join(work_dir, f"corpus_{dim}_{size}.npy")
+            corpus = create_corpus(path, size, dim)
+            queries = np.random.default_rng(1).standard_normal((n_queries, dim), dtype=np.float32)
+
+            for record in benchmark_case(corpus, queries, k, methods):
+                record.update({"dim": dim, "corpus_size": size})
+                results.append(record)
+                print(f"[{dim:>5}d x {size:>8}] {record['method']:<20} "
+                      f"{record['vectors_per_sec']:>14,.0f} vec/s  "
+                      f"p50 {record['latency_ms']['p50']:>9.2f} ms  "
+                      f"p99 {record['latency_ms']['p99']:>9.2f} ms  "
+                      f"peak {record['peak_memory_mb']:>8.1f} MB")
+
+            del corpus
+            os.remove(path)
+
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "config": {"n_queries": n_queries, "k": k, "methods": methods},
+        "results": results,
+    }
+
+
+def compare_reports(baseline: Dict, current: Dict,
+                    tolerance: float = DEFAULT_REGRESSION_TOLERANCE) -> List[str]:
+    """
+    对比两次基准测试的吞吐量，找出性能回退的条目
+
+    Args:
+        baseline: 基线报告
+        current: 当前报告
+        tolerance: 允许的吞吐量下降比例
+
+    Returns:
+        List[str]: 性能回退描述列表，为空表示没有回退
+    """
+    def key(record):
+        return record["method"], record["dim"], record["corpus_size"]
+
+    baseline_records = {key(record): record for record in baseline.get("results", [])}
+    regressions = []
+    for record in current.get("results", []):
+        previous = baseline_records.get(key(record))
+        if previous is None:
+            continue
+        ratio = record["vectors_per_sec"] / previous["vectors_per_sec"]
+        if ratio < 1 - tolerance:
+            method, dim, size = key(record)
+            regressions.append(
+                f"{method} ({dim}d x {size}): 吞吐量 {previous['vectors_per_sec']:,.0f} -> "
+                f"{record['vectors_per_sec']:,.0f} vec/s ({ratio:.0%})"
+            )
+    return regressions
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="相似度计算性能基准测试")
+    parser.add_argument("--dims", type=int, nargs="+", default=DEFAULT_DIMS, help="向量维度")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="语料规模")
+    parser.add_argument("--queries", type=int, default=20, help="每组测试的查询数")
+    parser.add_argument("--k", type=int, default=10, help="Top-K检索返回的结果数")
+    parser.add_argument("--methods", nargs="+", default=["python", "batch", "topk", "quantized"],
+                        choices=["python", "batch", "topk", "quantized"], help="需要测试的方法")
+    parser.add_argument("--output", default="similarity_benchmark.json", help="结果JSON文件路径")
+    parser.add_argument("--compare", help="用于对比的基线JSON文件路径")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_REGRESSION_TOLERANCE,
+                        help="允许的吞吐量下降比例")
+    parser.add_argument("--work-dir", help="临时语料文件目录，默认使用系统临时目录")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        report = run_benchmarks(args.dims, args.sizes, args.queries, args.k, args.methods, work_dir)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            print("检测到性能回退:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("未检测到性能回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+量化相似度检索
+包含标量量化（int8）和二值量化（符号位）两种压缩方式:
+- int8: 每个维度用1字节表示，内存为float32的1/4，使用整数点积近似相似度
+- binary: 每个维度用1比特表示，内存为float32的1/32，使用汉明距离近似相似度
+
+检索分两阶段进行：先在量化编码上选出候选短名单，再用原始float32向量精确重排
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+from similarity_algorithms import (
+    DEFAULT_BLOCK_SIZE,
+    METRICS,
+    NormalizedVectors,
+    as_float32_matrix,
+    score_block,
+)
+from top_k_search import heaps_to_arrays, merge_block_candidates
+
+
+# 支持的量化方式
+QUANTIZATION_METHODS = ("int8", "binary")
+
+# 0-255 每个字节中1的个数，用于计算汉明距离
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def quantize_int8(vectors) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对向量做对称的int8标量量化
+
+    每个向量使用独立的缩放系数 scale = max|x| / 127，
+    原始向量可近似还原为 codes * scale
+
+    Args:
+        vectors: 形状为 (n, dim) 的向量矩阵
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (int8编码矩阵, float32缩放系数数组)
+    """
+    matrix = as_float32_matrix(vectors)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    # 零向量的缩放系数设为1，编码全为0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors) -> np.ndarray:
+    """
+    对向量做二值量化，每个维度只保留符号位（>0 为1），并按字节打包
+
+    Args:
+        vectors: 形状为 (n, dim) 的向量矩阵
+
+    Returns:
+        np.ndarray: 形状为 (n, ceil(dim / 8)) 的uint8编码矩阵
+    """
+    matrix = as_float32_matrix(vectors)
+    return np.packbits(matrix > 0, axis=1)
+
+
+def int8_dot_product(query_codes: np.ndarray, query_scales: np.ndarray,
+                     codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """
+    用int8编码近似计算点积
+
+    整数编码的乘积累加在float32中进行以利用BLAS，
+    其舍入误差远小于量化本身带来的误差
+
+    Args:
+        query_codes: 形状为 (q, dim) 的查询int8编码
+        query_scales: 查询缩放系数
+        codes: 形状为 (b, dim) 的语料int8编码
+        scales: 语料缩放系数
+
+    Returns:
+        np.ndarray: 形状为 (q, b) 的近似点积矩阵
+    """
+    dots = query_codes.astype(np.float32) @ codes.astype(np.float32).T
+    dots *= query_scales[:, None]
+    dots *= scales[None, :]
+    return dots
+
+
+def hamming_distance(query_codes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    计算打包后的二值编码之间的汉明距离
+
+    Args:
+        query_codes: 形状为 (q, bytes) 的查询二值编码
+        codes: 形状为 (b, bytes) 的语料二值编码
+
+    Returns:
+        np.ndarray: 形状为 (q, b) 的汉明距离矩阵
+    """
+    distances = np.empty((query_codes.shape[0], codes.shape[0]), dtype=np.float32)
+    # 逐个查询计算，使 (b, bytes) 大小的中间结果不随查询数增长
+    for row, query in enumerate(query_codes):
+        distances[row] = _POPCOUNT_TABLE[np.bitwise_xor(codes, query)].sum(axis=1)
+    return distances
+
+
+class QuantizedIndex:
+    """
+    量化向量索引
+
+    只有量化编码需要常驻内存；原始float32向量仅在重排阶段按候选下标读取，
+    因此可以传入 np.memmap，将全精度数据留在磁盘上
+    """
+
+    def __init__(self, vectors, method: str = "int8", metric: str = "cosine",
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        """
+        Args:
+            vectors: 形状为 (n, dim) 的原始向量矩阵（可以是 np.memmap）
+            method: 量化方式，取值为 "int8" 或 "binary"
+            metric: 相似度度量，取值为 "cosine"、"dot" 或 "euclidean"
+            block_size: 量化编码分块扫描时每块包含的向量数
+
+        Raises:
+            ValueError: 当量化方式或度量不支持时
+        """
+        if method not in QUANTIZATION_METHODS:
+            raise ValueError(f"不支持的量化方式: {method}，可选值为 {QUANTIZATION_METHODS}")
+        if metric not in METRICS:
+            raise ValueError(f"不支持的相似度度量: {metric}，可选值为 {METRICS}")
+
+        self.method = method
+        self.metric = metric
+        self.block_size = block_size
+
+        # 保留原始向量（内存映射输入不会被复制），仅在重排阶段读取
+        matrix = as_float32_matrix(vectors)
+        self.vectors = matrix
+        self.dim = matrix.shape[1]
+        self.codes = None
+        self.scales = None
+        self.squared_norms = None
+
+        # 分块量化，避免一次性把整个（可能是内存映射的）语料转换到内存中
+        code_blocks, scale_blocks, norm_blocks = [], [], []
+        for start in range(0, matrix.shape[0], block_size):
+            block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+            if metric == "cosine":
+                # 余弦相似度下先逐块归一化再量化，使编码点积与余弦相似度等价
+                block = NormalizedVectors(block).vectors
+            if method == "int8":
+                codes, scales = quantize_int8(block)
+                code_blocks.append(codes)
+                scale_blocks.append(scales)
+                if metric == "euclidean":
+                    # 欧几里得距离通过 ||q||^2 + ||c||^2 - 2 q·c 近似，需要保留模长
+                    norm_blocks.append(np.einsum("ij,ij->i", block, block).astype(np.float32))
+            else:
+                code_blocks.append(quantize_binary(block))
+
+        if code_blocks:
+            self.codes = np.concatenate(code_blocks)
+        if scale_blocks:
+            self.scales = np.concatenate(scale_blocks)
+        if norm_blocks:
+            self.squared_norms = np.concatenate(norm_blocks)
+
+    def __len__(self) -> int:
+        return 0 if self.codes is None else self.codes.shape[0]
+
+    def _encode_queries(self, queries: np.ndarray):
+        """量化查询向量，每次检索只执行一次"""
+        if self.method == "binary":
+            return quantize_binary(queries), None
+        return quantize_int8(queries)
+
+    def _approximate_scores(self, queries: np.ndarray, query_codes: np.ndarray,
+                            query_scales: np.ndarray, start: int,
+                            end: int) -> Tuple[np.ndarray, bool]:
+        """在量化编码上计算一个分块的近似得分，返回 (得分, 是否越大越好)"""
+        if self.method == "binary":
+            return hamming_distance(query_codes, self.codes[start:end]), False
+
+        dots = int8_dot_product(query_codes, query_scales,
+                                self.codes[start:end], self.scales[start:end])
+        if self.metric != "euclidean":
+            return dots, True
+
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        squared = query_norms[:, None] + self.squared_norms[None, start:end] - 2 * dots
+        return squared, False
+
+    def search(self, queries, k: int = 10,
+               rescore_depth: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        两阶段检索：量化编码上粗排，再用float32向量精确重排
+
+        Args:
+            queries: 形状为 (q, dim) 的查询矩阵或单个查询向量
+            k: 每个查询返回的结果数
+            rescore_depth: 进入精确重排的候选数，默认为 4 * k；
+                设为0时跳过重排，直接返回量化得分
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (indices, scores)，形状均为 (q, k')，
+            重排后 scores 为原始度量下的精确得分（euclidean 为距离）
+        """
+        if k <= 0:
+            raise ValueError("k必须为正整数")
+        if rescore_depth is None:
+            rescore_depth = 4 * k
+
+        queries = as_float32_matrix(queries)
+        if queries.shape[1] != self.dim:
+            raise ValueError("向量维度必须相同")
+        if self.metric == "cosine":
+            queries = NormalizedVectors(queries).vectors
+
+        k = min(k, len(self))
+        depth = min(max(rescore_depth, k), len(self))
+
+        # 第一阶段：分块扫描量化编码，为每个查询保留depth个候选
+        query_codes, query_scales = self._encode_queries(queries)
+        heaps = [[] for _ in range(queries.shape[0])]
+        larger_is_better = True
+        for start in range(0, len(self), self.block_size):
+            end = min(start + self.block_size, len(self))
+            scores, larger_is_better = self._approximate_scores(
+                queries, query_codes, query_scales, start, end
+            )
+            merge_block_candidates(heaps, scores, start, depth, larger_is_better)
+        candidates, approximate = heaps_to_arrays(heaps, depth, larger_is_better)
+
+        if rescore_depth == 0:
+            return candidates[:, :k], approximate[:, :k]
+
+        # 第二阶段：读取候选的原始向量，按精确度量重排
+        metric = self.metric
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        result_scores = np.empty((queries.shape[0], k), dtype=np.float32)
+        for row, row_candidates in enumerate(candidates):
+            # 按下标升序读取，对内存映射文件更友好
+            ordered = np.sort(row_candidates)
+            exact = score_block(queries[row:row + 1], self.vectors[ordered], metric)[0]
+            keys = exact if metric != "euclidean" else -exact
+            best = np.argsort(-keys, kind="stable")[:k]
+            indices[row] = ordered[best]
+            result_scores[row] = exact[best]
+        return indices, result_scores
+
+    def memory_usage(self) -> Dict[str, float]:
+        """
+        统计量化编码的内存占用
+
+        Returns:
+            dict: 编码字节数、对应float32向量的字节数以及压缩比
+        """
+        code_bytes = 0 if self.codes is None else self.codes.nbytes
+        for extra in (self.scales, self.squared_norms):
+            if extra is not None:
+                code_bytes += extra.nbytes
+        float_bytes = len(self) * self.dim * np.dtype(np.float32).itemsize
+        return {
+            "code_bytes": code_bytes,
+            "float32_bytes": float_bytes,
+            "compression_ratio": float_bytes / code_bytes if code_bytes else 0.0,
+        }
+
+
+# 示例和测试代码
+if __name__ == "__main__":
+    from top_k_search import top_k_search
+
+    rng = np.random.default_rng(7)
+    corpus_vectors = rng.standard_normal((20000, 1536)).astype(np.float32)
+    query_vectors = corpus_vectors[:5] + 0.5 * rng.standard_normal((5, 1536)).astype(np.float32)
+
+    exact_indices, _ = top_k_search(query_vectors, corpus_vectors, k=10)
+    print("精确检索 Top-10 作为对照")
+
+    for method_name in QUANTIZATION_METHODS:
+        index = QuantizedIndex(corpus_vectors, method=method_name)
+        usage = index.memory_usage()
+        print(f"\n{method_name} 量化: 编码 {usage['code_bytes'] / 1024 / 1024:.1f} MB, "
+              f"压缩比 {usage['compression_ratio']:.1f}x")
+        for depth in (0, 20, 100):
+            found, _ = index.search(query_vectors, k=10, rescore_depth=depth)
+            recall = np.mean([
+                len(set(found[i]) & set(exact_indices[i])) / 10 for i in range(len(found))
+            ])
+            print(f"  重排深度 {depth:>3}: Recall@10 = {recall:.2f}")
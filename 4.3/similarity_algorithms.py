@@ -5,10 +5,22 @@
 相似度计算算法实现
 包含余弦相似度、点积、欧几里得距离三种算法
 用于理解和比较嵌入模型中的相似度计算方法
+
+除逐对计算的纯Python版本外，还提供基于NumPy float32矩阵的批量版本，
+用于一次性计算一批查询向量与整个语料矩阵之间的相似度
 """
 
 import math
-from typing import List, Union
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+
+
+# 批量计算时每个语料分块包含的向量数，控制中间结果的内存占用
+DEFAULT_BLOCK_SIZE = 8192
+
+# 支持的相似度度量
+METRICS = ("cosine", "dot", "euclidean")
 
 
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
@@ -140,6 +152,253 @@ def similarity_comparison(vec1: List[float], vec2: List[float]) -> dict:
     return results
 
 
+def as_float32_matrix(vectors) -> np.ndarray:
+    """
+    将向量或向量列表转换为二维float32矩阵
+
+    Args:
+        vectors: 单个向量、向量列表或NumPy数组
+
+    Returns:
+        np.ndarray: 形状为 (n, dim) 的float32矩阵
+
+    Raises:
+        ValueError: 当输入为空或维度超过二维时
+    """
+    if isinstance(vectors, NormalizedVectors):
+        return vectors.vectors
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if matrix.ndim != 2:
+        raise ValueError("输入必须是向量或向量矩阵")
+    if matrix.shape[1] == 0:
+        raise ValueError("向量不能为空")
+    return matrix
+
+
+def row_norms(matrix: np.ndarray) -> np.ndarray:
+    """
+    计算矩阵每一行的L2模长
+
+    Args:
+        matrix: 形状为 (n, dim) 的矩阵
+
+    Returns:
+        np.ndarray: 长度为n的模长数组
+    """
+    return np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+
+
+class NormalizedVectors:
+    """
+    已L2归一化的向量集合
+
+    归一化只在构造（入库）时执行一次，并通过类型记录"已归一化"这一事实。
+    对单位向量而言余弦相似度等于点积，因此批量相似度计算和Top-K检索在遇到
+    该容器时会跳过模长计算，直接使用点积
+    """
+
+    def __init__(self, vectors, assume_normalized: bool = False):
+        """
+        Args:
+            vectors: 单个向量、向量列表或NumPy数组（包括 np.memmap）
+            assume_normalized: 输入已经是单位向量时设为True，
+                此时不再复制或重新计算，可直接包装内存映射文件
+        """
+        matrix = as_float32_matrix(vectors)
+        if not assume_normalized:
+            norms = row_norms(matrix)
+            # 零向量保持为零，与 normalize_vector 的行为一致
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms[:, None]
+        self.vectors = matrix
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """向量矩阵的形状 (n, dim)"""
+        return self.vectors.shape
+
+    @property
+    def ndim(self) -> int:
+        """向量矩阵的维数，恒为2"""
+        return self.vectors.ndim
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def __getitem__(self, index):
+        return self.vectors[index]
+
+
+def normalize_vectors(vectors) -> NormalizedVectors:
+    """
+    对一批向量做一次性L2归一化，已归一化的容器直接返回
+
+    Args:
+        vectors: 单个向量、向量列表、NumPy数组或 NormalizedVectors
+
+    Returns:
+        NormalizedVectors: 归一化后的向量集合
+    """
+    if isinstance(vectors, NormalizedVectors):
+        return vectors
+    return NormalizedVectors(vectors)
+
+
+def score_block(queries: np.ndarray, block: np.ndarray, metric: str,
+                query_norms: np.ndarray = None) -> np.ndarray:
+    """
+    计算查询矩阵与一个语料分块之间的相似度矩阵
+
+    Args:
+        queries: 形状为 (q, dim) 的float32查询矩阵
+        block: 形状为 (b, dim) 的float32语料分块
+        metric: 相似度度量，取值为 "cosine"、"dot" 或 "euclidean"
+        query_norms: 预先计算的查询模长，为空时在函数内计算
+
+    Returns:
+        np.ndarray: 形状为 (q, b) 的相似度（或距离）矩阵
+    """
+    block = np.asarray(block, dtype=np.float32)
+
+    if metric == "euclidean":
+        # ||q - c||^2 = ||q||^2 + ||c||^2 - 2 q·c 在float32下对相近向量存在严重的
+        # 抵消误差，因此按分块升到float64计算（内存占用仍受分块大小限制）
+        queries64 = queries.astype(np.float64)
+        block64 = block.astype(np.float64)
+        squared = queries64 @ block64.T
+        squared *= -2.0
+        squared += np.einsum("ij,ij->i", queries64, queries64)[:, None]
+        squared += np.einsum("ij,ij->i", block64, block64)[None, :]
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared).astype(np.float32)
+
+    scores = queries @ block.T
+
+    if metric == "dot":
+        return scores
+
+    if query_norms is None:
+        query_norms = row_norms(queries)
+    block_norms = row_norms(block)
+
+    if metric == "cosine":
+        denominator = np.outer(query_norms, block_norms)
+        # 与标量版本一致：任一向量模长为0时相似度为0
+        np.divide(scores, denominator, out=scores, where=denominator != 0)
+        scores[denominator == 0] = 0.0
+        return scores
+
+    raise ValueError(f"不支持的相似度度量: {metric}，可选值为 {METRICS}")
+
+
+def iter_similarity_blocks(queries, corpus, metric: str = "cosine",
+                           block_size: int = DEFAULT_BLOCK_SIZE
+                           ) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    按分块遍历语料矩阵，逐块产出查询与语料之间的相似度
+
+    每次只在内存中保留一个 (q, block_size) 的结果块，
+    语料可以是普通数组，也可以是 np.memmap
+
+    Args:
+        queries: 查询向量或查询矩阵
+        corpus: 形状为 (n, dim) 的语料矩阵
+        metric: 相似度度量，取值为 "cosine"、"dot" 或 "euclidean"
+        block_size: 每个分块包含的语料向量数
+
+    Yields:
+        Tuple[int, np.ndarray]: (分块起始行号, 形状为 (q, b) 的结果块)
+
+    Raises:
+        ValueError: 当维度不匹配、度量不支持或分块大小非法时
+    """
+    if metric not in METRICS:
+        raise ValueError(f"不支持的相似度度量: {metric}，可选值为 {METRICS}")
+    if block_size <= 0:
+        raise ValueError("block_size必须为正整数")
+
+    if isinstance(corpus, NormalizedVectors):
+        if metric == "cosine":
+            # 语料已归一化：只需归一化少量查询向量，余弦相似度即为点积
+            queries = normalize_vectors(queries)
+            metric = "dot"
+        corpus = corpus.vectors
+
+    queries = as_float32_matrix(queries)
+    if corpus.ndim != 2 or corpus.shape[1] != queries.shape[1]:
+        raise ValueError("向量维度必须相同")
+
+    query_norms = row_norms(queries) if metric == "cosine" else None
+    for start in range(0, corpus.shape[0], block_size):
+        block = corpus[start:start + block_size]
+        yield start, score_block(queries, block, metric, query_norms)
+
+
+def _batch_scores(queries, corpus, metric: str, block_size: int) -> np.ndarray:
+    """按分块计算完整的 (q, n) 结果矩阵"""
+    if not isinstance(corpus, (np.ndarray, NormalizedVectors)):
+        corpus = as_float32_matrix(corpus)
+
+    n_queries = as_float32_matrix(queries).shape[0]
+    result = np.empty((n_queries, corpus.shape[0]), dtype=np.float32)
+    for start, scores in iter_similarity_blocks(queries, corpus, metric, block_size):
+        result[:, start:start + scores.shape[1]] = scores
+    return result
+
+
+def batch_cosine_similarity(queries, corpus,
+                            block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """
+    批量计算查询向量与语料矩阵之间的余弦相似度
+
+    结果与逐对调用 cosine_similarity 一致（float32精度内）。
+    corpus 为 NormalizedVectors 时跳过模长计算，直接计算点积
+
+    Args:
+        queries: 形状为 (q, dim) 的查询矩阵或单个查询向量
+        corpus: 形状为 (n, dim) 的语料矩阵
+        block_size: 每个分块包含的语料向量数
+
+    Returns:
+        np.ndarray: 形状为 (q, n) 的余弦相似度矩阵
+    """
+    return _batch_scores(queries, corpus, "cosine", block_size)
+
+
+def batch_dot_product(queries, corpus,
+                      block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """
+    批量计算查询向量与语料矩阵之间的点积
+
+    Args:
+        queries: 形状为 (q, dim) 的查询矩阵或单个查询向量
+        corpus: 形状为 (n, dim) 的语料矩阵
+        block_size: 每个分块包含的语料向量数
+
+    Returns:
+        np.ndarray: 形状为 (q, n) 的点积矩阵
+    """
+    return _batch_scores(queries, corpus, "dot", block_size)
+
+
+def batch_euclidean_distance(queries, corpus,
+                             block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """
+    批量计算查询向量与语料矩阵之间的欧几里得距离
+
+    Args:
+        queries: 形状为 (q, dim) 的查询矩阵或单个查询向量
+        corpus: 形状为 (n, dim) 的语料矩阵
+        block_size: 每个分块包含的语料向量数
+
+    Returns:
+        np.ndarray: 形状为 (q, n) 的欧几里得距离矩阵
+    """
+    return _batch_scores(queries, corpus, "euclidean", block_size)
+
+
 # 示例和测试代码
 if __name__ == "__main__":
     # 定义测试向量
@@ -178,4 +437,22 @@ if __name__ == "__main__":
     print("综合比较结果:")
     comparison = similarity_comparison(vector_a, vector_b)
     for key, value in comparison.items():
-        print(f"{key}: {value:.4f}")
\ No newline at end of file
+        print(f"{key}: {value:.4f}")
+    print()
+
+    # 批量计算：一次计算多个查询与整个语料之间的相似度
+    print("批量计算结果 (查询 A、B 对语料 A、B、C、D):")
+    corpus = [vector_a, vector_b, vector_c, vector_d]
+    queries = [vector_a, vector_b]
+    print("余弦相似度:")
+    print(np.round(batch_cosine_similarity(queries, corpus), 4))
+    print("点积:")
+    print(np.round(batch_dot_product(queries, corpus), 4))
+    print("欧几里得距离:")
+    print(np.round(batch_euclidean_distance(queries, corpus), 4))
+    print()
+
+    # 入库时一次性归一化，之后的余弦相似度计算直接使用点积
+    normalized_corpus = NormalizedVectors(corpus)
+    print("预归一化语料上的余弦相似度:")
+    print(np.round(batch_cosine_similarity(queries, normalized_corpus), 4))
\ No newline at end of file
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+精确Top-K向量检索
+基于内存映射的嵌入文件按分块流式计算相似度，无需将整个语料载入内存
+每个分块使用 argpartition 选出候选，再通过堆合并得到全局精确的Top-K结果
+"""
+
+import heapq
+import os
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from similarity_algorithms import (
+    DEFAULT_BLOCK_SIZE,
+    METRICS,
+    NormalizedVectors,
+    as_float32_matrix,
+    iter_similarity_blocks,
+)
+
+
+def load_embeddings(path: str, dim: int = None) -> np.ndarray:
+    """
+    以只读内存映射方式打开嵌入文件
+
+    支持两种格式:
+    - .npy 文件：形状和数据类型从文件头读取
+    - 原始float32二进制文件：按行连续存储，需要提供维度 dim
+
+    Args:
+        path: 嵌入文件路径
+        dim: 原始二进制文件的向量维度
+
+    Returns:
+        np.ndarray: 形状为 (n, dim) 的内存映射矩阵
+
+    Raises:
+        ValueError: 当文件格式或维度不合法时
+    """
+    if path.endswith(".npy"):
+        embeddings = np.load(path, mmap_mode="r")
+        if embeddings.ndim != 2:
+            raise ValueError(f"嵌入文件必须是二维矩阵: {path}")
+        return embeddings
+
+    if not dim or dim <= 0:
+        raise ValueError("读取原始float32文件时必须提供向量维度 dim")
+
+    itemsize = np.dtype(np.float32).itemsize
+    file_size = os.path.getsize(path)
+    if file_size % (dim * itemsize) != 0:
+        raise ValueError(f"文件大小 {file_size} 字节与维度 {dim} 不匹配: {path}")
+
+    n_vectors = file_size // (dim * itemsize)
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(n_vectors, dim))
+
+
+def merge_block_candidates(heaps: List[list], scores: np.ndarray, start: int,
+                           k: int, larger_is_better: bool):
+    """
+    从一个结果块中为每个查询挑选候选，并合并进对应的小顶堆
+
+    堆中元素为 (排序键, 文档编号)，排序键越大越好，
+    因此距离类度量使用负距离作为排序键
+    """
+    keys = scores if larger_is_better else -scores
+    block_len = keys.shape[1]
+
+    if block_len > k:
+        # 每行只保留排序键最大的k个候选，无需对整块排序
+        candidates = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(block_len), keys.shape)
+
+    for row, heap in enumerate(heaps):
+        row_keys = keys[row]
+        for col in candidates[row]:
+            item = (float(row_keys[col]), start + int(col))
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+
+def heaps_to_arrays(heaps: List[list], k: int,
+                    larger_is_better: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    将每个查询的候选堆整理为按相关性从高到低排列的结果数组
+
+    Args:
+        heaps: merge_block_candidates 维护的候选堆列表
+        k: 每个查询的结果数
+        larger_is_better: 得分是否越大越好
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (indices, scores)，形状均为 (q, k)
+    """
+    indices = np.empty((len(heaps), k), dtype=np.int64)
+    result_scores = np.empty((len(heaps), k), dtype=np.float32)
+    for row, heap in enumerate(heaps):
+        ranked = sorted(heap, key=lambda item: (-item[0], item[1]))
+        indices[row] = [index for _, index in ranked]
+        keys = [key for key, _ in ranked]
+        result_scores[row] = keys if larger_is_better else [-key for key in keys]
+    return indices, result_scores
+
+
+def top_k_search(queries, corpus: Union[str, np.ndarray, NormalizedVectors], k: int = 10,
+                 metric: str = "cosine", block_size: int = DEFAULT_BLOCK_SIZE,
+                 dim: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在语料中为每个查询执行精确的Top-K检索
+
+    Args:
+        queries: 形状为 (q, dim) 的查询矩阵或单个查询向量
+        corpus: 语料矩阵、NormalizedVectors，或 .npy / 原始float32 嵌入文件路径。
+            传入 NormalizedVectors 时余弦相似度直接按点积计算
+        k: 每个查询返回的结果数
+        metric: 相似度度量，取值为 "cosine"、"dot" 或 "euclidean"
+        block_size: 每个分块包含的语料向量数
+        dim: 语料为原始float32文件时的向量维度
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (indices, scores)，形状均为 (q, k')，
+        其中 k' = min(k, 语料大小)。按相关性从高到低排列，
+        euclidean 度量下 scores 为距离（从小到大）
+
+    Raises:
+        ValueError: 当参数不合法时
+    """
+    if metric not in METRICS:
+        raise ValueError(f"不支持的相似度度量: {metric}，可选值为 {METRICS}")
+    if k <= 0:
+        raise ValueError("k必须为正整数")
+
+    if isinstance(corpus, str):
+        corpus = load_embeddings(corpus, dim)
+    elif not isinstance(corpus, (np.ndarray, NormalizedVectors)):
+        corpus = as_float32_matrix(corpus)
+
+    queries = as_float32_matrix(queries)
+    larger_is_better = metric != "euclidean"
+    k = min(k, corpus.shape[0])
+
+    heaps = [[] for _ in range(queries.shape[0])]
+    for start, scores in iter_similarity_blocks(queries, corpus, metric, block_size):
+        merge_block_candidates(heaps, scores, start, k, larger_is_better)
+
+    return heaps_to_arrays(heaps, k, larger_is_better)
+
+
+# 示例和测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    rng = np.random.default_rng(42)
+    corpus_vectors = rng.standard_normal((10000, 64)).astype(np.float32)
+    query_vectors = corpus_vectors[:2] + 0.01 * rng.standard_normal((2, 64)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 将语料写入磁盘，检索时以内存映射方式流式读取
+        npy_path = os.path.join(tmp_dir, "embeddings.npy")
+        np.save(npy_path, corpus_vectors)
+
+        for metric_name in METRICS:
+            top_indices, top_scores = top_k_search(
+                query_vectors, npy_path, k=3, metric=metric_name, block_size=1024
+            )
+            print(f"{metric_name} Top-3:")
+            for query_id in range(len(query_vectors)):
+                pairs = ", ".join(
+                    f"{idx}({score:.4f})"
+                    for idx, score in zip(top_indices[query_id], top_scores[query_id])
+                )
+                print(f"  查询 {query_id}: {pairs}")
@@ -23,13 +23,15 @@ class MultimodalElement:
     content: Any
     metadata: Dict[str, Any]
     vector: List[float] = None
+    normalized: bool = False  # vector 是否已做L2归一化
     
     def to_dict(self):
         return {
             "element_type": self.element_type.value,
             "content": self.content,
             "metadata": self.metadata,
-            "vector": self.vector
+            "vector": self.vector,
+            "normalized": self.normalized
         }
 
 
@@ -163,11 +165,16 @@ class MultimodalIndex:
         """添加元素到索引"""
         # 为元素生成向量表示
         if isinstance(element.content, str):
-            element.vector = self._vectorizer.vectorize(element.content)
+            element.vector = self._vectorizer().vectorize(element.content)
         elif isinstance(element.content, dict):
             # 对于表格等结构化数据，先转换为文本再向量化
             content_str = json.dumps(element.content)
-            element.vector = self._vectorizer.vectorize(content_str)
+            element.vector = self._vectorizer().vectorize(content_str)
+        
+        # 入库时一次性归一化，查询时余弦相似度即为点积
+        if element.vector is not None:
+            element.vector = self._normalize(element.vector)
+            element.normalized = True
         
         self.elements.append(element)
     
@@ -178,17 +185,30 @@ class MultimodalIndex:
     def search(self, query: str, top_k: int = 3) -> List[MultimodalElement]:
         """基于向量相似度的搜索"""
         query_vector = self._vectorizer().vectorize(query)
+        normalized_query = self._normalize(query_vector)
         
         # 计算相似度（简化版余弦相似度）
         similarities = []
         for element in self.elements:
-            similarity = self._cosine_similarity(query_vector, element.vector)
+            if element.normalized:
+                # 两个向量都已归一化，跳过模长计算
+                similarity = sum(a * b for a, b in zip(normalized_query, element.vector))
+            else:
+                similarity = self._cosine_similarity(query_vector, element.vector)
             similarities.append((element, similarity))
         
         # 按相似度排序
         similarities.sort(key=lambda x: x[1], reverse=True)
         return [item[0] for item in similarities[:top_k]]
     
+    @staticmethod
+    def _normalize(vec: List[float]) -> List[float]:
+        """L2归一化，零向量保持不变"""
+        magnitude = sum(a * a for a in vec) ** 0.5
+        if magnitude == 0:
+            return list(vec)
+        return [a / magnitude for a in vec]
+    
     def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """计算余弦相似度"""
         dot_product = sum(a * b for a, b in zip(vec1, vec2))
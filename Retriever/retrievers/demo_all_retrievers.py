@@ -8,6 +8,7 @@ from vector_retriever.vector_retriever import VectorRetriever
 from vector_retriever.knn_retriever import KNNRetriever
 from hybrid_retriever.rrf_retriever import RRF_Retriever
 from hybrid_retriever.text_similarity_reranker import TextSimilarityReranker
+from text_analyzer import Analyzer
 
 
 def create_sample_documents():
@@ -133,9 +134,10 @@ def demonstrate_rrf_retriever(documents, query):
     print("2. 可以组合多个第一阶段检索器")
     print("-" * 60)
     
-    # 创建多个不同的检索器
-    standard_retriever = StandardRetriever(documents)
-    bm25_retriever = BM25Retriever(documents)
+    # 创建多个不同的检索器，共享同一个分析器以复用分词结果
+    analyzer = Analyzer(lowercase=True)
+    standard_retriever = StandardRetriever(documents, analyzer=analyzer)
+    bm25_retriever = BM25Retriever(documents, analyzer=analyzer)
     
     # 创建RRF检索器
     rrf_retriever = RRF_Retriever([standard_retriever, bm25_retriever])
@@ -0,0 +1,77 @@
+"""
+Aho-Corasick 多模式匹配
+功能：
+1. 由一组模式串构建匹配自动机，一次扫描文本即可找出所有模式的所有出现位置
+2. 按 str.count 的语义统计每个模式不重叠的出现次数
+
+扫描代价与文本长度和匹配次数成正比，与模式数量无关
+"""
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        """
+        构建匹配自动机
+        :param patterns: 模式串集合，空串和重复的模式会被忽略
+        """
+        self.patterns = [pattern for pattern in dict.fromkeys(patterns) if pattern]
+        self._goto = [{}]  # 每个状态的转移 {字符: 下一状态}
+        self._fail = [0]  # 失配时跳转的状态
+        self._output = [[]]  # 到达该状态时结束的模式编号（含失配链上的后缀模式）
+
+        # 构建字典树
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # 按层次遍历计算失配指针，并把后缀模式合并到输出中
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """
+        扫描文本
+        :param text: 文本
+        :return: 生成 (结束位置, 模式编号)，按结束位置升序
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                yield end, pattern_id
+
+    def count(self, text):
+        """
+        一次扫描统计每个模式不重叠的出现次数（与 str.count 一致）
+        :param text: 文本
+        :return: {模式串: 出现次数}，只包含出现过的模式
+        """
+        lengths = [len(pattern) for pattern in self.patterns]
+        last_end = [-1] * len(self.patterns)
+        counts = {}
+        for end, pattern_id in self.iter_matches(text):
+            # 同一模式的匹配按位置先后到达，贪心保留与上一次计数不重叠的匹配
+            if end - lengths[pattern_id] >= last_end[pattern_id]:
+                last_end[pattern_id] = end
+                pattern = self.patterns[pattern_id]
+                counts[pattern] = counts.get(pattern, 0) + 1
+        return counts
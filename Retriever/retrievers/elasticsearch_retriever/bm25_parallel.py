@@ -0,0 +1,212 @@
+"""
+并行分片构建BM25索引
+功能：
+1. 将文档按连续区间切分为多个分片，在进程池中并行分词并统计局部倒排表和文档频率
+2. 合并模式：按分片顺序拼接倒排表，得到与单进程构建完全一致的 BM25Retriever
+3. 分片模式：每个分片保留为独立的 BM25Retriever，共享全局文档频率和平均文档长度，
+   检索时分发到各分片再归并结果（scatter-gather），得分与合并后的单一索引一致
+
+分片是连续的文档区间，因此拼接后的倒排表仍按文档编号升序，合并时无需排序
+"""
+
+import heapq
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch_retriever.bm25_retriever import BM25Retriever
+from text_analyzer import Analyzer
+
+
+def _build_shard(task):
+    """
+    在子进程中构建一个分片的局部倒排表
+    :param task: (文档内容列表, 文本分析器)
+    :return: (倒排表 {词: [(分片内文档编号, 词频), ...]}, 每个文档的词数)
+    """
+    contents, analyzer = task
+    postings = {}
+    doc_lengths = []
+    for doc_id, content in enumerate(contents):
+        # 子进程中的分词结果不会再被复用，直接绕过缓存
+        words = analyzer._tokenize(content)
+        doc_lengths.append(len(words))
+        for word, tf in Counter(words).items():
+            postings.setdefault(word, []).append((doc_id, tf))
+    return postings, doc_lengths
+
+
+def _shard_bounds(n_docs, n_shards):
+    """将 [0, n_docs) 切分为至多 n_shards 个长度相近的连续区间"""
+    n_shards = max(1, min(n_shards, n_docs))
+    size, extra = divmod(n_docs, n_shards)
+    bounds = []
+    start = 0
+    for shard in range(n_shards):
+        end = start + size + (1 if shard < extra else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def build_shards(documents, analyzer=None, workers=None, n_shards=None):
+    """
+    并行构建各分片的局部倒排表
+    :param documents: 文档列表
+    :param analyzer: 文本分析器，默认按空白字符分词
+    :param workers: 进程数，默认为CPU核数；为1时在当前进程中串行构建
+    :param n_shards: 分片数，默认与进程数相同
+    :return: [(分片起始文档编号, 倒排表, 文档长度列表), ...]，按文档顺序排列
+    """
+    analyzer = analyzer or Analyzer()
+    workers = workers or os.cpu_count() or 1
+    bounds = _shard_bounds(len(documents), n_shards or workers)
+    tasks = [
+        ([doc.get('content', '') for doc in documents[start:end]], analyzer)
+        for start, end in bounds
+    ]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partials = list(executor.map(_build_shard, tasks))
+    else:
+        partials = [_build_shard(task) for task in tasks]
+
+    return [(start, postings, doc_lengths) for (start, _), (postings, doc_lengths) in zip(bounds, partials)]
+
+
+def build_bm25_parallel(documents, k1=1.5, b=0.75, compact_threshold=0.25, analyzer=None,
+                        workers=None, n_shards=None):
+    """
+    并行构建并合并为单一BM25索引，结果与 BM25Retriever(documents) 一致
+    :param documents: 文档集合
+    :param k1: 饱和参数
+    :param b: 长度归一化参数
+    :param compact_threshold: 已删除文档占比超过该值时自动压缩倒排索引
+    :param analyzer: 文本分析器，默认按空白字符分词
+    :param workers: 进程数，默认为CPU核数
+    :param n_shards: 分片数，默认与进程数相同
+    :return: BM25Retriever实例
+    """
+    documents = list(documents)
+    analyzer = analyzer or Analyzer()
+
+    postings = {}
+    doc_lengths = []
+    for offset, shard_postings, shard_lengths in build_shards(documents, analyzer, workers, n_shards):
+        # 分片按文档顺序合并，平移文档编号后直接追加即可保持升序
+        for word, word_postings in shard_postings.items():
+            if offset:
+                word_postings = [(doc_id + offset, tf) for doc_id, tf in word_postings]
+            merged = postings.get(word)
+            if merged is None:
+                postings[word] = word_postings
+            else:
+                merged.extend(word_postings)
+        doc_lengths.extend(shard_lengths)
+
+    return BM25Retriever.from_postings(documents, postings, doc_lengths, k1=k1, b=b,
+                                       compact_threshold=compact_threshold, analyzer=analyzer)
+
+
+class CollectionStats:
+    """多个分片共享的全局统计量：文档频率、有效文档数和总词数"""
+
+    def __init__(self, shards):
+        self.doc_freqs = {}
+        self.doc_count = 0
+        self.total_length = 0
+        for shard in shards:
+            for word, freq in shard.doc_freqs.items():
+                self.doc_freqs[word] = self.doc_freqs.get(word, 0) + freq
+            self.doc_count += shard.doc_count
+            self.total_length += shard.total_length
+
+
+class ShardedBM25Retriever:
+    def __init__(self, shards):
+        """
+        分片BM25检索器
+        各分片使用全局IDF和平均文档长度打分，因此不同分片的得分可以直接比较
+        直接修改某个分片后需要调用 refresh 重新汇总全局统计量
+        :param shards: BM25Retriever 列表，按文档顺序排列
+        """
+        self.shards = list(shards)
+        self.stats = None
+        self.refresh()
+
+    def refresh(self):
+        """重新汇总全局统计量并使各分片的IDF和长度归一化因子失效"""
+        self.stats = CollectionStats(self.shards)
+        for shard in self.shards:
+            shard.collection_stats = self.stats
+            shard._mark_changed()
+
+    @property
+    def documents(self):
+        """按分片顺序拼接的文档列表"""
+        return [doc for shard in self.shards for doc in shard.documents]
+
+    def search(self, query, top_k=10, use_wand=True):
+        """
+        分发到各分片检索后归并结果
+        每个分片最多返回top_k个结果，全局top_k一定在这些结果之中
+        :param query: 查询字符串
+        :param top_k: 返回结果数量
+        :param use_wand: 是否在分片内使用WAND剪枝
+        :return: 检索结果列表，格式与 BM25Retriever.search 相同
+        """
+        shard_results = [shard.search(query, top_k, use_wand) for shard in self.shards]
+        # heapq.merge 是稳定的：得分相同时靠前分片的文档排在前面，与单一索引的并列顺序一致
+        return list(islice(heapq.merge(*shard_results, key=lambda result: -result['score']), top_k))
+
+
+def build_sharded_bm25(documents, k1=1.5, b=0.75, compact_threshold=0.25, analyzer=None,
+                       workers=None, n_shards=None):
+    """
+    并行构建分片索引，各分片保持独立，用于scatter-gather检索
+    参数含义与 build_bm25_parallel 相同
+    :return: ShardedBM25Retriever实例
+    """
+    documents = list(documents)
+    analyzer = analyzer or Analyzer()
+    shards = []
+    for offset, shard_postings, shard_lengths in build_shards(documents, analyzer, workers, n_shards):
+        shard_documents = documents[offset:offset + len(shard_lengths)]
+        shards.append(BM25Retriever.from_postings(shard_documents, shard_postings, shard_lengths, k1=k1, b=b,
+                                                  compact_threshold=compact_threshold, analyzer=analyzer))
+    return ShardedBM25Retriever(shards)
+
+
+# 示例使用
+if __name__ == "__main__":
+    import random
+    import time
+
+    random.seed(0)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    corpus = [
+        {"id": i, "content": " ".join(random.choices(vocabulary, k=80))}
+        for i in range(50000)
+    ]
+
+    started = time.perf_counter()
+    single = BM25Retriever(corpus)
+    print(f"单进程构建: {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    merged = build_bm25_parallel(corpus)
+    print(f"并行构建（合并）: {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    sharded = build_sharded_bm25(corpus)
+    print(f"并行构建（分片）: {time.perf_counter() - started:.2f}s，分片数 {len(sharded.shards)}")
+
+    query = "term1 term42 term4200"
+    for name, retriever in (("单进程", single), ("合并", merged), ("分片", sharded)):
+        ids = [result['document']['id'] for result in retriever.search(query, top_k=5)]
+        print(f"{name} Top-5: {ids}")
@@ -5,45 +5,347 @@ BM25 Retriever（BM25检索器）示例脚本
 2. 适合关键词丰富的查询
 """
 
+import bisect
+import heapq
 import math
+import os
+import sys
 from collections import Counter
 import re
 
+import numpy as np
+from scipy import sparse
+
+# 添加检索器根目录到Python路径中
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch_retriever.bm25_storage import read_index, write_index
+from elasticsearch_retriever.positional_index import PositionalIndex
+from text_analyzer import Analyzer
+
 
 class BM25Retriever:
-    def __init__(self, documents=None, k1=1.5, b=0.75):
+    def __init__(self, documents=None, k1=1.5, b=0.75, compact_threshold=0.25, analyzer=None, workers=None,
+                 positions=False):
         """
         初始化BM25检索器
         :param documents: 文档集合
         :param k1: 饱和参数，控制词频饱和度
         :param b: 长度归一化参数
+        :param compact_threshold: 已删除文档占比超过该值时自动压缩倒排索引
+        :param analyzer: 文本分析器，默认按空白字符分词；可与其他检索器共享以复用分词缓存
+        :param workers: 建索引时批量分词使用的进程数，为None时串行分词
+        :param positions: 是否记录词位置，开启后支持短语检索和邻近度加权
         """
-        self.documents = documents or []
+        self.documents = list(documents) if documents else []
+        self.analyzer = analyzer or Analyzer()
+        self.workers = workers
         self.k1 = k1
         self.b = b
+        self.compact_threshold = compact_threshold
         self.avgdl = 0  # 平均文档长度
-        self.idf = {}   # 逆文档频率
-        self.doc_freqs = []  # 文档频率
+        self.idf = {}   # 逆文档频率，增量更新后按需重新计算
+        self.doc_freqs = {}  # 文档频率 {词: 包含该词的有效文档数}
+        self.postings = {}  # 倒排索引 {词: [(文档编号, 词频), ...]}，按文档编号升序
+        self.doc_lengths = []  # 每个文档的词数
+        self.length_norms = []  # 每个文档预先计算的长度归一化因子 k1 * (1 - b + b * dl / avgdl)
+        self.deleted = set()  # 已删除但尚未压缩的文档编号（墓碑）
+        self.doc_count = 0  # 有效文档数
+        self.total_length = 0  # 有效文档总词数
+        self._slots = {}  # {文档id: 文档编号}
+        self._norms_dirty = False  # avgdl 变化后长度归一化因子需要重新计算
+        self._term_ids = {}  # 批量打分矩阵的列编号 {词: 列号}
+        self._term_doc_weights = None  # 批量打分用的 词×文档 BM25权重CSR矩阵，按需构建
+        self._upper_bounds = {}  # WAND剪枝用的 {词: 单个文档得分贡献的上界}
+        self._posting_docs = {}  # WAND跳转用的 {词: 倒排表中的文档编号列表}，按需构建
+        self.collection_stats = None  # 分片检索时共享的全局统计量，为None时使用本索引自身的统计量
+        self.positional = PositionalIndex() if positions else None  # 位置索引，仅在开启positions时构建
         self.initialize()
     
     def initialize(self):
-        """初始化参数"""
-        # 计算平均文档长度
-        total_length = sum(len(doc.get('content', '').split()) for doc in self.documents)
-        self.avgdl = total_length / len(self.documents) if self.documents else 0
-        
-        # 计算文档频率
-        df = {}
-        for doc in self.documents:
-            content = doc.get('content', '')
-            words = set(content.split())
-            for word in words:
-                df[word] = df.get(word, 0) + 1
+        """构建倒排索引并初始化参数"""
+        if not isinstance(self.documents, list):
+            self.documents = list(self.documents)
+        if self.deleted:
+            self.documents = [doc for doc_id, doc in enumerate(self.documents) if doc_id not in self.deleted]
+        self.postings = {}
+        self._posting_docs = {}
+        self.doc_freqs = {}
+        self.doc_lengths = []
+        self.deleted = set()
+        self._slots = {}
+        self.total_length = 0
+        if self.positional is not None:
+            self.positional = PositionalIndex()
+        
+        # 批量分词后一次遍历语料：统计词频并写入倒排表
+        contents = [doc.get('content', '') for doc in self.documents]
+        for doc_id, (doc, words) in enumerate(zip(self.documents, self.analyzer.analyze_many(contents, self.workers))):
+            self._index_document(doc_id, doc, words)
+        self.doc_count = len(self.documents)
         
         # 计算IDF值
-        N = len(self.documents)
-        for word, freq in df.items():
-            self.idf[word] = math.log((N - freq + 0.5) / (freq + 0.5) + 1)
+        self.idf = {}
+        for word in self.postings:
+            self._idf(word)
+        
+        self._refresh_stats()
+    
+    @classmethod
+    def from_postings(cls, documents, postings, doc_lengths, k1=1.5, b=0.75, compact_threshold=0.25, analyzer=None):
+        """
+        由预先构建好的倒排表创建检索器（例如并行分片构建的结果），不重新分词
+        :param documents: 文档列表，与倒排表中的文档编号一一对应
+        :param postings: 倒排索引 {词: [(文档编号, 词频), ...]}，按文档编号升序
+        :param doc_lengths: 每个文档的词数
+        :param analyzer: 构建倒排表时使用的文本分析器，查询时需要保持一致
+        :return: BM25Retriever实例
+        """
+        retriever = cls(k1=k1, b=b, compact_threshold=compact_threshold, analyzer=analyzer)
+        retriever.documents = list(documents)
+        retriever.postings = postings
+        retriever.doc_freqs = {word: len(word_postings) for word, word_postings in postings.items()}
+        retriever.doc_lengths = list(doc_lengths)
+        retriever.doc_count = len(retriever.documents)
+        retriever.total_length = sum(retriever.doc_lengths)
+        retriever._slots = {doc['id']: doc_id for doc_id, doc in enumerate(retriever.documents) if 'id' in doc}
+        retriever._refresh_stats()
+        return retriever
+    
+    def _tokenize(self, text):
+        """分词（结果由分析器缓存）"""
+        return self.analyzer.analyze(text)
+    
+    def _index_document(self, doc_id, doc, words=None):
+        """将文档写入倒排表，并更新文档频率和长度统计"""
+        if words is None:
+            words = self._tokenize(doc.get('content', ''))
+        self.doc_lengths.append(len(words))
+        self.total_length += len(words)
+        for word, tf in Counter(words).items():
+            self.postings.setdefault(word, []).append((doc_id, tf))
+            self.doc_freqs[word] = self.doc_freqs.get(word, 0) + 1
+        if self.positional is not None:
+            self.positional.add(doc_id, words)
+        if 'id' in doc:
+            self._slots[doc['id']] = doc_id
+    
+    def _idf(self, word):
+        """获取词的IDF值，不在有效文档中出现的词返回None"""
+        idf = self.idf.get(word)
+        if idf is None:
+            freq = self.doc_freqs.get(word)
+            if not freq:
+                return None
+            N = self.doc_count
+            if self.collection_stats is not None:
+                freq = self.collection_stats.doc_freqs.get(word, freq)
+                N = self.collection_stats.doc_count
+            idf = self.idf[word] = math.log((N - freq + 0.5) / (freq + 0.5) + 1)
+        return idf
+    
+    def _avgdl(self):
+        """平均文档长度，分片检索时使用全局统计量"""
+        stats = self if self.collection_stats is None else self.collection_stats
+        return stats.total_length / stats.doc_count if stats.doc_count else 0
+    
+    def _refresh_stats(self):
+        """重新计算平均文档长度和长度归一化因子"""
+        self.avgdl = self._avgdl()
+        # 预先计算长度归一化因子，查询时无需再访问文档长度
+        self.length_norms = [
+            self.k1 * (1 - self.b + self.b * doc_len / self.avgdl) if self.avgdl else self.k1
+            for doc_len in self.doc_lengths
+        ]
+        self._norms_dirty = False
+        self._term_doc_weights = None
+        self._upper_bounds = {}
+    
+    def _mark_changed(self):
+        """文档集合变化后，使依赖文档总数和平均长度的统计量失效"""
+        self._term_doc_weights = None
+        self._upper_bounds = {}
+        self.idf = {}
+        self.avgdl = self._avgdl()
+        self._norms_dirty = True
+    
+    def add_documents(self, documents):
+        """
+        增量添加文档，只处理新文档，不重建已有索引
+        已存在相同id的文档会被替换
+        :param documents: 待添加的文档列表
+        """
+        self._ensure_mutable()
+        for doc in documents:
+            if 'id' in doc and doc['id'] in self._slots:
+                self._remove(self._slots[doc['id']])
+            doc_id = len(self.documents)
+            self.documents.append(doc)
+            self._index_document(doc_id, doc)
+            self.doc_count += 1
+        self._mark_changed()
+        self._maybe_compact()
+    
+    def update_document(self, doc_id, document):
+        """
+        更新文档：旧版本标记为删除，新版本追加到索引末尾
+        :param doc_id: 文档id
+        :param document: 新的文档内容
+        """
+        self._ensure_mutable()
+        if doc_id not in self._slots:
+            raise KeyError(f"文档不存在: {doc_id}")
+        self._remove(self._slots[doc_id])
+        document = dict(document, id=doc_id)
+        slot = len(self.documents)
+        self.documents.append(document)
+        self._index_document(slot, document)
+        self.doc_count += 1
+        self._mark_changed()
+        self._maybe_compact()
+    
+    def delete_document(self, doc_id):
+        """
+        删除文档：只打墓碑并更新统计量，倒排表在压缩时才真正清理
+        :param doc_id: 文档id
+        """
+        self._ensure_mutable()
+        if doc_id not in self._slots:
+            raise KeyError(f"文档不存在: {doc_id}")
+        self._remove(self._slots[doc_id])
+        self._mark_changed()
+        self._maybe_compact()
+    
+    def _remove(self, slot):
+        """将文档编号标记为删除，并扣减其对文档频率和总长度的贡献"""
+        doc = self.documents[slot]
+        words = self._tokenize(doc.get('content', ''))
+        if self.positional is not None:
+            self.positional.remove(slot, words)
+        for word in set(words):
+            freq = self.doc_freqs[word] - 1
+            if freq:
+                self.doc_freqs[word] = freq
+            else:
+                del self.doc_freqs[word]
+        self.total_length -= self.doc_lengths[slot]
+        self.doc_count -= 1
+        self.deleted.add(slot)
+        if 'id' in doc:
+            self._slots.pop(doc['id'], None)
+    
+    def _maybe_compact(self):
+        """墓碑占比超过阈值时压缩索引"""
+        if self.documents and len(self.deleted) > self.compact_threshold * len(self.documents):
+            self.compact()
+    
+    def compact(self):
+        """
+        压缩索引：移除已删除文档的倒排记录并重新连续编号
+        只重写倒排表，不需要重新分词
+        """
+        if not self.deleted:
+            return
+        self._ensure_mutable()
+        
+        remap = {}
+        documents = []
+        doc_lengths = []
+        for old_id, doc in enumerate(self.documents):
+            if old_id in self.deleted:
+                continue
+            remap[old_id] = len(documents)
+            documents.append(doc)
+            doc_lengths.append(self.doc_lengths[old_id])
+        
+        postings = {}
+        for word, word_postings in self.postings.items():
+            kept = [(remap[doc_id], tf) for doc_id, tf in word_postings if doc_id in remap]
+            if kept:
+                postings[word] = kept
+        
+        self.documents = documents
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self._posting_docs = {}
+        if self.positional is not None:
+            self.positional.remap(remap)
+        self._slots = {doc['id']: doc_id for doc_id, doc in enumerate(documents) if 'id' in doc}
+        self.deleted = set()
+        self._refresh_stats()
+    
+    def _ensure_mutable(self):
+        """从磁盘加载的只读（内存映射）索引在首次修改前转换为内存中的可变结构"""
+        if isinstance(self.postings, dict):
+            return
+        self.documents = list(self.documents)
+        self.postings = {word: list(postings) for word, postings in self.postings.items()}
+        self.doc_freqs = dict(self.doc_freqs.items())
+        self.doc_lengths = [int(doc_len) for doc_len in self.doc_lengths]
+        self.length_norms = [float(norm) for norm in self.length_norms]
+        self._slots = {doc['id']: doc_id for doc_id, doc in enumerate(self.documents) if 'id' in doc}
+        self._posting_docs = {}
+    
+    def save(self, path):
+        """
+        将索引保存到目录，之后可通过 load 以内存映射方式快速加载
+        保存前会先压缩索引以清除已删除的文档；文档需要可以序列化为JSON
+        开启 positions 时位置索引写入 positions 子目录，加载时同样内存映射
+        :param path: 目标目录
+        """
+        self.compact()
+        if self._norms_dirty:
+            self._refresh_stats()
+        meta = {
+            'k1': self.k1,
+            'b': self.b,
+            'doc_count': self.doc_count,
+            'total_length': self.total_length,
+            # 查询时必须使用与建索引时相同的分词配置
+            'analyzer': {
+                'tokenizer': self.analyzer.tokenizer,
+                'lowercase': self.analyzer.lowercase,
+                'stopwords': sorted(self.analyzer.stopwords),
+            },
+            'positions': self.positional is not None,
+        }
+        write_index(path, meta, self.postings, self.doc_freqs, self.doc_lengths,
+                    self.length_norms, self.documents)
+        if self.positional is not None:
+            self.positional.save(os.path.join(path, 'positions'))
+    
+    @classmethod
+    def load(cls, path, compact_threshold=0.25):
+        """
+        以内存映射方式加载 save 保存的索引，不需要重新分词
+        倒排表和位置索引在查询用到时才解码；首次增删改文档时才会把索引完整读入内存。
+        没有 positions 子目录的旧索引在加载时重新分词构建位置索引，耗时与语料规模成正比
+        :param path: 索引目录
+        :param compact_threshold: 已删除文档占比超过该值时自动压缩倒排索引
+        :return: BM25Retriever实例
+        """
+        data = read_index(path)
+        meta = data['meta']
+        analyzer = Analyzer(**meta['analyzer']) if 'analyzer' in meta else None
+        retriever = cls(k1=meta['k1'], b=meta['b'], compact_threshold=compact_threshold, analyzer=analyzer)
+        retriever.documents = data['documents']
+        retriever.postings = data['postings']
+        retriever.doc_freqs = data['doc_freqs']
+        retriever.doc_lengths = data['doc_lengths']
+        retriever.length_norms = data['length_norms']
+        retriever.doc_count = meta['doc_count']
+        retriever.total_length = meta['total_length']
+        retriever.avgdl = retriever.total_length / retriever.doc_count if retriever.doc_count else 0
+        retriever._slots = {}
+        positions_path = os.path.join(path, 'positions')
+        if meta.get('positions') and os.path.isdir(positions_path):
+            retriever.positional = PositionalIndex.load(positions_path)
+        elif meta.get('positions'):
+            retriever.positional = PositionalIndex()
+            contents = [doc.get('content', '') for doc in retriever.documents]
+            for doc_id, words in enumerate(retriever.analyzer.analyze_many(contents)):
+                retriever.positional.add(doc_id, words)
+        return retriever
     
     def bm25_score(self, query, document):
         """
@@ -53,7 +355,7 @@ class BM25Retriever:
         :return: BM25得分
         """
         content = document.get('content', '')
-        words = content.split()
+        words = self._tokenize(content)
         doc_len = len(words)
         
         # 计算词频
@@ -61,9 +363,9 @@ class BM25Retriever:
         
         # 计算BM25得分
         score = 0.0
-        for word in query.split():
+        for word in self._tokenize(query):
             if word in tf:
-                idf = self.idf.get(word, 0)
+                idf = self._idf(word) or 0
                 tf_score = tf[word]
                 numerator = tf_score * (self.k1 + 1)
                 denominator = tf_score + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
@@ -71,26 +373,307 @@ class BM25Retriever:
         
         return score
     
-    def search(self, query, top_k=10):
+    def _term_score(self, idf, tf_score, doc_id):
+        """单个词对文档的BM25得分贡献"""
+        numerator = tf_score * (self.k1 + 1)
+        denominator = tf_score + self.length_norms[doc_id]
+        return idf * numerator / denominator
+    
+    def _upper_bound(self, word, idf):
+        """词在任意文档上得分贡献的上界，按词缓存"""
+        bound = self._upper_bounds.get(word)
+        if bound is None:
+            bound = max(self._term_score(idf, tf_score, doc_id) for doc_id, tf_score in self.postings[word])
+            # 留出少量余量，保证浮点累加顺序不同也不会错误剪枝
+            bound = self._upper_bounds[word] = bound * (1 + 1e-9)
+        return bound
+    
+    def _doc_ids(self, word):
+        """词的倒排表中的文档编号列表，用于二分跳转；倒排表追加后自动重建"""
+        doc_ids = self._posting_docs.get(word)
+        if doc_ids is None or len(doc_ids) != len(self.postings[word]):
+            doc_ids = self._posting_docs[word] = [doc_id for doc_id, _ in self.postings[word]]
+        return doc_ids
+    
+    def search(self, query, top_k=10, use_wand=True, proximity_boost=0.0, window=None, rerank_depth=None):
         """
         执行BM25检索
+        只遍历查询词对应的倒排表；默认使用WAND动态剪枝，
+        跳过不可能进入top_k的文档，返回结果与穷举打分完全一致
         :param query: 查询字符串
         :param top_k: 返回结果数量
+        :param use_wand: 是否使用WAND剪枝，为False时对所有命中文档打分
+        :param proximity_boost: 邻近度加权系数，查询词在文档中相邻出现时得分乘以 (1 + proximity_boost)，
+            需要开启 positions；为0时不加权
+        :param window: 参与加权的最大窗口词数，为None时不限制
+        :param rerank_depth: 按BM25得分取出后再做邻近度加权的候选数，默认为 4 * top_k
         :return: 检索结果列表
         """
-        results = []
+        if self._norms_dirty:
+            self._refresh_stats()
+        
+        words = self._tokenize(query)
+        depth = top_k
+        if proximity_boost and top_k > 0:
+            self._require_positions()
+            depth = max(rerank_depth or 4 * top_k, top_k)
+        
+        if use_wand and depth > 0:
+            top_docs = self._search_wand(words, depth)
+        else:
+            top_docs = self._search_exhaustive(words, depth)
+        
+        if proximity_boost and top_k > 0:
+            top_docs = self._proximity_rerank(words, top_docs, top_k, proximity_boost, window)
+        
+        return [
+            {
+                'document': self.documents[doc_id],
+                'score': score
+            }
+            for doc_id, score in top_docs
+            if score > 0
+        ]
+    
+    def _require_positions(self):
+        """短语检索和邻近度加权依赖位置索引"""
+        if self.positional is None:
+            raise ValueError("短语检索和邻近度加权需要在构建索引时开启 positions=True")
+    
+    def _proximity_rerank(self, words, top_docs, top_k, proximity_boost, window):
+        """
+        对BM25候选按查询词的邻近程度加权后重新排序
+        命中m个不同查询词、最小覆盖窗口为w个词的文档，得分乘以 1 + proximity_boost * (m - 1) / (w - 1)，
+        查询词紧密相邻时加权最大
+        """
+        reranked = []
+        for doc_id, score in top_docs:
+            matched, span = self.positional.min_window(words, doc_id)
+            if span is not None and (window is None or span <= window):
+                score *= 1 + proximity_boost * (matched - 1) / (span - 1)
+            reranked.append((doc_id, score))
+        reranked.sort(key=lambda item: (-item[1], item[0]))
+        return reranked[:top_k]
+    
+    def phrase_search(self, phrase, top_k=10):
+        """
+        精确短语检索：只返回短语中的词按顺序相邻出现的文档，按BM25得分排序
+        先用倒排表求出包含全部短语词的候选文档，只对候选解码位置
+        :param phrase: 短语
+        :param top_k: 返回结果数量
+        :return: 检索结果列表，每项额外包含短语出现次数 'phrase_count'
+        """
+        self._require_positions()
+        if self._norms_dirty:
+            self._refresh_stats()
+        
+        words = self._tokenize(phrase)
+        matches = []
+        for doc_id in self.positional.candidates(words):
+            count = self.positional.phrase_count(words, doc_id)
+            if not count:
+                continue
+            score = 0.0
+            for word in words:
+                tf_score = len(self.positional.get(word, doc_id))
+                score += self._term_score(self._idf(word), tf_score, doc_id)
+            matches.append((doc_id, score, count))
+        
+        # 得分相同时按文档原始顺序排列
+        top_docs = heapq.nlargest(top_k, matches, key=lambda item: (item[1], -item[0]))
+        return [
+            {
+                'document': self.documents[doc_id],
+                'score': score,
+                'phrase_count': count
+            }
+            for doc_id, score, count in top_docs
+        ]
+    
+    def _search_exhaustive(self, words, top_k):
+        """对所有包含查询词的文档打分，返回 [(文档编号, 得分), ...]"""
+        scores = {}
+        deleted = self.deleted
+        
+        # 按查询词顺序累加得分（重复的查询词重复累加，与 bm25_score 一致）
+        for word in words:
+            idf = self._idf(word)
+            if idf is None:
+                continue
+            for doc_id, tf_score in self.postings[word]:
+                if deleted and doc_id in deleted:
+                    continue
+                scores[doc_id] = scores.get(doc_id, 0.0) + self._term_score(idf, tf_score, doc_id)
+        
+        # 得分相同时按文档原始顺序排列
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+    
+    def _search_wand(self, words, top_k):
+        """
+        WAND（Weak AND）动态剪枝检索，返回 [(文档编号, 得分), ...]
+        
+        每个查询词维护一个指向倒排表的游标。按游标当前文档编号排序后，
+        累加各词得分上界直到超过当前第top_k名的得分（阈值），该位置的文档即为枢轴：
+        编号小于枢轴的文档最多只包含前面这些词，得分不可能超过阈值，可以直接跳过。
+        由于文档按编号递增处理，得分等于阈值的文档在并列时也不可能胜出，
+        因此结果（包括并列顺序）与穷举打分一致
+        """
+        query_tf = Counter(words)
+        cursors = []  # [当前文档编号, 游标位置, 词, idf, 上界, 文档编号列表]
+        for word, qtf in query_tf.items():
+            idf = self._idf(word)
+            if idf is None:
+                continue
+            doc_ids = self._doc_ids(word)
+            cursors.append([doc_ids[0], 0, word, idf, qtf * self._upper_bound(word, idf), doc_ids])
+        
+        exhausted = len(self.documents)
+        heap = []  # 小顶堆 [(得分, -文档编号)]，保存当前top_k
+        deleted = self.deleted
+        
+        while True:
+            cursors.sort(key=lambda cursor: cursor[0])
+            threshold = heap[0][0] if len(heap) >= top_k else 0.0
+            
+            # 寻找枢轴：累加上界首次超过阈值的位置
+            accumulated = 0.0
+            pivot = None
+            for i, cursor in enumerate(cursors):
+                if cursor[0] >= exhausted:
+                    break
+                accumulated += cursor[4]
+                if accumulated > threshold:
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            
+            pivot_doc = cursors[pivot][0]
+            if cursors[0][0] == pivot_doc:
+                # 所有游标都已对齐到枢轴文档，计算完整得分
+                if not (deleted and pivot_doc in deleted):
+                    matched = {}
+                    for cursor in cursors:
+                        if cursor[0] != pivot_doc:
+                            break
+                        matched[cursor[2]] = self.postings[cursor[2]][cursor[1]][1]
+                    score = 0.0
+                    for word in words:
+                        if word in matched:
+                            score += self._term_score(self._idf(word), matched[word], pivot_doc)
+                    if score > threshold:
+                        item = (score, -pivot_doc)
+                        if len(heap) < top_k:
+                            heapq.heappush(heap, item)
+                        else:
+                            heapq.heapreplace(heap, item)
+                target = pivot_doc + 1
+                advance = [cursor for cursor in cursors if cursor[0] == pivot_doc]
+            else:
+                # 枢轴之前的文档不可能进入top_k，直接把前面的游标跳到枢轴文档
+                target = pivot_doc
+                advance = cursors[:pivot]
+            
+            for cursor in advance:
+                if cursor[0] >= target:
+                    continue
+                # 多数情况下目标就是下一条倒排记录，否则二分跳转
+                doc_ids = cursor[5]
+                position = cursor[1] + 1
+                if position < len(doc_ids) and doc_ids[position] < target:
+                    position = bisect.bisect_left(doc_ids, target, position)
+                cursor[1] = position
+                cursor[0] = doc_ids[position] if position < len(doc_ids) else exhausted
+        
+        return [(-neg_doc_id, score) for score, neg_doc_id in sorted(heap, reverse=True)]
+    
+    def _build_weight_matrix(self):
+        """
+        预先计算每个(词, 文档)对的BM25得分贡献 idf * tf * (k1 + 1) / (tf + norm)
+        以 词×文档 的CSR矩阵存储（即 文档×词 矩阵的转置），
+        使得 查询矩阵 @ 权重矩阵 是CSR与CSR的乘积，无需每次转换格式
+        """
+        if self._norms_dirty:
+            self._refresh_stats()
+        
+        self._term_ids = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for word, postings in self.postings.items():
+            idf = self._idf(word)
+            if idf is None:
+                continue
+            self._term_ids[word] = len(self._term_ids)
+            for doc_id, tf_score in postings:
+                if doc_id in self.deleted:
+                    continue
+                indices.append(doc_id)
+                data.append(self._term_score(idf, tf_score, doc_id))
+            indptr.append(len(indices))
+        
+        self._term_doc_weights = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(self._term_ids), len(self.documents))
+        )
+    
+    def search_batch(self, queries, top_k=10, batch_size=1024):
+        """
+        批量执行BM25检索
+        把一批查询表示为稀疏的 查询×词 计数矩阵，与预计算的权重矩阵做一次稀疏矩阵乘法，
+        再对每行用 argpartition 选出top_k
+        :param queries: 查询字符串列表
+        :param top_k: 每个查询返回的结果数量
+        :param batch_size: 每次矩阵乘法处理的查询数，控制结果矩阵的内存占用
+        :return: 与 queries 一一对应的检索结果列表，每项格式与 search 相同
+        """
+        if self._term_doc_weights is None:
+            self._build_weight_matrix()
+        
+        all_results = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            
+            # 构建 查询×词 计数矩阵（重复的查询词计数累加）
+            rows, cols = [], []
+            for row, query in enumerate(batch):
+                for word in self._tokenize(query):
+                    col = self._term_ids.get(word)
+                    if col is not None:
+                        rows.append(row)
+                        cols.append(col)
+            query_matrix = sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, cols)),
+                shape=(len(batch), len(self._term_ids))
+            )
+            
+            scores = query_matrix @ self._term_doc_weights
+            for row in range(len(batch)):
+                all_results.append(self._top_k_from_row(scores, row, top_k))
+        
+        return all_results
+    
+    def _top_k_from_row(self, scores, row, top_k):
+        """从CSR得分矩阵的一行中取出top_k个文档"""
+        row_start, row_end = scores.indptr[row], scores.indptr[row + 1]
+        row_scores = scores.data[row_start:row_end]
+        row_docs = scores.indices[row_start:row_end]
         
-        for doc in self.documents:
-            score = self.bm25_score(query, doc)
-            if score > 0:
-                results.append({
-                    'document': doc,
-                    'score': score
-                })
+        if len(row_scores) > top_k:
+            selected = np.argpartition(-row_scores, top_k - 1)[:top_k]
+            row_scores = row_scores[selected]
+            row_docs = row_docs[selected]
         
-        # 按得分排序并返回前top_k个结果
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+        # 得分相同时按文档原始顺序排列
+        order = np.lexsort((row_docs, -row_scores))
+        return [
+            {
+                'document': self.documents[row_docs[i]],
+                'score': float(row_scores[i])
+            }
+            for i in order
+            if row_scores[i] > 0
+        ]
 
 
 # 示例使用
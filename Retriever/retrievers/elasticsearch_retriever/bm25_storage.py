@@ -0,0 +1,302 @@
+"""
+BM25索引的磁盘存储格式
+功能：
+1. 将BM25倒排索引写成紧凑的磁盘格式（词典 + 差分varint编码倒排表 + 文档长度数组）
+2. 以内存映射方式加载，进程重启时无需重新分词，多个进程可共享页缓存
+
+目录结构：
+    meta.json              参数和统计量（k1、b、文档数、总词数）
+    terms.bin              按字节序排序的词（UTF-8）首尾相接
+    term_offsets.npy       每个词在 terms.bin 中的起始偏移，长度为词数+1
+    doc_freqs.npy          每个词的文档频率
+    postings.bin           每个词的倒排表：[文档编号差分, 词频, ...] 的varint编码
+    posting_offsets.npy    每个词的倒排表在 postings.bin 中的起始偏移，长度为词数+1
+    doc_lengths.npy        每个文档的词数
+    length_norms.npy       每个文档的长度归一化因子
+    documents.jsonl        每行一个JSON文档
+    document_offsets.npy   每个文档在 documents.jsonl 中的起始偏移，长度为文档数+1
+    positions/             开启位置索引时写入，布局见 positional_index.PositionalIndex.save
+"""
+
+import json
+import mmap
+import os
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+
+
+def encode_varints(values, out):
+    """
+    将非负整数序列以varint格式追加到bytearray中（每字节7位有效数据，最高位为续位标记）
+    :param values: 非负整数序列
+    :param out: 输出的bytearray
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varints(data):
+    """
+    解码varint格式的字节串
+    :param data: 字节串
+    :return: 整数列表
+    """
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+def encode_postings(postings):
+    """
+    编码一个词的倒排表，文档编号做差分后与词频交替写入
+    :param postings: [(文档编号, 词频), ...]，按文档编号升序
+    :return: 编码后的字节串
+    """
+    out = bytearray()
+    previous = 0
+    values = []
+    for doc_id, tf in postings:
+        values.append(doc_id - previous)
+        values.append(tf)
+        previous = doc_id
+    encode_varints(values, out)
+    return bytes(out)
+
+
+def decode_postings(data):
+    """
+    解码一个词的倒排表
+    :param data: encode_postings 生成的字节串
+    :return: [(文档编号, 词频), ...]
+    """
+    values = decode_varints(data)
+    postings = []
+    doc_id = 0
+    for i in range(0, len(values), 2):
+        doc_id += values[i]
+        postings.append((doc_id, values[i + 1]))
+    return postings
+
+
+def _map_file(path):
+    """以只读方式内存映射文件，空文件返回空字节串"""
+    if os.path.getsize(path) == 0:
+        return b''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_terms(path, terms):
+    """
+    写入有序词典（terms.bin 和 term_offsets.npy），供 MappedTermDictionary 加载
+    :param path: 目标目录
+    :param terms: 按UTF-8字节序排序的词列表
+    """
+    term_offsets = [0]
+    with open(os.path.join(path, 'terms.bin'), 'wb') as term_file:
+        for word in terms:
+            encoded_term = word.encode('utf-8')
+            term_file.write(encoded_term)
+            term_offsets.append(term_offsets[-1] + len(encoded_term))
+    np.save(os.path.join(path, 'term_offsets.npy'), np.array(term_offsets, dtype=np.uint64))
+
+
+def write_index(path, meta, postings, doc_freqs, doc_lengths, length_norms, documents):
+    """
+    将索引写入目录
+    :param path: 目标目录，不存在时自动创建
+    :param meta: 参数和统计量字典
+    :param postings: {词: [(文档编号, 词频), ...]}
+    :param doc_freqs: {词: 文档频率}
+    :param doc_lengths: 每个文档的词数
+    :param length_norms: 每个文档的长度归一化因子
+    :param documents: 文档列表，需要可以序列化为JSON
+    """
+    os.makedirs(path, exist_ok=True)
+
+    # 词典按UTF-8字节序排序，加载后可直接在内存映射上二分查找
+    terms = sorted(postings, key=lambda word: word.encode('utf-8'))
+    write_terms(path, terms)
+    posting_offsets = [0]
+    with open(os.path.join(path, 'postings.bin'), 'wb') as posting_file:
+        for word in terms:
+            encoded_postings = encode_postings(postings[word])
+            posting_file.write(encoded_postings)
+            posting_offsets.append(posting_offsets[-1] + len(encoded_postings))
+
+    document_offsets = [0]
+    with open(os.path.join(path, 'documents.jsonl'), 'wb') as doc_file:
+        for doc in documents:
+            line = (json.dumps(doc, ensure_ascii=False) + '\n').encode('utf-8')
+            doc_file.write(line)
+            document_offsets.append(document_offsets[-1] + len(line))
+
+    np.save(os.path.join(path, 'posting_offsets.npy'), np.array(posting_offsets, dtype=np.uint64))
+    np.save(os.path.join(path, 'doc_freqs.npy'), np.array([doc_freqs[word] for word in terms], dtype=np.uint32))
+    np.save(os.path.join(path, 'doc_lengths.npy'), np.array(doc_lengths, dtype=np.uint32))
+    np.save(os.path.join(path, 'length_norms.npy'), np.array(length_norms, dtype=np.float64))
+    np.save(os.path.join(path, 'document_offsets.npy'), np.array(document_offsets, dtype=np.uint64))
+
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, version=FORMAT_VERSION), f, ensure_ascii=False, indent=2)
+
+
+class MappedTermDictionary:
+    """内存映射的有序词典，通过二分查找定位词的编号"""
+
+    def __init__(self, path):
+        self.terms = _map_file(os.path.join(path, 'terms.bin'))
+        self.offsets = np.load(os.path.join(path, 'term_offsets.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def term(self, term_id):
+        """根据编号取出词"""
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        return self.terms[start:end].decode('utf-8')
+
+    def lookup(self, word):
+        """
+        查找词的编号
+        :param word: 词
+        :return: 词编号，不存在时返回None
+        """
+        target = word.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            start, end = int(self.offsets[middle]), int(self.offsets[middle + 1])
+            if self.terms[start:end] < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self):
+            start, end = int(self.offsets[low]), int(self.offsets[low + 1])
+            if self.terms[start:end] == target:
+                return low
+        return None
+
+    def __iter__(self):
+        for term_id in range(len(self)):
+            yield self.term(term_id)
+
+
+class MappedPostings(Mapping):
+    """
+    内存映射的倒排表，行为与 {词: [(文档编号, 词频), ...]} 字典一致
+    倒排表在首次访问时解码，并在有界的LRU缓存中保留最近使用的词
+    """
+
+    def __init__(self, path, dictionary, cache_size=4096):
+        self.dictionary = dictionary
+        self.data = _map_file(os.path.join(path, 'postings.bin'))
+        self.offsets = np.load(os.path.join(path, 'posting_offsets.npy'), mmap_mode='r')
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __getitem__(self, word):
+        postings = self._cache.get(word)
+        if postings is not None:
+            self._cache.move_to_end(word)
+            return postings
+
+        term_id = self.dictionary.lookup(word)
+        if term_id is None:
+            raise KeyError(word)
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        postings = decode_postings(self.data[start:end])
+
+        self._cache[word] = postings
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return postings
+
+    def __contains__(self, word):
+        return word in self._cache or self.dictionary.lookup(word) is not None
+
+    def __iter__(self):
+        return iter(self.dictionary)
+
+    def __len__(self):
+        return len(self.dictionary)
+
+
+class MappedDocFreqs(Mapping):
+    """内存映射的文档频率表，行为与 {词: 文档频率} 字典一致"""
+
+    def __init__(self, path, dictionary):
+        self.dictionary = dictionary
+        self.freqs = np.load(os.path.join(path, 'doc_freqs.npy'), mmap_mode='r')
+
+    def __getitem__(self, word):
+        term_id = self.dictionary.lookup(word)
+        if term_id is None:
+            raise KeyError(word)
+        return int(self.freqs[term_id])
+
+    def __iter__(self):
+        return iter(self.dictionary)
+
+    def __len__(self):
+        return len(self.dictionary)
+
+
+class MappedDocuments(Sequence):
+    """内存映射的文档列表，按需解析单个文档"""
+
+    def __init__(self, path):
+        self.data = _map_file(os.path.join(path, 'documents.jsonl'))
+        self.offsets = np.load(os.path.join(path, 'document_offsets.npy'), mmap_mode='r')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return json.loads(self.data[start:end].decode('utf-8'))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def read_index(path):
+    """
+    以内存映射方式读取索引
+    :param path: 索引目录
+    :return: 包含元数据和各个映射视图的字典
+    """
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"不支持的索引格式版本: {meta.get('version')}")
+
+    dictionary = MappedTermDictionary(path)
+    return {
+        'meta': meta,
+        'postings': MappedPostings(path, dictionary),
+        'doc_freqs': MappedDocFreqs(path, dictionary),
+        'doc_lengths': np.load(os.path.join(path, 'doc_lengths.npy'), mmap_mode='r'),
+        'length_norms': np.load(os.path.join(path, 'length_norms.npy'), mmap_mode='r'),
+        'documents': MappedDocuments(path),
+    }
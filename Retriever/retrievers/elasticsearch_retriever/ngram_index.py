@@ -0,0 +1,118 @@
+"""
+字符n-gram索引（模糊匹配）
+功能：
+1. 为词表中的每个词建立字符n-gram倒排，默认使用三元组（trigram）
+2. 查询词的候选只从共享足够多n-gram的词中产生，再用有界编辑距离精确验证
+3. 编辑距离支持相邻字符交换（Optimal String Alignment），适合处理输入错误
+
+过滤依据：每次编辑（插入、删除、替换、相邻交换）最多破坏 n + 1 个n-gram，
+因此编辑距离不超过k的两个词至少共享 |grams(q)| - (n + 1) * k 个n-gram
+"""
+
+from collections import Counter
+
+
+def bounded_edit_distance(source, target, max_distance):
+    """
+    计算两个字符串的编辑距离（允许相邻字符交换），超过上限时提前结束
+    :param source: 字符串
+    :param target: 字符串
+    :param max_distance: 距离上限
+    :return: 编辑距离，超过上限时返回None
+    """
+    if abs(len(source) - len(target)) > max_distance:
+        return None
+    if source == target:
+        return 0
+
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = 0 if source[i - 1] == target[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and j > 1 and source[i - 1] == target[j - 2]
+                    and source[i - 2] == target[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return None
+        previous_previous, previous = previous, current
+
+    distance = previous[-1]
+    return distance if distance <= max_distance else None
+
+
+class NGramIndex:
+    def __init__(self, terms=(), n=3):
+        """
+        初始化n-gram索引
+        :param terms: 词表
+        :param n: n-gram的长度
+        """
+        self.n = n
+        self.terms = []  # 词编号 -> 词
+        self.term_ids = {}  # {词: 词编号}
+        self.grams = {}  # {n-gram: [词编号, ...]}
+        self.by_length = {}  # {词长: [词编号, ...]}，n-gram无法过滤时按长度筛选
+        for term in terms:
+            self.add(term)
+
+    def _grams(self, term):
+        """词的n-gram集合，首尾补齐 n - 1 个边界符，使短词也能产生n-gram"""
+        padding = '\x00' * (self.n - 1)
+        padded = padding + term + padding
+        return {padded[i:i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    def add(self, term):
+        """
+        向词表中添加一个词，已存在时忽略
+        :param term: 词
+        """
+        if term in self.term_ids:
+            return
+        term_id = len(self.terms)
+        self.terms.append(term)
+        self.term_ids[term] = term_id
+        for gram in self._grams(term):
+            self.grams.setdefault(gram, []).append(term_id)
+        self.by_length.setdefault(len(term), []).append(term_id)
+
+    def candidates(self, term, max_edits):
+        """
+        生成编辑距离可能不超过max_edits的候选词（未验证）
+        :param term: 查询词
+        :param max_edits: 最大编辑距离
+        :return: 候选词编号列表
+        """
+        query_grams = self._grams(term)
+        threshold = len(query_grams) - (self.n + 1) * max_edits
+        lengths = range(len(term) - max_edits, len(term) + max_edits + 1)
+
+        if threshold <= 0:
+            # 查询词太短，n-gram无法提供过滤，只按长度筛选
+            return [term_id for length in lengths for term_id in self.by_length.get(length, ())]
+
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.grams.get(gram, ()))
+        return [
+            term_id for term_id, count in shared.items()
+            if count >= threshold and len(self.terms[term_id]) in lengths
+        ]
+
+    def search(self, term, max_edits):
+        """
+        查找与查询词编辑距离不超过max_edits的词
+        :param term: 查询词
+        :param max_edits: 最大编辑距离
+        :return: [(词, 编辑距离), ...]，按编辑距离升序
+        """
+        matches = []
+        for term_id in self.candidates(term, max_edits):
+            candidate = self.terms[term_id]
+            distance = bounded_edit_distance(term, candidate, max_edits)
+            if distance is not None:
+                matches.append((candidate, distance))
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches
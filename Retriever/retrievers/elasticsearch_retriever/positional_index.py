@@ -0,0 +1,331 @@
+"""
+位置倒排索引
+功能：
+1. 记录每个词在每个文档中出现的位置，位置差分后以varint编码紧凑存储；
+   每个词的倒排只占一个文档编号数组和一段拼接的位置缓冲区（附偏移数组），与 bm25_storage 的布局一致
+2. 精确短语匹配：统计查询词按顺序相邻出现的次数
+3. 邻近度计算：包含所有命中查询词的最小窗口长度
+
+4. 三个扁平缓冲区按词拼接后写入磁盘，加载时内存映射，不需要重新分词
+
+位置只在需要时解码，检索器应先用词项级条件筛出候选文档，再对候选检查位置
+"""
+
+import bisect
+import heapq
+import os
+import sys
+from array import array
+from collections import deque
+from collections.abc import Mapping
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch_retriever.bm25_storage import MappedTermDictionary, _map_file, decode_varints, encode_varints, write_terms
+
+
+def encode_positions(positions):
+    """
+    编码升序的位置列表（差分后varint编码）
+    :param positions: 升序的词位置列表
+    :return: 编码后的字节串
+    """
+    out = bytearray()
+    previous = 0
+    deltas = []
+    for position in positions:
+        deltas.append(position - previous)
+        previous = position
+    encode_varints(deltas, out)
+    return bytes(out)
+
+
+def decode_positions(data):
+    """
+    解码 encode_positions 生成的字节串
+    :param data: 字节串
+    :return: 升序的位置列表
+    """
+    positions = []
+    position = 0
+    for delta in decode_varints(data):
+        position += delta
+        positions.append(position)
+    return positions
+
+
+class MappedPositions(Mapping):
+    """
+    内存映射的位置倒排，行为与 {词: (文档编号数组, 位置偏移数组, 位置数据)} 字典一致
+    取出的三元组直接是映射文件上的视图：位置偏移是在整个位置数据中的绝对偏移，位置数据是整个映射文件
+    """
+
+    def __init__(self, path):
+        self.dictionary = MappedTermDictionary(path)
+        self.doc_ids = np.load(os.path.join(path, 'doc_ids.npy'), mmap_mode='r')
+        self.doc_offsets = np.load(os.path.join(path, 'doc_offsets.npy'), mmap_mode='r')
+        self.position_offsets = np.load(os.path.join(path, 'position_offsets.npy'), mmap_mode='r')
+        self.data = _map_file(os.path.join(path, 'positions.bin'))
+
+    def __getitem__(self, word):
+        term_id = self.dictionary.lookup(word)
+        if term_id is None:
+            raise KeyError(word)
+        start, end = int(self.doc_offsets[term_id]), int(self.doc_offsets[term_id + 1])
+        return self.doc_ids[start:end], self.position_offsets[start:end + 1], self.data
+
+    def __contains__(self, word):
+        return self.dictionary.lookup(word) is not None
+
+    def __iter__(self):
+        return iter(self.dictionary)
+
+    def __len__(self):
+        return len(self.dictionary)
+
+
+class PositionalIndex:
+    def __init__(self):
+        """初始化位置索引"""
+        # {词: (文档编号数组, 位置偏移数组, 位置数据)}，每个词只占三个扁平缓冲区：
+        # 文档编号升序排列；第i个文档的位置编码位于 位置数据[偏移[i]:偏移[i + 1]]
+        self.postings = {}
+
+    @staticmethod
+    def _find(doc_ids, doc_id):
+        """二分查找文档编号在词的文档数组中的下标，不存在时返回None"""
+        i = bisect.bisect_left(doc_ids, doc_id)
+        if i < len(doc_ids) and doc_ids[i] == doc_id:
+            return i
+        return None
+
+    def save(self, path):
+        """
+        将位置索引写入目录，之后可通过 load 以内存映射方式加载
+        目录结构：
+            terms.bin, term_offsets.npy  按UTF-8字节序排序的词典，格式与 bm25_storage 相同
+            doc_ids.npy                  所有词的文档编号数组首尾相接
+            doc_offsets.npy              每个词的文档编号在 doc_ids.npy 中的起始下标，长度为词数+1
+            positions.bin                所有 (词, 文档) 的位置编码首尾相接，顺序与 doc_ids.npy 相同
+            position_offsets.npy         每个 (词, 文档) 在 positions.bin 中的起始偏移，长度为 doc_ids 长度+1
+        :param path: 目标目录
+        """
+        os.makedirs(path, exist_ok=True)
+        terms = sorted(self.postings, key=lambda word: word.encode('utf-8'))
+        write_terms(path, terms)
+        doc_id_parts = []
+        doc_offsets = [0]
+        offset_parts = [np.zeros(1, dtype=np.uint64)]
+        written = 0
+        with open(os.path.join(path, 'positions.bin'), 'wb') as position_file:
+            for word in terms:
+                doc_ids, offsets, data = self.postings[word]
+                offsets = np.asarray(offsets, dtype=np.uint64)
+                position_file.write(data[int(offsets[0]):int(offsets[-1])])
+                doc_id_parts.append(np.asarray(doc_ids, dtype=np.uint32))
+                offset_parts.append(offsets[1:] - offsets[0] + np.uint64(written))
+                written += int(offsets[-1] - offsets[0])
+                doc_offsets.append(doc_offsets[-1] + len(doc_ids))
+        np.save(os.path.join(path, 'doc_ids.npy'), np.concatenate(doc_id_parts or [np.zeros(0, dtype=np.uint32)]))
+        np.save(os.path.join(path, 'doc_offsets.npy'), np.array(doc_offsets, dtype=np.uint64))
+        np.save(os.path.join(path, 'position_offsets.npy'), np.concatenate(offset_parts))
+
+    @classmethod
+    def load(cls, path):
+        """
+        以内存映射方式加载 save 保存的位置索引，首次增删文档时才把索引完整读入内存
+        :param path: 索引目录
+        :return: PositionalIndex实例
+        """
+        index = cls()
+        index.postings = MappedPositions(path)
+        return index
+
+    def _ensure_mutable(self):
+        """从磁盘加载的只读（内存映射）索引在首次修改前转换为内存中的缓冲区"""
+        if isinstance(self.postings, dict):
+            return
+        postings = {}
+        for word in self.postings:
+            doc_ids, offsets, data = self.postings[word]
+            start, end = int(offsets[0]), int(offsets[-1])
+            postings[word] = (array('I', doc_ids.tolist()), array('Q', (offsets - offsets[0]).tolist()),
+                              bytearray(data[start:end]))
+        self.postings = postings
+
+    def add(self, doc_id, words):
+        """
+        写入一个文档的词位置
+        :param doc_id: 文档编号
+        :param words: 文档分词结果
+        """
+        self._ensure_mutable()
+        occurrences = {}
+        for position, word in enumerate(words):
+            occurrences.setdefault(word, []).append(position)
+        for word, word_positions in occurrences.items():
+            entry = self.postings.get(word)
+            if entry is None:
+                entry = self.postings[word] = (array('I'), array('Q', [0]), bytearray())
+            doc_ids, offsets, data = entry
+            encoded = encode_positions(word_positions)
+            if not doc_ids or doc_ids[-1] < doc_id:
+                # 文档按编号递增写入时直接追加到缓冲区末尾
+                doc_ids.append(doc_id)
+                data += encoded
+                offsets.append(len(data))
+                continue
+            i = bisect.bisect_left(doc_ids, doc_id)
+            if i < len(doc_ids) and doc_ids[i] == doc_id:
+                self._delete(entry, i)
+            start = offsets[i]
+            doc_ids.insert(i, doc_id)
+            data[start:start] = encoded
+            offsets.insert(i + 1, start + len(encoded))
+            for j in range(i + 2, len(offsets)):
+                offsets[j] += len(encoded)
+
+    @staticmethod
+    def _delete(entry, i):
+        """从词的缓冲区中删除第i个文档"""
+        doc_ids, offsets, data = entry
+        start, end = offsets[i], offsets[i + 1]
+        del data[start:end]
+        del doc_ids[i]
+        del offsets[i + 1]
+        for j in range(i + 1, len(offsets)):
+            offsets[j] -= end - start
+
+    def remove(self, doc_id, words):
+        """
+        删除一个文档的词位置
+        :param doc_id: 文档编号
+        :param words: 文档分词结果
+        """
+        self._ensure_mutable()
+        for word in set(words):
+            entry = self.postings.get(word)
+            if entry is None:
+                continue
+            i = self._find(entry[0], doc_id)
+            if i is None:
+                continue
+            self._delete(entry, i)
+            if not entry[0]:
+                del self.postings[word]
+
+    def remap(self, mapping):
+        """
+        按新的文档编号重写索引，不在映射中的文档被丢弃（用于索引压缩）
+        :param mapping: {旧文档编号: 新文档编号}
+        """
+        self._ensure_mutable()
+        postings = {}
+        for word, (doc_ids, offsets, data) in self.postings.items():
+            kept = sorted(
+                (mapping[doc_id], offsets[i], offsets[i + 1])
+                for i, doc_id in enumerate(doc_ids) if doc_id in mapping
+            )
+            if not kept:
+                continue
+            new_doc_ids, new_offsets, new_data = array('I'), array('Q', [0]), bytearray()
+            for new_id, start, end in kept:
+                new_doc_ids.append(new_id)
+                new_data += data[start:end]
+                new_offsets.append(len(new_data))
+            postings[word] = (new_doc_ids, new_offsets, new_data)
+        self.postings = postings
+
+    def get(self, word, doc_id):
+        """
+        获取词在文档中的位置
+        :return: 升序的位置列表，词不在文档中时返回空列表
+        """
+        entry = self.postings.get(word)
+        if entry is None:
+            return []
+        doc_ids, offsets, data = entry
+        i = self._find(doc_ids, doc_id)
+        if i is None:
+            return []
+        return decode_positions(data[int(offsets[i]):int(offsets[i + 1])])
+
+    def candidates(self, words):
+        """
+        包含所有给定词的文档编号（词项级筛选，不解码位置）
+        :param words: 词列表
+        :return: 升序的文档编号列表
+        """
+        doc_arrays = []
+        for word in set(words):
+            entry = self.postings.get(word)
+            if entry is None:
+                return []
+            doc_arrays.append(entry[0])
+        if not doc_arrays:
+            return []
+        # 从最短的文档数组开始求交集，其余数组上二分查找
+        doc_arrays.sort(key=len)
+        matched = [int(doc_id) for doc_id in doc_arrays[0]]
+        for doc_ids in doc_arrays[1:]:
+            matched = [doc_id for doc_id in matched if self._find(doc_ids, doc_id) is not None]
+            if not matched:
+                break
+        return matched
+
+    def phrase_count(self, words, doc_id):
+        """
+        统计短语在文档中按顺序相邻出现的次数
+        :param words: 短语的分词结果
+        :param doc_id: 文档编号
+        :return: 出现次数
+        """
+        if not words:
+            return 0
+        following = [set(self.get(word, doc_id)) for word in words[1:]]
+        count = 0
+        for start in self.get(words[0], doc_id):
+            if all(start + offset in positions for offset, positions in enumerate(following, 1)):
+                count += 1
+        return count
+
+    def min_window(self, words, doc_id):
+        """
+        计算覆盖文档中所有命中查询词的最小窗口
+        :param words: 查询词列表
+        :param doc_id: 文档编号
+        :return: (命中的不同查询词数, 最小窗口包含的词数)，命中不足两个词时窗口为None
+        """
+        position_lists = []
+        for word in set(words):
+            word_positions = self.get(word, doc_id)
+            if word_positions:
+                position_lists.append(word_positions)
+        matched = len(position_lists)
+        if matched < 2:
+            return matched, None
+
+        # 按位置归并所有词的出现，用滑动窗口寻找同时包含每个词的最短区间
+        events = heapq.merge(*[[(position, term) for position in positions]
+                               for term, positions in enumerate(position_lists)])
+        window = deque()
+        counts = [0] * matched
+        covered = 0
+        best = None
+        for position, term in events:
+            window.append((position, term))
+            if counts[term] == 0:
+                covered += 1
+            counts[term] += 1
+            while covered == matched:
+                first_position, first_term = window[0]
+                span = position - first_position + 1
+                if best is None or span < best:
+                    best = span
+                counts[first_term] -= 1
+                if counts[first_term] == 0:
+                    covered -= 1
+                window.popleft()
+        return matched, best
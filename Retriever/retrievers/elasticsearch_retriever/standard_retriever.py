@@ -3,15 +3,54 @@ Standard Retriever（标准检索器）示例脚本
 功能：
 1. 替代传统的query功能
 2. 返回传统查询中的顶级文档
+
+得分为查询词在 标题 + 正文 中作为子串出现的次数（不区分大小写）
 """
 
+import os
+import sys
+from collections import Counter, OrderedDict
+
+# 添加检索器根目录到Python路径中
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch_retriever.aho_corasick import AhoCorasick
+from elasticsearch_retriever.ngram_index import NGramIndex
+from elasticsearch_retriever.positional_index import PositionalIndex
+from text_analyzer import Analyzer
+
+
 class StandardRetriever:
-    def __init__(self, index_data=None):
+    def __init__(self, index_data=None, analyzer=None, positions=False):
         """
         初始化标准检索器
         :param index_data: 索引数据，模拟Elasticsearch索引
+        :param analyzer: 查询分析器，默认小写化后按空白字符分词
+        :param positions: 是否为标题和正文构建位置索引，开启后支持短语检索
         """
         self.index_data = index_data or []
+        self.analyzer = analyzer or Analyzer(lowercase=True)
+        self.match_cache_size = 1024
+        
+        # 预先计算小写化后的 标题 + 正文，查询时不再逐文档重复处理
+        self.normalized_texts = [
+            (doc.get('title', '') + ' ' + doc.get('content', '')).lower() for doc in self.index_data
+        ]
+        
+        # 前置过滤索引 {词元: [(文档编号, 出现次数), ...]}，词元为按空白切分的片段。
+        # 不含空白的查询词只能出现在某个词元内部，因此只需在词表上匹配，无法命中的文档不会被访问
+        self.token_postings = {}
+        for doc_id, text in enumerate(self.normalized_texts):
+            for token, tf in Counter(text.split()).items():
+                self.token_postings.setdefault(token, []).append((doc_id, tf))
+        self._term_matches = OrderedDict()  # {查询词: [(词元, 在词元中的出现次数), ...]}，LRU缓存
+        self._ngram_index = None  # 模糊检索用的词表三元组索引，首次模糊检索时构建
+        
+        self.positional = None
+        if positions:
+            self.positional = PositionalIndex()
+            for doc_id, doc in enumerate(self.index_data):
+                self.positional.add(doc_id, self.analyzer.analyze(doc.get('title', '') + ' ' + doc.get('content', ''), cache=False))
     
     def search(self, query, top_k=10):
         """
@@ -20,25 +59,126 @@ class StandardRetriever:
         :param top_k: 返回结果数量
         :return: 检索结果列表
         """
-        # 模拟基于关键词的检索
-        results = []
-        query_terms = query.lower().split()
+        query_terms = self.analyzer.analyze(query)
+        weights = Counter(query_terms)  # 重复的查询词重复计分
+        
+        scores = {}
+        if any(char.isspace() for term in weights for char in term):
+            # 含空白的查询词可能跨越词元，退化为对每个文档做一次多模式扫描
+            matcher = AhoCorasick(weights)
+            for doc_id, text in enumerate(self.normalized_texts):
+                score = sum(weights[term] * count for term, count in matcher.count(text).items())
+                if score > 0:
+                    scores[doc_id] = score
+        else:
+            for term, token_matches in self._match_vocabulary(list(weights)).items():
+                self._accumulate(scores, token_matches, weights[term])
+        
+        return self._rank(scores, top_k)
+    
+    def fuzzy_search(self, query, top_k=10, max_edits=None):
+        """
+        容错检索：在标准检索的基础上，查询词还可以匹配编辑距离不超过max_edits的词元
+        候选词元由三元组索引生成，再用有界编辑距离验证，不需要逐文档计算编辑距离
+        :param query: 查询字符串
+        :param top_k: 返回结果数量
+        :param max_edits: 最大编辑距离，为None时按词长自动选择（1-2个字符为0，3-5个字符为1，更长为2）
+        :return: 检索结果列表，近似匹配的每次出现按 1 / (1 + 编辑距离) 计分
+        """
+        if self._ngram_index is None:
+            self._ngram_index = NGramIndex(self.token_postings)
+        
+        weights = Counter(self.analyzer.analyze(query))
+        scores = {}
+        for term, token_matches in self._match_vocabulary(list(weights)).items():
+            matched = dict(token_matches)
+            edits = max_edits if max_edits is not None else self._auto_edits(term)
+            if edits > 0:
+                for token, distance in self._ngram_index.search(term, edits):
+                    if token not in matched:
+                        matched[token] = 1 / (1 + distance)
+            self._accumulate(scores, matched.items(), weights[term])
+        
+        return self._rank(scores, top_k)
+    
+    @staticmethod
+    def _auto_edits(term):
+        """按词长选择允许的编辑距离，短词容错过多会带来大量误匹配"""
+        if len(term) <= 2:
+            return 0
+        if len(term) <= 5:
+            return 1
+        return 2
+    
+    def _accumulate(self, scores, token_weights, weight):
+        """按词元的倒排表把得分累加到文档上"""
+        for token, token_weight in token_weights:
+            for doc_id, tf in self.token_postings[token]:
+                scores[doc_id] = scores.get(doc_id, 0) + weight * token_weight * tf
+    
+    def _rank(self, scores, top_k):
+        """按得分从高到低排列，得分相同时保持文档原始顺序"""
+        results = [
+            {
+                'document': self.index_data[doc_id],
+                'score': score
+            }
+            for doc_id, score in sorted(scores.items())
+        ]
+        
+        # 按得分排序并返回前top_k个结果
+        results.sort(key=lambda x: x['score'], reverse=True)
+        return results[:top_k]
+    
+    def _match_vocabulary(self, terms):
+        """
+        在词表上查找包含查询词的词元
+        未缓存的查询词合并构建一个Aho-Corasick自动机，每个词元只扫描一次
+        :param terms: 不含空白的查询词列表
+        :return: {查询词: [(词元, 在词元中的出现次数), ...]}
+        """
+        pending = [term for term in terms if term not in self._term_matches]
+        if pending:
+            matcher = AhoCorasick(pending)
+            shortest = min(len(term) for term in pending)
+            found = {term: [] for term in pending}
+            for token in self.token_postings:
+                if len(token) < shortest:
+                    continue
+                for term, count in matcher.count(token).items():
+                    found[term].append((token, count))
+            for term, token_matches in found.items():
+                self._term_matches[term] = token_matches
         
-        for doc in self.index_data:
-            score = 0
-            doc_content = (doc.get('title', '') + ' ' + doc.get('content', '')).lower()
-            
-            # 计算关键词匹配得分
-            for term in query_terms:
-                score += doc_content.count(term)
-            
+        matches = {}
+        for term in terms:
+            self._term_matches.move_to_end(term)
+            matches[term] = self._term_matches[term]
+        while len(self._term_matches) > self.match_cache_size:
+            self._term_matches.popitem(last=False)
+        return matches
+    
+    def phrase_search(self, phrase, top_k=10):
+        """
+        精确短语检索：按短语在标题和正文中出现的次数排序
+        只对包含全部短语词的候选文档检查位置，不做全文子串扫描
+        :param phrase: 短语
+        :param top_k: 返回结果数量
+        :return: 检索结果列表
+        """
+        if self.positional is None:
+            raise ValueError("短语检索需要在创建检索器时开启 positions=True")
+        
+        words = self.analyzer.analyze(phrase)
+        results = []
+        for doc_id in self.positional.candidates(words):
+            score = self.positional.phrase_count(words, doc_id)
             if score > 0:
                 results.append({
-                    'document': doc,
+                    'document': self.index_data[doc_id],
                     'score': score
                 })
         
-        # 按得分排序并返回前top_k个结果
         results.sort(key=lambda x: x['score'], reverse=True)
         return results[:top_k]
 
@@ -76,4 +216,17 @@ if __name__ == "__main__":
     for i, result in enumerate(results, 1):
         doc = result['document']
         print(f"{i}. {doc['title']} (Score: {result['score']})")
-        print(f"   {doc['content'][:100]}...")
\ No newline at end of file
+        print(f"   {doc['content'][:100]}...")
+    
+    # 容错检索：查询中的拼写错误
+    typo_query = "machine lerning algoritms"
+    print(f"\nFuzzy query: {typo_query}")
+    for i, result in enumerate(retriever.fuzzy_search(typo_query, top_k=2), 1):
+        print(f"{i}. {result['document']['title']} (Score: {result['score']:.2f})")
+    
+    # 短语检索
+    phrase_retriever = StandardRetriever(sample_data, positions=True)
+    phrase = "machine learning methods"
+    print(f"\nPhrase: {phrase}")
+    for i, result in enumerate(phrase_retriever.phrase_search(phrase), 1):
+        print(f"{i}. {result['document']['title']} (Matches: {result['score']})")
\ No newline at end of file
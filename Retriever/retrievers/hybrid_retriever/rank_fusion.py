@@ -0,0 +1,105 @@
+"""
+排名融合
+功能：
+1. 加权倒数排名融合（RRF）：score = Σ w_i / (k + rank_i)
+2. CombSUM / CombMNZ：先对每个检索器的得分做 min-max 或 z-score 归一化，再加权求和（CombMNZ 再乘以命中的检索器数）
+3. 一次遍历所有结果，同时建立 文档编号 -> 文档 的映射和累计得分，再用大小为k的堆选出前k个，
+   总代价为 O(n log k)，n为所有检索器返回结果的总数
+4. 文档编号优先使用文档的 id 字段，没有时使用内容的SHA-1摘要，在不同进程之间保持一致
+"""
+
+import hashlib
+import heapq
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+# 支持的融合方法和得分归一化方法
+FUSION_METHODS = ("rrf", "combsum", "combmnz")
+NORMALIZATIONS = ("minmax", "zscore", None)
+
+
+def document_id(doc: Dict[str, Any]) -> Any:
+    """
+    获取文档的稳定编号
+    :param doc: 文档
+    :return: 文档的 id 字段，没有时为内容的SHA-1摘要
+    """
+    doc_id = doc.get('id')
+    if doc_id is not None:
+        return doc_id
+    return hashlib.sha1(doc.get('content', '').encode('utf-8')).hexdigest()
+
+
+def normalize_scores(scores: Sequence[float], method: Optional[str] = "minmax") -> List[float]:
+    """
+    归一化一个检索器返回的得分
+    :param scores: 得分列表
+    :param method: "minmax" 缩放到 [0, 1]（得分全部相同时均为1），"zscore" 标准化（标准差为0时均为0），None 不处理
+    :return: 归一化后的得分列表
+    """
+    if method not in NORMALIZATIONS:
+        raise ValueError(f"不支持的归一化方法: {method}，可选值为 {NORMALIZATIONS}")
+    scores = [float(score) for score in scores]
+    if method is None or not scores:
+        return scores
+    if method == "minmax":
+        low, high = min(scores), max(scores)
+        if high == low:
+            return [1.0] * len(scores)
+        return [(score - low) / (high - low) for score in scores]
+    mean = sum(scores) / len(scores)
+    std = math.sqrt(sum((score - mean) ** 2 for score in scores) / len(scores))
+    if std == 0:
+        return [0.0] * len(scores)
+    return [(score - mean) / std for score in scores]
+
+
+def fuse(result_lists: Sequence[Sequence[Dict]], top_k: int = 10, method: str = "rrf",
+         weights: Optional[Sequence[float]] = None, k: float = 60.0,
+         normalization: Optional[str] = "minmax") -> List[Dict]:
+    """
+    融合多个检索器的结果
+    :param result_lists: 每个检索器按排名排列的结果列表，每个结果包含 document 和 score
+    :param top_k: 返回结果数量
+    :param method: 融合方法，"rrf"、"combsum" 或 "combmnz"
+    :param weights: 与 result_lists 一一对应的权重，默认均为1
+    :param k: RRF参数k
+    :param normalization: CombSUM / CombMNZ 使用的得分归一化方法
+    :return: 融合后的结果列表 [{'document': 文档, 'score': 融合得分}, ...]，得分相同时先出现的文档在前
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"不支持的融合方法: {method}，可选值为 {FUSION_METHODS}")
+    if weights is None:
+        weights = [1.0] * len(result_lists)
+    if len(weights) != len(result_lists):
+        raise ValueError("weights 的长度必须与结果列表数量相同")
+
+    documents = {}  # {文档编号: 文档}，按第一次出现的顺序
+    scores = {}  # {文档编号: 累计得分}
+    hits = {}  # {文档编号: 命中的检索器数}
+    for results, weight in zip(result_lists, weights):
+        if method == "rrf":
+            contributions = [weight / (k + rank) for rank in range(1, len(results) + 1)]
+        else:
+            contributions = [weight * score for score in
+                             normalize_scores([result['score'] for result in results], normalization)]
+        seen = set()
+        for result, contribution in zip(results, contributions):
+            doc = result['document']
+            doc_id = document_id(doc)
+            if doc_id in seen:
+                continue  # 同一检索器重复返回的文档只按最好的排名计算
+            seen.add(doc_id)
+            if doc_id not in documents:
+                documents[doc_id] = doc
+                scores[doc_id] = 0.0
+                hits[doc_id] = 0
+            scores[doc_id] += contribution
+            hits[doc_id] += 1
+
+    if method == "combmnz":
+        scores = {doc_id: score * hits[doc_id] for doc_id, score in scores.items()}
+
+    # heapq.nlargest 与 sorted(..., reverse=True)[:top_k] 结果相同（对相同得分保持原顺序），代价为 O(n log k)
+    top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    return [{'document': documents[doc_id], 'score': score} for doc_id, score in top]
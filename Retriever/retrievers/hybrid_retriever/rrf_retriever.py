@@ -3,25 +3,249 @@ RRF Retriever（倒数排名融合检索器）示例脚本
 功能：
 1. 根据倒数排名融合(RRF)算法生成顶级文档
 2. 可以组合多个第一阶段检索器
+3. 各检索器在线程池中并发执行，每个检索器有自己的超时时间，融合只使用按时正常返回的结果，
+   超时和抛出异常的检索器在报告中列出
+   检索器不要求线程安全：同一个检索器同一时间只执行一次检索。超时的检索仍在后台运行，
+   它返回之前对该检索器的新调用会等待，等到截止时间仍未轮到时记为超时
+4. 除RRF外还支持加权RRF和CombSUM / CombMNZ得分融合（见 rank_fusion）
+5. 自适应候选深度：先取较浅的候选，只有深处的文档仍可能进入前k个时才加深，结果与直接取最大深度相同
 """
 
-import math
-from typing import List, Dict, Any
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple
+
+# 添加检索器根目录到Python路径中
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from hybrid_retriever.rank_fusion import FUSION_METHODS, document_id, fuse
+
+
+class _RetrieverBusy(Exception):
+    """检索器的上一次调用直到截止时间仍未返回，本次调用没有执行"""
 
 
 class RRF_Retriever:
-    def __init__(self, retrievers: List[Any] = None, k: float = 60.0):
+    def __init__(self, retrievers: List[Any] = None, k: float = 60.0, timeout: Optional[float] = None,
+                 timeouts: Optional[List[Optional[float]]] = None, max_workers: Optional[int] = None,
+                 method: str = "rrf", weights: Optional[List[float]] = None, normalization: Optional[str] = "minmax",
+                 candidate_depth: int = 50, adaptive_depth: bool = False, initial_depth: Optional[int] = None):
         """
         初始化RRF检索器
         :param retrievers: 检索器列表
         :param k: RRF参数k，默认为60
+        :param timeout: 默认的单个检索器超时时间（秒），为None时一直等待
+        :param timeouts: 与retrievers一一对应的超时时间，为None的项使用默认超时时间
+        :param max_workers: 线程池大小，默认为检索器数量的2倍；超时后仍在运行的检索占满线程时换用新的线程池
+        :param method: 融合方法，"rrf"、"combsum" 或 "combmnz"
+        :param weights: 与retrievers一一对应的融合权重，为None时均为1
+        :param normalization: CombSUM / CombMNZ 的得分归一化方法，"minmax" 或 "zscore"
+        :param candidate_depth: 每个检索器最多取的候选数
+        :param adaptive_depth: 是否自适应候选深度（仅对RRF生效：CombSUM / CombMNZ 的归一化依赖完整的候选列表）；
+            要求检索器取较少结果时返回的是取较多结果时的前缀
+        :param initial_depth: 自适应时第一轮的候选数，默认为 max(2 * top_k, 10)
         """
+        if method not in FUSION_METHODS:
+            raise ValueError(f"不支持的融合方法: {method}，可选值为 {FUSION_METHODS}")
         self.retrievers = retrievers or []
         self.k = k
+        self.timeout = timeout
+        self.timeouts = list(timeouts) if timeouts is not None else [None] * len(self.retrievers)
+        if len(self.timeouts) != len(self.retrievers):
+            raise ValueError("timeouts 的长度必须与检索器数量相同")
+        self.max_workers = max_workers
+        self.method = method
+        self.weights = list(weights) if weights is not None else None
+        if self.weights is not None and len(self.weights) != len(self.retrievers):
+            raise ValueError("weights 的长度必须与检索器数量相同")
+        self.normalization = normalization
+        self.candidate_depth = candidate_depth
+        self.adaptive_depth = adaptive_depth
+        self.initial_depth = initial_depth
+        self._executor = None
+        self._retired = []  # 因卡住的检索过多而换下的线程池，close 时一并关闭
+        self._hung = []  # 已超时但仍占用当前线程池线程的检索
+        self._retriever_locks = {}  # {id(检索器): 锁}，保证同一个检索器同一时间只执行一次检索
+        self._lock = threading.Lock()
     
-    def add_retriever(self, retriever):
-        """添加检索器"""
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def add_retriever(self, retriever, timeout: Optional[float] = None, weight: float = 1.0):
+        """
+        添加检索器
+        :param retriever: 检索器
+        :param timeout: 该检索器的超时时间（秒），为None时使用默认超时时间
+        :param weight: 该检索器的融合权重
+        """
+        if self.weights is None and weight != 1.0:
+            self.weights = [1.0] * len(self.retrievers)
+        if self.weights is not None:
+            self.weights.append(weight)
         self.retrievers.append(retriever)
+        self.timeouts.append(timeout)
+        # 线程池大小与检索器数量有关，下次检索时重新创建
+        with self._lock:
+            self._retire_executor()
+    
+    def _retire_executor(self):
+        """换下当前线程池：不再接受新的检索，其中仍在运行的检索返回后线程自行退出（调用方需持有 self._lock）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._retired.append(self._executor)
+            self._executor = None
+        self._hung = []
+    
+    def close(self, wait: bool = False):
+        """
+        关闭当前和已换下的所有线程池，之后再检索时重新创建
+        :param wait: 是否等待仍在运行（已超时）的检索返回；为False时这些线程在检索返回后自行退出
+        """
+        with self._lock:
+            self._retire_executor()
+            executors, self._retired = self._retired, []
+        for executor in executors:
+            executor.shutdown(wait=wait, cancel_futures=True)
+    
+    def _get_executor(self, needed: int) -> ThreadPoolExecutor:
+        """
+        按需创建线程池，在多次检索之间复用
+        超时的检索仍会占用线程直到返回；这些线程加上本次要提交的检索超过线程池大小时换用新的线程池，
+        避免新的检索排在卡住的检索后面，旧线程池在其中的检索全部返回后自行退出
+        :param needed: 本次要提交的检索数
+        """
+        with self._lock:
+            self._hung = [future for future in self._hung if not future.done()]
+            max_workers = self.max_workers or max(2 * len(self.retrievers), 1)
+            if self._executor is not None and self._hung and len(self._hung) + needed > max_workers:
+                self._retire_executor()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rrf")
+            return self._executor
+    
+    def _fan_out(self, query: str, depths: Dict[int, int]) -> Tuple[Dict[int, List[Dict]], List[int], Dict[int, Exception]]:
+        """
+        并发调用检索器，每个检索器的截止时间从它开始运行时计算，在线程池中排队的时间不计入；
+        排队超过自身超时时间仍未开始的检索会被取消，同样记为超时。
+        同一个检索器的上一次调用（例如之前超时的检索）仍在运行时，本次调用等待它返回，等待的时间计入截止时间
+        :param query: 查询字符串
+        :param depths: {检索器下标: 返回结果数量}，只调用其中的检索器
+        :return: ({检索器下标: 结果列表}, 超时的检索器下标列表, {检索器下标: 抛出的异常})，
+            超时和出错的检索器不出现在结果中
+        """
+        executor = self._get_executor(len(depths))
+        with self._lock:
+            locks = {i: self._retriever_locks.setdefault(id(self.retrievers[i]), threading.Lock()) for i in depths}
+        start_events = {i: threading.Event() for i in depths}
+        start_times = {}
+        
+        def run(i, depth, timeout):
+            start_times[i] = time.perf_counter()
+            start_events[i].set()
+            if not locks[i].acquire(timeout=-1 if timeout is None else timeout):
+                raise _RetrieverBusy()
+            try:
+                return self.retrievers[i].search(query, top_k=depth)
+            finally:
+                locks[i].release()
+        
+        timeouts = {i: self.timeouts[i] if self.timeouts[i] is not None else self.timeout for i in depths}
+        futures = {i: executor.submit(run, i, depth, timeouts[i]) for i, depth in depths.items()}
+        
+        
+        all_results = {}
+        timed_out = []
+        failed = {}
+        for i, future in futures.items():
+            timeout = timeouts[i]
+            try:
+                if timeout is None:
+                    all_results[i] = future.result()
+                elif not start_events[i].wait(timeout) and future.cancel():
+                    timed_out.append(i)  # 一直在排队，取消后不再运行
+                else:
+                    start_events[i].wait()  # 取消失败说明检索恰好开始运行，开始时间随即写入
+                    remaining = max(0.0, start_times[i] + timeout - time.perf_counter())
+                    all_results[i] = future.result(timeout=remaining)
+            except _RetrieverBusy:
+                timed_out.append(i)
+            except FutureTimeoutError as error:
+                if future.done():
+                    failed[i] = error  # 检索器自身抛出的超时异常
+                else:
+                    timed_out.append(i)
+                    with self._lock:
+                        self._hung.append(future)
+            except Exception as error:
+                failed[i] = error
+        return all_results, timed_out, failed
+    
+    def _adaptive_fan_out(self, query: str, top_k: int) -> Tuple[List[List[Dict]], List[int], Dict[int, Exception], List[int]]:
+        """
+        自适应候选深度：从较浅的深度开始，融合后的前k个尚未确定时把仍有更多结果的检索器的深度加倍
+        :return: (每个检索器的结果列表, 超时的检索器下标列表, {出错的检索器下标: 异常}, 每个检索器最终使用的深度)
+        """
+        n = len(self.retrievers)
+        all_results = [[] for _ in range(n)]
+        depths = [0] * n
+        timed_out = []
+        failed = {}
+        active = list(range(n))  # 可能还有更多结果的检索器
+        depth = min(self.initial_depth or max(2 * top_k, 10), self.candidate_depth)
+        while active:
+            results, late, errors = self._fan_out(query, {i: depth for i in active})
+            for i, retriever_results in results.items():
+                all_results[i] = retriever_results
+                depths[i] = depth
+            # 超时或出错的检索器保留上一轮的结果，不再加深
+            timed_out.extend(late)
+            failed.update(errors)
+            active = [
+                i for i in active
+                if i in results and len(results[i]) >= depth and depth < self.candidate_depth
+            ]
+            if not active or self._top_k_settled(all_results, depths, active, top_k):
+                break
+            depth = min(2 * depth, self.candidate_depth)
+        return all_results, sorted(timed_out), failed, depths
+    
+    def _top_k_settled(self, all_results: List[List[Dict]], depths: List[int], active: List[int], top_k: int) -> bool:
+        """
+        判断加深候选是否还会改变加权RRF的前k个结果
+        活跃检索器i中尚未出现的文档，从该检索器最多还能得到 w_i / (k + depth_i + 1)；
+        当前前k个文档在所有活跃检索器中都已出现（得分不会再变），且其余文档（包括尚未出现的）
+        得分上界都严格小于第k名的得分时，结果已经确定
+        """
+        weights = self.weights or [1.0] * len(self.retrievers)
+        bounds = {i: weights[i] / (self.k + depths[i] + 1) for i in active}
+        scores = {}
+        present = {}  # {文档编号: 出现过的检索器下标集合}
+        for i, results in enumerate(all_results):
+            for rank, result in enumerate(results, 1):
+                doc_id = document_id(result['document'])
+                lists = present.setdefault(doc_id, set())
+                if i in lists:
+                    continue
+                lists.add(i)
+                scores[doc_id] = scores.get(doc_id, 0.0) + weights[i] / (self.k + rank)
+        if len(scores) < top_k:
+            return False
+        
+        def upper_bound(doc_id):
+            return scores[doc_id] + sum(bound for i, bound in bounds.items() if i not in present[doc_id])
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        if any(upper_bound(doc_id) > scores[doc_id] for doc_id in ranked[:top_k]):
+            return False
+        kth_score = scores[ranked[top_k - 1]]
+        best_outside = max([sum(bounds.values())] + [upper_bound(doc_id) for doc_id in ranked[top_k:]])
+        return best_outside < kth_score
     
     def rrf_score(self, rank: int) -> float:
         """
@@ -38,53 +262,36 @@ class RRF_Retriever:
         :param top_k: 返回结果数量
         :return: 融合后的检索结果列表
         """
-        # 收集所有检索器的结果
-        all_results = []
-        for i, retriever in enumerate(self.retrievers):
-            results = retriever.search(query, top_k=50)  # 获取较多候选结果
-            all_results.append(results)
-        
-        # 构建文档得分映射
-        doc_scores = {}  # {doc_id: [score1, score2, ...]}
-        
-        for i, results in enumerate(all_results):
-            for rank, result in enumerate(results):
-                doc = result['document']
-                doc_id = doc.get('id', str(hash(doc.get('content', ''))))
-                
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = [0.0] * len(self.retrievers)
-                
-                # 计算RRF得分并分配给对应检索器位置
-                rrf_score = self.rrf_score(rank + 1)
-                doc_scores[doc_id][i] = rrf_score
-        
-        # 计算每个文档的总得分
-        final_scores = {}
-        for doc_id, scores in doc_scores.items():
-            final_scores[doc_id] = sum(scores)
-        
-        # 排序并返回结果
-        sorted_docs = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
+        return self.search_with_report(query, top_k)['results']
+    
+    def search_with_report(self, query: str, top_k: int = 10) -> Dict[str, Any]:
+        """
+        执行融合检索，并报告哪些检索器超时或出错
+        :param query: 查询字符串
+        :param top_k: 返回结果数量
+        :return: {'results': 融合后的检索结果列表, 'timed_out': 超时的检索器下标列表,
+                  'failed': {抛出异常的检索器下标: 异常}, 'depths': 每个检索器使用的候选深度, 'elapsed_ms': 总耗时}
+        """
+        started = time.perf_counter()
+        if self.adaptive_depth and self.method == "rrf":
+            all_results, timed_out, failed, depths = self._adaptive_fan_out(query, top_k)
+        else:
+            # 并发收集所有检索器的结果，获取较多候选结果
+            results, timed_out, failed = self._fan_out(query, dict.fromkeys(range(len(self.retrievers)),
+                                                                            self.candidate_depth))
+            all_results = [results.get(i, []) for i in range(len(self.retrievers))]
+            depths = [self.candidate_depth if i in results else 0 for i in range(len(self.retrievers))]
         
-        # 构建最终结果
-        results = []
-        for doc_id, score in sorted_docs[:top_k]:
-            # 找到原始文档数据
-            for retriever_results in all_results:
-                for result in retriever_results:
-                    doc = result['document']
-                    if doc.get('id', str(hash(doc.get('content', '')))) == doc_id:
-                        results.append({
-                            'document': doc,
-                            'score': score
-                        })
-                        break
-                else:
-                    continue
-                break
+        results = fuse(all_results, top_k=top_k, method=self.method, weights=self.weights, k=self.k,
+                       normalization=self.normalization)
         
-        return results[:top_k]
+        return {
+            'results': results[:top_k],
+            'timed_out': timed_out,
+            'failed': failed,
+            'depths': depths,
+            'elapsed_ms': (time.perf_counter() - started) * 1000,
+        }
 
 
 # 示例使用
@@ -113,21 +320,33 @@ if __name__ == "__main__":
         }
     ]
     
+    import os
+    import sys
+    
+    # 添加检索器根目录到Python路径中
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+    
+    from text_analyzer import Analyzer
+    
     # 模拟不同的检索器
     class MockRetriever:
-        def __init__(self, name, documents):
+        def __init__(self, name, documents, analyzer=None):
             self.name = name
             self.documents = documents
+            self.analyzer = analyzer or Analyzer(lowercase=True)
+            # 建索引时分词一次，查询时只需做集合运算
+            self.doc_words = [
+                (set(self.analyzer.analyze(doc['title'], cache=False)),
+                 set(self.analyzer.analyze(doc['content'], cache=False)))
+                for doc in documents
+            ]
         
         def search(self, query, top_k=10):
             # 简单模拟，基于标题匹配返回结果
             results = []
-            query_words = set(query.lower().split())
+            query_words = set(self.analyzer.analyze(query))
             
-            for doc in self.documents:
-                title_words = set(doc['title'].lower().split())
-                content_words = set(doc['content'].lower().split())
-                
+            for doc, (title_words, content_words) in zip(self.documents, self.doc_words):
                 # 计算匹配得分
                 title_matches = len(query_words.intersection(title_words))
                 content_matches = len(query_words.intersection(content_words))
@@ -142,9 +361,10 @@ if __name__ == "__main__":
             results.sort(key=lambda x: x['score'], reverse=True)
             return results[:top_k]
     
-    # 创建模拟检索器
-    retriever1 = MockRetriever("KeywordRetriever", sample_documents)
-    retriever2 = MockRetriever("SemanticRetriever", sample_documents)
+    # 创建模拟检索器，共享同一个分析器，相同文本只分词一次
+    analyzer = Analyzer(lowercase=True)
+    retriever1 = MockRetriever("KeywordRetriever", sample_documents, analyzer)
+    retriever2 = MockRetriever("SemanticRetriever", sample_documents, analyzer)
     
     # 创建RRF检索器
     rrf_retriever = RRF_Retriever([retriever1, retriever2])
@@ -152,6 +372,7 @@ if __name__ == "__main__":
     # 执行检索
     query = "machine learning artificial intelligence"
     results = rrf_retriever.search(query, top_k=3)
+    rrf_retriever.close()
     
     print(f"Query: {query}")
     print("RRF Retrieval Results:")
@@ -2,21 +2,99 @@
 Text Similarity Reranker（文本相似度重排检索器）示例脚本
 功能：
 1. 使用机器学习模型根据语义相似性对文档重新排名
+2. 语料拟合模式：在整个语料上拟合一次向量化器并按文档编号缓存文档向量，
+   重排时只向量化查询，用一次稀疏矩阵乘法为所有候选打分
 """
 
+import os
+import sys
+
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+# 添加检索器根目录到Python路径中
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from hybrid_retriever.rank_fusion import document_id
+from vector_retriever.tfidf_index import compact_matrix, create_vectorizer, memory_report, release_vocabulary_stats
+
 
 class TextSimilarityReranker:
-    def __init__(self, base_retriever=None):
+    def __init__(self, base_retriever=None, min_df=1, max_df=1.0, max_features=None, low_memory=False, corpus=None):
         """
         初始化文本相似度重排器
         :param base_retriever: 基础检索器
+        :param min_df: 文档频率下限，低于该值的词不进入词表
+        :param max_df: 文档频率上限，高于该值的词不进入词表
+        :param max_features: 词表最多保留的词数
+        :param low_memory: 是否以float32数据和int32下标存储向量
+        :param corpus: 语料文档列表，提供时在语料上拟合一次并缓存文档向量；为None时每次重排在候选上重新拟合
         """
         self.base_retriever = base_retriever
-        self.vectorizer = TfidfVectorizer()
+        self.low_memory = low_memory
+        self.vectorizer = create_vectorizer(min_df, max_df, max_features, low_memory)
+        self.document_vectors = None  # 语料拟合模式下缓存的文档向量
+        self.row_ids = {}  # {文档编号: document_vectors中的行号}
+        if corpus is not None:
+            self.fit(corpus)
+    
+    def fit(self, documents):
+        """
+        在语料上拟合向量化器，并按文档编号缓存每个文档的向量
+        :param documents: 语料文档列表
+        """
+        documents = list(documents)
+        self.document_vectors = self.vectorizer.fit_transform([doc.get('content', '') for doc in documents])
+        if self.low_memory:
+            self.document_vectors = compact_matrix(self.document_vectors)
+            release_vocabulary_stats(self.vectorizer)
+        self.row_ids = {}
+        for row, doc in enumerate(documents):
+            self.row_ids.setdefault(document_id(doc), row)
+    
+    def _corpus_similarities(self, query, documents):
+        """
+        语料拟合模式下计算查询与候选文档的余弦相似度（向量已L2归一化，点积即余弦相似度）
+        语料中的文档直接取缓存的向量；不在语料中的文档只在本次请求内用已拟合的向量化器转换，
+        不写入缓存，缓存大小不随请求增长，并发重排也不会修改共享状态
+        :param query: 查询字符串
+        :param documents: 候选文档列表
+        :return: 与候选文档一一对应的相似度数组
+        """
+        query_vector = self.vectorizer.transform([query])
+        rows = np.array([self.row_ids.get(document_id(doc), -1) for doc in documents], dtype=np.int64)
+        cached = rows >= 0
+        similarities = np.zeros(len(documents), dtype=np.float64)
+        if cached.any():
+            similarities[cached] = (self.document_vectors[rows[cached]] @ query_vector.T).toarray().ravel()
+        if not cached.all():
+            missing = np.flatnonzero(~cached)
+            vectors = self.vectorizer.transform([documents[i].get('content', '') for i in missing])
+            similarities[missing] = (vectors @ query_vector.T).toarray().ravel()
+        return similarities
+    
+    def _similarities(self, query, documents):
+        """
+        计算查询与候选文档的余弦相似度
+        语料拟合模式下只向量化查询和不在语料中的候选；否则在查询和候选文档上重新拟合向量化器
+        """
+        if self.document_vectors is not None:
+            return self._corpus_similarities(query, documents)
+        
+        # 提取文档内容
+        doc_contents = [doc.get('content', '') for doc in documents]
+        
+        # 向量化查询和文档
+        all_texts = [query] + doc_contents
+        tfidf_matrix = self.vectorizer.fit_transform(all_texts)
+        if self.low_memory:
+            tfidf_matrix = compact_matrix(tfidf_matrix)
+            release_vocabulary_stats(self.vectorizer)
+        
+        # 计算查询与文档之间的相似度
+        query_vector = tfidf_matrix[0]
+        doc_vectors = tfidf_matrix[1:]
+        return cosine_similarity(query_vector, doc_vectors).flatten()
     
     def rerank(self, query, documents):
         """
@@ -28,18 +106,8 @@ class TextSimilarityReranker:
         if not documents:
             return []
         
-        # 提取文档内容
-        doc_contents = [doc.get('content', '') for doc in documents]
-        
-        # 向量化查询和文档
         try:
-            all_texts = [query] + doc_contents
-            tfidf_matrix = self.vectorizer.fit_transform(all_texts)
-            
-            # 计算查询与文档之间的相似度
-            query_vector = tfidf_matrix[0]
-            doc_vectors = tfidf_matrix[1:]
-            similarities = cosine_similarity(query_vector, doc_vectors).flatten()
+            similarities = self._similarities(query, documents)
             
             # 结合原始得分和相似度得分
             reranked_docs = []
@@ -65,6 +133,13 @@ class TextSimilarityReranker:
             print(f"Reranking error: {e}")
             return [{'document': doc, 'score': doc.get('score', 0)} for doc in documents]
     
+    def memory_usage(self):
+        """
+        统计向量化器的内存占用（词表和IDF，按最近一次拟合的结果；语料拟合模式下包括缓存的文档向量）
+        :return: 各部分字节数
+        """
+        return memory_report(self.vectorizer, self.document_vectors)
+    
     def search(self, query, top_k=10):
         """
         执行带重排的检索
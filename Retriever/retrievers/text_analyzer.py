@@ -0,0 +1,172 @@
+"""
+Text Analyzer（文本分析器）
+功能：
+1. 为关键词检索器提供统一的分词流程：空格分词或jieba中文分词、小写化、停用词过滤
+2. 以内容哈希为键的有界LRU缓存，相同文本只分词一次
+3. 使用进程池批量分词，加速大语料的建索引过程
+
+多个检索器共享同一个 Analyzer 实例时，也共享它的分词缓存
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 支持的分词方式
+TOKENIZERS = ("whitespace", "jieba")
+
+
+class Analyzer:
+    def __init__(self, tokenizer="whitespace", lowercase=False, stopwords=None, cache_size=10000):
+        """
+        初始化文本分析器
+        :param tokenizer: 分词方式，"whitespace" 按空白字符切分，"jieba" 使用jieba中文分词
+        :param lowercase: 是否在分词前转为小写
+        :param stopwords: 停用词集合，分词后过滤
+        :param cache_size: 分词缓存最多保存的文本数，为0时不缓存
+        """
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"不支持的分词方式: {tokenizer}，可选值为 {TOKENIZERS}")
+        self.tokenizer = tokenizer
+        self.lowercase = lowercase
+        self.stopwords = frozenset(stopwords or ())
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # {内容哈希: 分词结果}
+        self._lock = threading.Lock()
+        self.hits = 0  # 缓存命中次数
+        self.misses = 0  # 缓存未命中次数
+
+    def __getstate__(self):
+        """传给子进程时不携带缓存和锁"""
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text):
+        """以内容哈希作为缓存键，避免在缓存中保存完整的长文本"""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def _tokenize(self, text):
+        """不经过缓存的分词"""
+        if self.lowercase:
+            text = text.lower()
+
+        if self.tokenizer == "jieba":
+            try:
+                import jieba
+            except ImportError as e:
+                raise ImportError("使用jieba分词需要先安装: pip install jieba") from e
+            tokens = [token.strip() for token in jieba.lcut(text)]
+            tokens = [token for token in tokens if token]
+        else:
+            tokens = text.split()
+
+        if self.stopwords:
+            tokens = [token for token in tokens if token not in self.stopwords]
+        return tuple(tokens)
+
+    def _cache_get(self, key):
+        """读取缓存并更新最近使用顺序"""
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return tokens
+
+    def _cache_put(self, key, tokens):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[key] = tokens
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def analyze(self, text, cache=True):
+        """
+        分词
+        :param text: 文本
+        :param cache: 是否经过分词缓存；建索引时逐篇分词的文档通常不会再被查询，应传 False
+        :return: 词元组（不可变，可在多个检索器之间安全共享）
+        """
+        if not cache:
+            return self._tokenize(text)
+        key = self._key(text)
+        tokens = self._cache_get(key)
+        if tokens is None:
+            tokens = self._tokenize(text)
+            self._cache_put(key, tokens)
+        return tokens
+
+    def analyze_many(self, texts, workers=None, chunksize=256, cache=False):
+        """
+        批量分词，缓存未命中的文本可以分发到进程池并行处理
+        :param texts: 文本列表
+        :param workers: 进程数，为None或1时在当前进程中串行处理
+        :param chunksize: 每次分发给子进程的文本数
+        :param cache: 是否读写分词缓存。批量分词多用于建索引，语料文档写入缓存只会挤掉查询，
+                      因此默认不经过缓存，也省去哈希和加锁的开销
+        :return: 与 texts 一一对应的词元组列表
+        """
+        results = [None] * len(texts)
+        pending = []  # [(下标, 缓存键)]
+        for i, text in enumerate(texts):
+            if not cache:
+                pending.append((i, None))
+                continue
+            key = self._key(text)
+            tokens = self._cache_get(key)
+            if tokens is None:
+                pending.append((i, key))
+            else:
+                results[i] = tokens
+
+        pending_texts = [texts[i] for i, _ in pending]
+        if workers and workers > 1 and len(pending_texts) > chunksize:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                analyzed = list(executor.map(self._tokenize, pending_texts, chunksize=chunksize))
+        else:
+            analyzed = [self._tokenize(text) for text in pending_texts]
+
+        for (i, key), tokens in zip(pending, analyzed):
+            results[i] = tokens
+            if cache:
+                self._cache_put(key, tokens)
+        return results
+
+    def cache_info(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._cache),
+                'max_size': self.cache_size,
+            }
+
+
+# 示例使用
+if __name__ == "__main__":
+    analyzer = Analyzer(lowercase=True, stopwords={"is", "a", "of"})
+    text = "Machine learning is a branch of Artificial Intelligence"
+    print(f"空格分词: {analyzer.analyze(text)}")
+    analyzer.analyze(text)
+    print(f"缓存统计: {analyzer.cache_info()}")
+
+    try:
+        chinese_analyzer = Analyzer(tokenizer="jieba", stopwords={"的", "是"})
+        print(f"jieba分词: {chinese_analyzer.analyze('机器学习是人工智能的一个分支')}")
+    except ImportError as e:
+        print(e)
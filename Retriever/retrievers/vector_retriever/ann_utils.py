@@ -0,0 +1,126 @@
+"""
+近似最近邻索引的公共工具
+功能：
+1. 向量按行L2归一化，HNSW 与 IVF-PQ 索引入库和查询时共用
+2. 精确检索的前k个结果，作为召回率的参照
+3. 召回率-延迟报告：在一组检索参数上对比近似检索与精确检索，检索方式由调用方传入
+4. 稀疏TF-IDF向量的降维：只在出现过的列上拟合TruncatedSVD，哈希特征空间很宽时拟合和投影的代价与空间大小无关
+"""
+
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+
+
+def normalize_rows(vectors):
+    """
+    按行L2归一化，零向量保持为零
+    :param vectors: 形状为 (n, dim) 的向量矩阵或单个向量
+    :return: 形状为 (n, dim) 的float32矩阵
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def exact_top_k(vectors, query, k):
+    """
+    精确检索内积最大的k个向量
+    :param vectors: 形状为 (n, dim) 的向量矩阵
+    :param query: 单个查询向量
+    :param k: 结果数
+    :return: 向量编号数组（无序）
+    """
+    sims = vectors @ query
+    if k < len(sims):
+        return np.argpartition(-sims, k - 1)[:k]
+    return np.arange(len(sims))
+
+
+def measure_recall_latency(approximate_search, exact_search, queries, k, param_grid):
+    """
+    对比近似检索与精确检索，统计每组检索参数下的召回率和单查询延迟
+    :param approximate_search: 近似检索函数 (query, k, **params) -> 文档编号序列，编号为负表示空位
+    :param exact_search: 精确检索函数 (query, k) -> 文档编号序列
+    :param queries: 查询序列，元素原样传给两个检索函数
+    :param k: 每个查询的结果数
+    :param param_grid: 检索参数列表，例如 [{"ef_search": 10}, {"ef_search": 100}]
+    :return: 每组参数一条记录的列表，包含参数本身、召回率、平均与P95延迟以及精确检索的平均延迟
+    """
+    if len(queries) == 0:
+        raise ValueError("召回率报告至少需要一个查询")
+    started = time.perf_counter()
+    exact = [set(np.asarray(exact_search(query, k)).tolist()) for query in queries]
+    exact_latency = (time.perf_counter() - started) / len(queries)
+    total = max(sum(len(expected) for expected in exact), 1)
+
+    report = []
+    for params in param_grid:
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, exact):
+            started = time.perf_counter()
+            found = approximate_search(query, k, **params)
+            latencies.append(time.perf_counter() - started)
+            hits += len(expected & set(np.asarray(found).tolist()))
+        report.append({
+            **params,
+            'recall': hits / total,
+            'latency_ms': float(np.mean(latencies) * 1000),
+            'p95_latency_ms': float(np.percentile(latencies, 95) * 1000),
+            'exact_latency_ms': exact_latency * 1000,
+        })
+    return report
+
+
+class SparseProjection:
+    def __init__(self, n_components, random_state=0):
+        """
+        稀疏向量的TruncatedSVD降维，只保留训练数据中出现过的列
+        未出现过的列在完整拟合时对应的分量也全为0，去掉后投影结果不变；
+        哈希特征空间（2**20列）中实际出现的列很少，拟合和投影都只在这些列上进行
+        :param n_components: 降维后的维度，不超过出现过的列数减1
+        :param random_state: TruncatedSVD的随机种子
+        """
+        self.n_components = n_components
+        self.random_state = random_state
+        self.columns = None  # 训练数据中出现过的列，升序
+        self.components = None  # 形状为 (出现过的列数, 维度) 的投影矩阵
+
+    def _restrict(self, vectors):
+        """把稀疏矩阵的列映射到出现过的列中的位置，其余列的值置为0"""
+        vectors = vectors.tocsr()
+        if len(self.columns) == 0:
+            return sparse.csr_matrix((vectors.shape[0], 0), dtype=vectors.dtype)
+        positions = np.minimum(np.searchsorted(self.columns, vectors.indices), len(self.columns) - 1)
+        data = np.where(self.columns[positions] == vectors.indices, vectors.data, 0)
+        return sparse.csr_matrix((data, positions, vectors.indptr), shape=(vectors.shape[0], len(self.columns)))
+
+    def fit(self, vectors):
+        """
+        在训练向量上拟合降维
+        :param vectors: 形状为 (n, 特征数) 的稀疏矩阵
+        :return: self
+        """
+        self.columns = np.unique(vectors.tocsr().indices)
+        if len(self.columns) < 2:
+            # TruncatedSVD 至少需要两列；只有一列时原样保留这一列，没有列时投影为一维零向量
+            self.components = np.ones((len(self.columns), 1), dtype=np.float32)
+            return self
+        n_components = min(self.n_components, len(self.columns) - 1)
+        svd = TruncatedSVD(n_components=n_components, random_state=self.random_state).fit(self._restrict(vectors))
+        self.components = svd.components_.T.astype(np.float32)
+        return self
+
+    def transform(self, vectors):
+        """
+        投影到低维空间
+        :param vectors: 形状为 (n, 特征数) 的稀疏矩阵
+        :return: 形状为 (n, 维度) 的float32稠密矩阵
+        """
+        return np.asarray(self._restrict(vectors) @ self.components, dtype=np.float32)
@@ -0,0 +1,93 @@
+"""
+分块精确kNN检索
+功能：
+1. 将文档矩阵按行切分为块，每块与查询做一次矩阵乘法，内存占用只与块大小有关
+2. 各块在线程池中并行计算（NumPy和SciPy的矩阵乘法会释放GIL），精确检索可以利用全部CPU核心；
+   查询和每个块都转换为float32后再相乘，float64矩阵只按块临时转换，不复制整个矩阵；
+   默认按文档数和线程数确定块大小，文档足够多时每个线程都能分到一块
+3. 每块只保留自己的前k个结果，最后合并各块的候选得到全局前k个，k由每次调用指定
+
+文档矩阵可以是稠密矩阵或CSR稀疏矩阵；CSR矩阵的块直接引用原矩阵的 data 和 indices，
+已是float32时不复制非零元素
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from vector_retriever.tfidf_index import csr_view
+
+
+# 自动确定块大小时的上下限：块太小时线程调度开销超过计算量，太大时相似度矩阵占用过多内存
+MIN_BLOCK_SIZE = 1024
+MAX_BLOCK_SIZE = 65536
+
+
+def _row_block(documents, start, end):
+    """
+    取出文档矩阵的第 start 到 end 行
+    CSR矩阵按 indptr 范围构造视图，只有长度为块行数的 indptr 需要新分配；稠密矩阵的切片本身就是视图
+    """
+    if not (sparse.issparse(documents) and documents.format == 'csr'):
+        return documents[start:end]
+    offset = documents.indptr[start]
+    stop = documents.indptr[end]
+    return csr_view(documents.data[offset:stop], documents.indices[offset:stop],
+                    documents.indptr[start:end + 1] - offset, (end - start, documents.shape[1]))
+
+
+def _block_top_k(queries, block, start, k):
+    """
+    计算一个文档块的相似度并保留每个查询的前k个
+    :return: (全局文档下标, 相似度)，形状均为 (q, min(k, 块大小))
+    """
+    similarities = queries @ block.astype(np.float32, copy=False).T
+    similarities = similarities.toarray() if sparse.issparse(similarities) else np.asarray(similarities)
+    local_k = min(k, similarities.shape[1])
+    if local_k < similarities.shape[1]:
+        indices = np.argpartition(-similarities, local_k - 1, axis=1)[:, :local_k]
+    else:
+        indices = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+    return indices + start, np.take_along_axis(similarities, indices, axis=1)
+
+
+def blocked_top_k(queries, documents, k, block_size=None, workers=None):
+    """
+    分块并行的精确内积检索（向量已L2归一化时即为余弦相似度）
+    :param queries: 形状为 (q, d) 的查询矩阵，稠密或稀疏
+    :param documents: 形状为 (n, d) 的文档矩阵，稠密或CSR稀疏
+    :param k: 每个查询返回的结果数
+    :param block_size: 每块的文档数，默认为 文档数 / 线程数，并限制在 [MIN_BLOCK_SIZE, MAX_BLOCK_SIZE] 之内
+    :param workers: 线程数，默认使用全部CPU核心；只有一块时不创建线程池
+    :return: (indices, similarities)，形状均为 (q, min(k, n))，按相似度从高到低排列，相似度相同时下标小的在前；
+        相似度为float32
+    """
+    queries = queries.astype(np.float32, copy=False)
+    n_queries, n_docs = queries.shape[0], documents.shape[0]
+    k = min(k, n_docs)
+    if k <= 0 or n_queries == 0:
+        return np.zeros((n_queries, 0), dtype=np.int64), np.zeros((n_queries, 0), dtype=np.float32)
+
+    workers = workers or os.cpu_count() or 1
+    if block_size is None:
+        block_size = min(max(math.ceil(n_docs / workers), MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+    starts = range(0, n_docs, block_size)
+    workers = min(workers, len(starts))
+
+    def run(start):
+        return _block_top_k(queries, _row_block(documents, start, min(start + block_size, n_docs)), start, k)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            blocks = list(executor.map(run, starts))
+    else:
+        blocks = [run(start) for start in starts]
+
+    # 合并各块的候选：每个查询最多 块数 * k 个，按 (相似度降序, 下标升序) 排序后取前k个
+    indices = np.concatenate([block_indices for block_indices, _ in blocks], axis=1)
+    similarities = np.concatenate([block_similarities for _, block_similarities in blocks], axis=1)
+    order = np.lexsort((indices, -similarities), axis=-1)[:, :k]
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(similarities, order, axis=1)
@@ -0,0 +1,253 @@
+"""
+HNSW（Hierarchical Navigable Small World）近似最近邻索引
+功能：
+1. 基于NumPy实现的分层可导航小世界图，按余弦相似度检索（向量入库时L2归一化，相似度即点积）
+2. 参数 M、ef_construction、ef_search 与常见实现（hnswlib、faiss）含义一致
+3. 支持增量插入，新向量直接连接到已有的图中，无需重建
+4. 提供与精确检索对比的召回率-延迟报告，用于选择 ef_search
+
+每次扩展节点时，所有未访问邻居的相似度通过一次矩阵向量乘法计算
+"""
+
+import heapq
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加检索器根目录到Python路径中；以脚本方式运行时还要移除脚本所在目录，
+# 否则本目录下的 vector_retriever.py 会遮蔽同名的 vector_retriever 包
+if __name__ == "__main__":
+    sys.path = [path for path in sys.path
+                if os.path.abspath(path or os.curdir) != os.path.dirname(os.path.abspath(__file__))]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from vector_retriever.ann_utils import exact_top_k, measure_recall_latency, normalize_rows
+
+
+class HNSWIndex:
+    def __init__(self, dim=None, M=16, ef_construction=200, ef_search=50, seed=0):
+        """
+        初始化HNSW索引
+        :param dim: 向量维度，为None时由第一次插入的向量确定
+        :param M: 每个节点在上层保留的邻居数，第0层保留 2 * M 个
+        :param ef_construction: 插入时每层搜索的候选集大小，越大图质量越高、建索引越慢
+        :param ef_search: 查询时第0层的候选集大小，越大召回率越高、查询越慢
+        :param seed: 随机层数生成的随机种子
+        """
+        if M < 2:
+            raise ValueError("M必须不小于2")
+        self.dim = dim
+        self.M = M
+        self.max_links0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(M)
+        self.rng = np.random.default_rng(seed)
+        self.vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self.size = 0
+        self.links = []  # links[节点][层] = 邻居节点列表
+        self.entry_point = None
+        self.max_level = -1
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, count):
+        """按倍增策略扩容向量数组，摊还插入代价"""
+        needed = self.size + count
+        if needed <= self.vectors.shape[0]:
+            return
+        capacity = max(needed, 2 * self.vectors.shape[0], 16)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        self.vectors = vectors
+
+    def _random_level(self):
+        """按指数分布随机生成节点的最高层"""
+        return int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+
+    def _search_layer(self, query, entry_points, ef, level):
+        """
+        在一层中从入口节点出发做贪心的最佳优先搜索
+        :return: [(相似度, 节点), ...]，长度不超过ef，无序
+        """
+        vectors = self.vectors
+        visited = set(entry_points)
+        entry_sims = vectors[entry_points] @ query
+        candidates = [(-float(sim), node) for sim, node in zip(entry_sims, entry_points)]
+        heapq.heapify(candidates)
+        results = [(float(sim), node) for sim, node in zip(entry_sims, entry_points)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            neighbors = [n for n in self.links[node][level] if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            sims = vectors[neighbors] @ query
+            for sim, neighbor in zip(sims.tolist(), neighbors):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def _select_neighbors(self, candidates, max_links):
+        """
+        启发式选择邻居：按相似度从高到低，只保留与已选邻居相比更接近目标的候选，
+        使邻居分布在不同方向上；不足max_links时再用剩余候选补齐
+        :param candidates: [(与目标的相似度, 节点), ...]
+        :return: 节点列表
+        """
+        ordered = sorted(candidates, reverse=True)
+        if len(ordered) <= max_links:
+            return [node for _, node in ordered]
+
+        nodes = [node for _, node in ordered]
+        # 一次计算候选之间的两两相似度，避免逐个候选访问向量
+        candidate_vectors = self.vectors[nodes]
+        pairwise = candidate_vectors @ candidate_vectors.T
+        closest_selected = np.full(len(nodes), -np.inf, dtype=np.float32)  # 每个候选与已选邻居的最大相似度
+        selected = []
+        pruned = []
+        for position, (sim, _) in enumerate(ordered):
+            if len(selected) >= max_links:
+                break
+            if closest_selected[position] > sim:
+                pruned.append(position)
+            else:
+                selected.append(position)
+                np.maximum(closest_selected, pairwise[position], out=closest_selected)
+        for position in pruned:
+            if len(selected) >= max_links:
+                break
+            selected.append(position)
+        return [nodes[position] for position in selected]
+
+    def add(self, vectors):
+        """
+        增量插入向量，节点编号按插入顺序从 len(index) 开始
+        :param vectors: 形状为 (n, dim) 的向量矩阵
+        :return: 新节点的编号数组
+        """
+        vectors = normalize_rows(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError("向量维度必须相同")
+
+        self._reserve(len(vectors))
+        start = self.size
+        for vector in vectors:
+            self._insert(vector)
+        return np.arange(start, self.size)
+
+    def _insert(self, vector):
+        """插入单个（已归一化的）向量"""
+        node = self.size
+        self.vectors[node] = vector
+        self.size += 1
+        level = self._random_level()
+        self.links.append([[] for _ in range(level + 1)])
+
+        if self.entry_point is None:
+            self.entry_point = node
+            self.max_level = level
+            return
+
+        # 在高于新节点层数的各层上贪心下降，找到更近的入口
+        entry = [self.entry_point]
+        for layer in range(self.max_level, level, -1):
+            nearest = max(self._search_layer(vector, entry, 1, layer))
+            entry = [nearest[1]]
+
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(vector, entry, self.ef_construction, layer)
+            max_links = self.max_links0 if layer == 0 else self.M
+            neighbors = self._select_neighbors(candidates, self.M)
+            self.links[node][layer] = neighbors
+            for neighbor in neighbors:
+                neighbor_links = self.links[neighbor][layer]
+                neighbor_links.append(node)
+                if len(neighbor_links) > max_links:
+                    # 邻居的连接数超限时，以该邻居为中心重新选择
+                    sims = self.vectors[neighbor_links] @ self.vectors[neighbor]
+                    self.links[neighbor][layer] = self._select_neighbors(
+                        list(zip(sims.tolist(), neighbor_links)), max_links
+                    )
+            entry = [candidate for _, candidate in candidates]
+
+        if level > self.max_level:
+            self.entry_point = node
+            self.max_level = level
+
+    def search(self, queries, k=10, ef_search=None):
+        """
+        近似检索余弦相似度最高的k个向量
+        :param queries: 形状为 (q, dim) 的查询矩阵或单个查询向量
+        :param k: 每个查询返回的结果数
+        :param ef_search: 本次检索使用的候选集大小，默认使用创建索引时的设置，实际取值不小于k
+        :return: (indices, similarities)，形状均为 (q, k')，k' = min(k, 索引大小)，按相似度从高到低排列，
+            图中可达节点不足k'个时编号为-1
+        """
+        queries = normalize_rows(queries)
+        k = min(k, self.size)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.zeros((len(queries), k), dtype=np.float32)
+        if k <= 0:
+            return indices, similarities
+
+        ef = max(ef_search or self.ef_search, k)
+        for row, query in enumerate(queries):
+            entry = [self.entry_point]
+            for layer in range(self.max_level, 0, -1):
+                entry = [max(self._search_layer(query, entry, 1, layer))[1]]
+            found = sorted(self._search_layer(query, entry, ef, 0), key=lambda item: (-item[0], item[1]))[:k]
+            indices[row, :len(found)] = [node for _, node in found]
+            similarities[row, :len(found)] = [sim for sim, _ in found]
+        return indices, similarities
+
+
+def recall_latency_report(index, queries, k=10, ef_values=(10, 20, 50, 100, 200)):
+    """
+    对比HNSW与精确检索，统计不同 ef_search 下的召回率和单查询延迟
+    :param index: HNSWIndex实例
+    :param queries: 形状为 (q, dim) 的查询矩阵
+    :param k: 每个查询的结果数
+    :param ef_values: 需要测试的 ef_search 取值
+    :return: 每个 ef_search 一条记录的列表，另含精确检索的延迟
+    """
+    vectors = index.vectors[:len(index)]
+    return measure_recall_latency(
+        lambda query, k, **params: index.search(query, k=k, **params)[0][0],
+        lambda query, k: exact_top_k(vectors, query, k),
+        normalize_rows(queries), min(k, len(index)), [{'ef_search': ef} for ef in ef_values],
+    )
+
+
+# 示例使用
+if __name__ == "__main__":
+    rng = np.random.default_rng(42)
+    data = rng.standard_normal((10000, 64)).astype(np.float32)
+    test_queries = rng.standard_normal((100, 64)).astype(np.float32)
+
+    index = HNSWIndex(M=16, ef_construction=100)
+    started = time.perf_counter()
+    index.add(data[:8000])
+    index.add(data[8000:])  # 增量插入
+    print(f"建索引: {len(index)} 个向量, {time.perf_counter() - started:.1f}s")
+
+    print(f"{'ef_search':>10} {'Recall@10':>10} {'平均延迟(ms)':>14} {'P95延迟(ms)':>12} {'精确检索(ms)':>14}")
+    for record in recall_latency_report(index, test_queries, k=10):
+        print(f"{record['ef_search']:>10} {record['recall']:>10.3f} {record['latency_ms']:>14.2f} "
+              f"{record['p95_latency_ms']:>12.2f} {record['exact_latency_ms']:>14.2f}")
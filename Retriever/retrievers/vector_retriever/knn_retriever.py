@@ -3,25 +3,103 @@ KNN Retriever（K近邻检索器）示例脚本
 功能：
 1. 替代knn搜索功能
 2. 返回kNN搜索中的顶级文档
+3. 增量模式：基于哈希向量化追加文档，无需重新拟合整个语料
+4. 近似最近邻后端：HNSW图索引或IVF-PQ压缩索引，查询延迟不随语料规模线性增长
+5. 精确检索按块在线程池中并行计算，每次检索可以指定任意的k
 """
 
+import os
+import sys
+
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.neighbors import NearestNeighbors
 
+# 添加检索器根目录到Python路径中；以脚本方式运行时还要移除脚本所在目录，
+# 否则本目录下的 vector_retriever.py 会遮蔽同名的 vector_retriever 包
+if __name__ == "__main__":
+    sys.path = [path for path in sys.path
+                if os.path.abspath(path or os.curdir) != os.path.dirname(os.path.abspath(__file__))]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from vector_retriever.ann_utils import SparseProjection, measure_recall_latency
+from vector_retriever.blocked_knn import blocked_top_k
+from vector_retriever.hnsw_index import HNSWIndex
+from vector_retriever.ivfpq_index import IVFPQIndex
+from vector_retriever.tfidf_index import IncrementalTfidf, compact_matrix, create_vectorizer, memory_report, release_vocabulary_stats
+
+
+# 支持的近似检索后端
+ANN_INDEXES = {
+    "hnsw": HNSWIndex,
+    "ivfpq": IVFPQIndex,
+}
+BACKENDS = ("exact",) + tuple(ANN_INDEXES)
+
+# 近似索引的默认参数，index_params 中的同名参数优先；
+# IVF-PQ 探查的倒排列表过少时召回率很低，默认比 IVFPQIndex 本身探查更多列表
+DEFAULT_INDEX_PARAMS = {
+    "hnsw": {},
+    "ivfpq": {"nprobe": 32},
+}
+
+# 近似得分有误差（降维或乘积量化）时，默认取 RESCORE_FACTOR * k 个候选做精确重排
+RESCORE_FACTOR = 10
+
+# 召回率-延迟报告默认测试的检索参数
+DEFAULT_SEARCH_PARAMS = {
+    "hnsw": [{"ef_search": ef} for ef in (10, 20, 50, 100, 200)],
+    "ivfpq": [{"nprobe": nprobe} for nprobe in (1, 2, 4, 8, 16, 32)],
+}
+
+# 建近似索引时每次转换为稠密向量的文档数
+DENSE_BLOCK_SIZE = 4096
+
 
 class KNNRetriever:
-    def __init__(self, documents=None, n_neighbors=5):
+    def __init__(self, documents=None, n_neighbors=5, incremental=False, min_df=1, max_df=1.0,
+                 max_features=None, low_memory=False, backend="exact", index_params=None, dense_dim=None,
+                 rescore_depth=None, block_size=None, workers=None):
         """
         初始化KNN检索器
         :param documents: 文档集合
-        :param n_neighbors: 邻居数量
+        :param n_neighbors: 默认的邻居数量，检索时可以通过 top_k 指定其他值
+        :param incremental: 是否使用增量TF-IDF，开启后 add_documents 只处理新文档
+        :param min_df: 文档频率下限，低于该值的词不进入词表
+        :param max_df: 文档频率上限，高于该值的词不进入词表
+        :param max_features: 词表最多保留的词数
+        :param low_memory: 是否以float32数据和int32下标存储文档向量
+        :param backend: 检索后端，"exact" 为精确检索，"hnsw" 为HNSW近似检索，"ivfpq" 为IVF-PQ压缩索引
+        :param index_params: 传给近似索引的参数，例如 HNSW 的 {"M": 16, "ef_construction": 200, "ef_search": 50}，
+            IVF-PQ 的 {"n_lists": 1024, "n_subvectors": 16, "nprobe": 32}，未指定的参数使用 DEFAULT_INDEX_PARAMS
+        :param dense_dim: 近似索引使用的稠密向量维度，设置后先用TruncatedSVD降维（只在出现过的特征上拟合）；
+            为None时直接使用TF-IDF向量（词表较大时应配合 max_features 使用）
+        :param rescore_depth: 近似检索取出后用TF-IDF向量精确重排的候选数，
+            默认在近似得分有误差（降维或乘积量化）时为 RESCORE_FACTOR * k，否则为 k
+        :param block_size: 精确检索时每块的文档数，默认按文档数和线程数自动确定
+        :param workers: 精确检索的线程数，默认使用全部CPU核心
         """
-        self.documents = documents or []
+        if backend not in BACKENDS:
+            raise ValueError(f"不支持的检索后端: {backend}，可选值为 {BACKENDS}")
+        if backend != "exact" and incremental and dense_dim is None:
+            raise ValueError("增量模式的哈希特征维度过高，近似检索后端需要设置 dense_dim")
+        self.documents = list(documents) if documents else []
+        self.max_neighbors = n_neighbors
         self.n_neighbors = min(n_neighbors, len(documents)) if documents else n_neighbors
-        self.vectorizer = TfidfVectorizer()
+        self.incremental = incremental
+        self.low_memory = low_memory
+        # norm='l2' 保证每个文档向量在入库时即被归一化
+        self.vectorizer = self._create_vectorizer(min_df, max_df, max_features)
         self.nn_model = NearestNeighbors(n_neighbors=self.n_neighbors, metric='cosine')
+        self.backend = backend
+        self.index_params = {**DEFAULT_INDEX_PARAMS.get(backend, {}), **(index_params or {})}
+        self.dense_dim = dense_dim
+        self.rescore_depth = rescore_depth
+        self.block_size = block_size
+        self.workers = workers
+        self.ann_index = None  # 近似最近邻索引，精确检索时为None
+        self.projection = None  # 降维模型，dense_dim为None时不使用
         self.document_vectors = None
+        self.normalized = False  # 文档向量是否已L2归一化
         self.fit()
     
     def fit(self):
@@ -29,31 +107,157 @@ class KNNRetriever:
         if self.documents:
             contents = [doc.get('content', '') for doc in self.documents]
             self.document_vectors = self.vectorizer.fit_transform(contents)
-            self.nn_model.fit(self.document_vectors)
+            self.normalized = self.vectorizer.norm == 'l2'
+            if self.low_memory:
+                self.document_vectors = compact_matrix(self.document_vectors)
+                release_vocabulary_stats(self.vectorizer)
+            if not self.normalized:
+                self.nn_model.fit(self.document_vectors)
+            self._build_index()
+    
+    def _build_index(self):
+        """按当前的文档向量重建近似最近邻索引"""
+        if self.backend == "exact":
+            return
+        self.ann_index = ANN_INDEXES[self.backend](**self.index_params)
+        self.projection = None
+        # 增量模式的文档矩阵不含IDF权重，近似索引需要完整的TF-IDF向量
+        vectors = self.vectorizer.tfidf_vectors(self.document_vectors) if self.incremental else self.document_vectors
+        if self.dense_dim is not None:
+            self.projection = SparseProjection(self.dense_dim).fit(vectors)
+        if isinstance(self.ann_index, IVFPQIndex):
+            # 聚类中心和码本在随机样本上训练，之后分块编码全部文档
+            sample_size = min(self.ann_index.train_size, vectors.shape[0])
+            sample = np.random.default_rng(0).choice(vectors.shape[0], sample_size, replace=False)
+            self.ann_index.train(self._dense(vectors[np.sort(sample)]))
+        self._add_to_index(vectors)
+    
+    def _add_to_index(self, vectors):
+        """分块转换为稠密向量后插入近似索引，避免一次性展开整个稀疏矩阵"""
+        for start in range(0, vectors.shape[0], DENSE_BLOCK_SIZE):
+            self.ann_index.add(self._dense(vectors[start:start + DENSE_BLOCK_SIZE]))
+    
+    def _dense(self, vectors):
+        """将TF-IDF稀疏向量转换为近似索引使用的float32稠密向量"""
+        dense = self.projection.transform(vectors) if self.projection is not None else vectors.toarray()
+        return np.asarray(dense, dtype=np.float32)
+    
+    def _create_vectorizer(self, min_df, max_df, max_features):
+        """创建向量化器，增量模式使用哈希特征，没有可裁剪的词表"""
+        if not self.incremental:
+            return create_vectorizer(min_df, max_df, max_features, self.low_memory)
+        if min_df != 1 or max_df != 1.0 or max_features is not None:
+            raise ValueError("增量模式使用哈希特征，不支持 min_df / max_df / max_features 词表裁剪")
+        return IncrementalTfidf(dtype=np.float32 if self.low_memory else np.float64)
+    
+    def add_documents(self, documents):
+        """
+        追加文档
+        增量模式下只向量化并归一化新文档，IDF在检索时由查询一侧应用；
+        否则在全部文档上重新训练
+        :param documents: 待添加的文档列表
+        """
+        documents = list(documents)
+        self.documents.extend(documents)
+        self.n_neighbors = min(self.max_neighbors, len(self.documents))
+        if not self.incremental:
+            self.nn_model = NearestNeighbors(n_neighbors=self.n_neighbors, metric='cosine')
+            self.fit()
+            return
+        contents = [doc.get('content', '') for doc in documents]
+        self.vectorizer.partial_fit(contents)
+        self.document_vectors = None
+        self.normalized = True
+        if self.backend == "exact":
+            return
+        if self.ann_index is None:
+            # 创建时没有文档，近似索引在第一批文档上建立（IVF-PQ 的聚类中心和码本也在这批文档上训练）
+            self._refresh_vectors()
+            self._build_index()
+        else:
+            # 新文档直接插入图中；已有文档的向量不随IDF变化更新，检索时由精确重排修正得分
+            self._add_to_index(self.vectorizer.transform(contents))
+    
+    def _refresh_vectors(self):
+        """增量模式下取回文档矩阵（缓冲区上的视图，文档集合未变化时直接复用）"""
+        if self.incremental and self.document_vectors is None:
+            self.document_vectors = self.vectorizer.document_vectors
+    
+    def _scoring_vectors(self, query_vectors):
+        """增量模式的文档矩阵不含IDF权重，由查询一侧补乘"""
+        return self.vectorizer.query_weights(query_vectors) if self.incremental else query_vectors
+    
+    def memory_usage(self):
+        """
+        统计索引的内存占用
+        :return: 文档向量矩阵、词表和向量化器状态的字节数
+        """
+        self._refresh_vectors()
+        return memory_report(self.vectorizer, self.document_vectors)
+    
+    def _kneighbors(self, query_vector, k):
+        """
+        查找与查询向量余弦距离最近的k个文档
+        :param query_vector: 查询的TF-IDF稀疏向量
+        :param k: 邻居数量
+        :return: (距离数组, 文档下标数组)，按距离从小到大排列
+        """
+        if self.ann_index is not None:
+            return self._ann_kneighbors(query_vector, k)
+        return self._exact_kneighbors(query_vector, k)
+    
+    def _ann_kneighbors(self, query_vector, k, **search_params):
+        """
+        近似检索候选后，用TF-IDF向量精确计算候选的余弦距离并重排
+        :param search_params: 传给近似索引 search 的参数，例如 ef_search
+        """
+        lossy = self.projection is not None or self.backend == "ivfpq"
+        depth = self.rescore_depth or (RESCORE_FACTOR * k if lossy else k)
+        candidates, _ = self.ann_index.search(self._dense(query_vector), k=max(depth, k), **search_params)
+        return self._rescore(query_vector, candidates[0][candidates[0] >= 0], k)
+    
+    def _rescore(self, query_vector, candidates, k):
+        """用文档矩阵原本的精度计算候选的余弦距离，按距离从小到大取前k个，距离相同时下标小的在前"""
+        similarities = (self.document_vectors[candidates] @ self._scoring_vectors(query_vector).T).toarray().ravel()
+        order = np.lexsort((candidates, -similarities))[:k]
+        return 1 - similarities[order], candidates[order]
+    
+    def _exact_kneighbors(self, query_vector, k):
+        """精确检索：与所有文档计算余弦距离，文档按块并行计算"""
+        if not self.normalized:
+            distances, indices = self.nn_model.kneighbors(query_vector, n_neighbors=k)
+            return distances[0], indices[0]
+        
+        # 单位向量的余弦距离为 1 - 点积，无需像 metric='cosine' 那样每次重新归一化；
+        # 分块检索以float32计算，选出的k个文档再按文档矩阵的精度重算得分
+        indices, _ = blocked_top_k(self._scoring_vectors(query_vector), self.document_vectors, k,
+                                   block_size=self.block_size, workers=self.workers)
+        return self._rescore(query_vector, indices[0], k)
     
     def search(self, query, top_k=None):
         """
         执行KNN检索
         :param query: 查询字符串
-        :param top_k: 返回结果数量（默认使用n_neighbors）
+        :param top_k: 返回结果数量（默认使用n_neighbors），不超过文档总数
         :return: 检索结果列表
         """
-        if not self.document_vectors:
+        self._refresh_vectors()
+        if self.document_vectors is None:
             return []
         
         if top_k is None:
             top_k = self.n_neighbors
         
-        top_k = min(top_k, self.n_neighbors)
+        top_k = min(top_k, len(self.documents))
         
         # 将查询转换为向量
         query_vector = self.vectorizer.transform([query])
         
         # 查找最近邻
-        distances, indices = self.nn_model.kneighbors(query_vector, n_neighbors=top_k)
+        distances, indices = self._kneighbors(query_vector, top_k)
         
         results = []
-        for i, (distance, index) in enumerate(zip(distances[0], indices[0])):
+        for i, (distance, index) in enumerate(zip(distances, indices)):
             # 转换距离为相似度分数（距离越小相似度越高）
             similarity = 1 - distance
             results.append({
@@ -65,6 +269,25 @@ class KNNRetriever:
         # 按相似度排序
         results.sort(key=lambda x: x['score'], reverse=True)
         return results
+    
+    def recall_report(self, queries, top_k=None, search_params=None):
+        """
+        对比近似检索与精确检索，统计不同检索参数下的召回率和单查询延迟
+        :param queries: 查询字符串列表
+        :param top_k: 每个查询的结果数（默认使用n_neighbors）
+        :param search_params: 检索参数列表，例如 [{"ef_search": 10}, {"ef_search": 100}]，默认按后端选择
+        :return: 每组参数一条记录的列表
+        """
+        if self.ann_index is None:
+            raise ValueError("召回率报告需要近似检索后端")
+        self._refresh_vectors()
+        k = min(top_k or self.n_neighbors, len(self.documents))
+        query_vectors = [self.vectorizer.transform([query]) for query in queries]
+        return measure_recall_latency(
+            lambda query_vector, k, **params: self._ann_kneighbors(query_vector, k, **params)[1],
+            lambda query_vector, k: self._exact_kneighbors(query_vector, k)[1],
+            query_vectors, k, search_params or DEFAULT_SEARCH_PARAMS[self.backend],
+        )
 
 
 # 示例使用
@@ -110,4 +333,13 @@ if __name__ == "__main__":
     for i, result in enumerate(results, 1):
         doc = result['document']
         print(f"{i}. {doc['title']} (Similarity: {result['score']:.4f}, Distance: {result['distance']:.4f})")
-        print(f"   {doc['content'][:100]}...")
\ No newline at end of file
+        print(f"   {doc['content'][:100]}...")
+
+    # 使用近似检索后端，并与精确检索对比召回率和延迟
+    for backend in ("hnsw", "ivfpq"):
+        ann_retriever = KNNRetriever(sample_documents, n_neighbors=3, backend=backend)
+        print(f"\n{backend.upper()} Recall Report:")
+        for record in ann_retriever.recall_report([query, "neural networks"]):
+            params = ", ".join(f"{key}={record[key]}" for key in ("ef_search", "nprobe") if key in record)
+            print(f"{params}: recall={record['recall']:.3f}, "
+                  f"latency={record['latency_ms']:.3f}ms, exact={record['exact_latency_ms']:.3f}ms")
@@ -0,0 +1,292 @@
+"""
+增量TF-IDF向量化
+功能：
+1. 使用哈希向量化（HashingVectorizer）代替固定词表，新文档无需重新拟合即可向量化
+2. 维护逐特征的文档频率计数，追加文档的代价只与新文档数量成正比
+3. 文档矩阵只保存按行缩放到单位TF-IDF模长的词频，IDF在查询一侧应用，IDF变化时无需重新加权整个语料；
+   文档数比上次整体归一化时增长超过 renormalize_growth 后，才就地重算旧文档的模长，
+   此时结果与 TfidfVectorizer(norm='l2') 一致（哈希冲突除外）
+4. 低内存索引：按 min_df / max_df / max_features 裁剪词表，稀疏矩阵以float32数据和int32下标存储，并统计内存占用
+"""
+
+import sys
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+def create_vectorizer(min_df=1, max_df=1.0, max_features=None, low_memory=False):
+    """
+    创建输出L2归一化向量的TF-IDF向量化器
+    :param min_df: 文档频率下限（整数为文档数，小数为比例），低于该值的词不进入词表
+    :param max_df: 文档频率上限（整数为文档数，小数为比例），高于该值的词不进入词表
+    :param max_features: 词表最多保留的词数，按语料中的词频从高到低选取
+    :param low_memory: 是否以float32存储向量
+    :return: TfidfVectorizer实例
+    """
+    return TfidfVectorizer(norm='l2', min_df=min_df, max_df=max_df, max_features=max_features,
+                           dtype=np.float32 if low_memory else np.float64)
+
+
+def compact_matrix(matrix):
+    """
+    将CSR矩阵转换为float32数据和int32下标，非零元素过多无法用int32表示时保留原下标类型
+    :param matrix: 稀疏矩阵
+    :return: CSR矩阵
+    """
+    matrix = matrix.tocsr().astype(np.float32, copy=False)
+    if matrix.nnz < np.iinfo(np.int32).max and matrix.shape[1] < np.iinfo(np.int32).max:
+        matrix.indices = matrix.indices.astype(np.int32, copy=False)
+        matrix.indptr = matrix.indptr.astype(np.int32, copy=False)
+    return matrix
+
+
+def csr_view(data, indices, indptr, shape):
+    """
+    用已有数组构造CSR矩阵，不复制数据
+    csr_matrix 构造函数会复制长度不足底层数组一半的切片（prune），因此先创建空矩阵再直接替换三个数组；
+    调用方需保证 indptr 从0开始且每行的列下标有序
+    :param data: 非零元素数组
+    :param indices: 列下标数组
+    :param indptr: 行指针数组
+    :param shape: 矩阵形状
+    :return: 引用传入数组的CSR矩阵
+    """
+    matrix = sparse.csr_matrix(shape, dtype=data.dtype)
+    matrix.data, matrix.indices, matrix.indptr = data, indices, indptr
+    return matrix
+
+
+def release_vocabulary_stats(vectorizer):
+    """
+    释放 TfidfVectorizer 为调试保留的被裁剪词集合（stop_words_），该集合在词表裁剪后可能远大于词表本身
+    新版 scikit-learn 已不再保存该属性，此时不做任何操作
+    """
+    if getattr(vectorizer, 'stop_words_', None) is not None:
+        vectorizer.stop_words_ = None
+
+
+def memory_report(vectorizer, matrix):
+    """
+    统计TF-IDF索引的内存占用（字节）
+    :param vectorizer: TfidfVectorizer 或 IncrementalTfidf
+    :param matrix: 文档向量稀疏矩阵，可以为None
+    :return: 包含文档数、特征数、非零元素数及各部分字节数的字典
+    """
+    report = {
+        'n_documents': 0,
+        'n_features': 0,
+        'nnz': 0,
+        'data_bytes': 0,
+        'index_bytes': 0,
+        'vocabulary_terms': 0,
+        'vocabulary_bytes': 0,
+        'vectorizer_bytes': 0,
+    }
+    if matrix is not None:
+        report['n_documents'], report['n_features'] = matrix.shape
+        report['nnz'] = matrix.nnz
+        report['data_bytes'] = matrix.data.nbytes
+        report['index_bytes'] = matrix.indices.nbytes + matrix.indptr.nbytes
+
+    vocabulary = getattr(vectorizer, 'vocabulary_', None)
+    if vocabulary is not None:
+        # 词表是 {词: 列号} 字典，按字典本身和其中的字符串、整数对象估算
+        report['vocabulary_terms'] = len(vocabulary)
+        report['vocabulary_bytes'] = sys.getsizeof(vocabulary) + sum(
+            sys.getsizeof(term) + sys.getsizeof(column) for term, column in vocabulary.items()
+        )
+    idf = getattr(vectorizer, 'idf_', None)
+    if idf is not None:
+        report['vectorizer_bytes'] += idf.nbytes
+    stop_words = getattr(vectorizer, 'stop_words_', None)
+    if stop_words:
+        report['vectorizer_bytes'] += sys.getsizeof(stop_words) + sum(sys.getsizeof(term) for term in stop_words)
+    if hasattr(vectorizer, 'memory_usage'):
+        # IncrementalTfidf 额外保存文档频率计数和缓冲区的预留空间
+        report['vectorizer_bytes'] += vectorizer.memory_usage()
+
+    report['total_bytes'] = (report['data_bytes'] + report['index_bytes']
+                             + report['vocabulary_bytes'] + report['vectorizer_bytes'])
+    return report
+
+
+class IncrementalTfidf:
+    def __init__(self, n_features=2 ** 20, smooth_idf=True, dtype=np.float64, renormalize_growth=0.1):
+        """
+        初始化增量TF-IDF向量化器
+        :param n_features: 哈希空间大小，越大哈希冲突越少
+        :param smooth_idf: 是否平滑IDF，与 TfidfVectorizer 的同名参数含义相同
+        :param dtype: 词频和文档向量的数据类型
+        :param renormalize_growth: 文档数比上次整体归一化时增长超过该比例后，按当前IDF重算所有文档的模长；
+            在此之前旧文档沿用追加时的IDF计算的模长，得分有轻微漂移。为0时每次文档变化后都重算
+        """
+        self.n_features = n_features
+        self.smooth_idf = smooth_idf
+        self.dtype = dtype
+        self.renormalize_growth = renormalize_growth
+        # 分词规则与 TfidfVectorizer 的默认设置相同，输出原始词频
+        self.hasher = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None, dtype=dtype)
+        self.norm = 'l2'
+        self.reset()
+
+    def reset(self):
+        """清空所有文档和统计量"""
+        self.doc_freqs = np.zeros(self.n_features, dtype=np.int64)  # 每个特征的文档频率
+        self.n_docs = 0
+        self.nnz = 0
+        # 文档矩阵的CSR缓冲区，按倍增策略扩容，追加文档的摊还代价只与新文档成正比
+        self._data = np.empty(0, dtype=self.dtype)
+        self._indices = np.empty(0, dtype=np.int32)
+        self._indptr = np.zeros(1, dtype=np.int32)
+        self._normalized_docs = 0  # 上次整体归一化时的文档数
+
+    def _reserve(self, n_rows, nnz):
+        """为追加的行预留缓冲区空间，非零元素过多时下标改用int64"""
+        index_dtype = self._indices.dtype
+        if self.nnz + nnz >= np.iinfo(np.int32).max:
+            index_dtype = np.dtype(np.int64)
+        if self.nnz + nnz > len(self._data) or index_dtype != self._indices.dtype:
+            capacity = max(self.nnz + nnz, 2 * len(self._data), 1024)
+            self._data = self._grow(self._data, capacity, self.nnz, self._data.dtype)
+            self._indices = self._grow(self._indices, capacity, self.nnz, index_dtype)
+        if self.n_docs + n_rows + 1 > len(self._indptr) or index_dtype != self._indptr.dtype:
+            capacity = max(self.n_docs + n_rows + 1, 2 * len(self._indptr), 1024)
+            self._indptr = self._grow(self._indptr, capacity, self.n_docs + 1, index_dtype)
+
+    @staticmethod
+    def _grow(buffer, capacity, used, dtype):
+        """分配更大的缓冲区并复制已使用的部分"""
+        grown = np.empty(capacity, dtype=dtype)
+        grown[:used] = buffer[:used]
+        return grown
+
+    def _row_norms(self, data, indices, indptr):
+        """各行按当前IDF加权后的L2模长"""
+        weighted = np.square(data * self.idf_of(indices))
+        lengths = np.diff(indptr)
+        norms = np.zeros(len(lengths), dtype=np.float64)
+        nonempty = lengths > 0
+        if weighted.size:
+            norms[nonempty] = np.add.reduceat(weighted, indptr[:-1][nonempty] - indptr[0])
+        norms = np.sqrt(norms)
+        norms[norms == 0] = 1.0
+        return np.repeat(norms, lengths)
+
+    def partial_fit(self, texts):
+        """
+        追加文档：只对新文档做哈希向量化、累加文档频率，并按当前IDF把新文档缩放到单位模长
+        :param texts: 文本列表
+        :return: self
+        """
+        counts = self.hasher.transform(texts).tocsr()
+        if counts.shape[0] == 0:
+            return self
+        counts.sum_duplicates()
+        # 合并重复项后每个 (文档, 特征) 只出现一次，只累加新文档出现过的特征，不遍历整个哈希空间
+        features, doc_counts = np.unique(counts.indices, return_counts=True)
+        self.doc_freqs[features] += doc_counts
+        n_rows = counts.shape[0]
+        self._reserve(n_rows, counts.nnz)
+        self.n_docs += n_rows
+
+        start, end = self.nnz, self.nnz + counts.nnz
+        self._data[start:end] = counts.data / self._row_norms(counts.data, counts.indices, counts.indptr)
+        self._indices[start:end] = counts.indices
+        self._indptr[self.n_docs - n_rows + 1:self.n_docs + 1] = counts.indptr[1:] + start
+        self.nnz = end
+        if not self._normalized_docs:
+            # 首批文档都按当前IDF归一化，无需再整体重算
+            self._normalized_docs = self.n_docs
+        return self
+
+    def fit_transform(self, texts):
+        """
+        从头拟合并返回文档矩阵
+        :param texts: 文本列表
+        :return: 文档矩阵，用法见 document_vectors
+        """
+        self.reset()
+        self.partial_fit(texts)
+        return self.document_vectors
+
+    def idf_of(self, features):
+        """
+        按当前文档集合计算指定特征的IDF，未出现过的特征权重为0
+        只计算传入的特征，代价与特征数成正比，与哈希空间大小无关
+        :param features: 特征下标数组
+        :return: 与 features 形状相同的IDF数组
+        """
+        doc_freqs = self.doc_freqs[features]
+        smooth = int(self.smooth_idf)
+        idf = np.log((self.n_docs + smooth) / np.maximum(doc_freqs + smooth, 1)) + 1
+        return np.where(doc_freqs > 0, idf, 0.0)
+
+    @property
+    def idf(self):
+        """当前文档集合上完整的IDF向量（长度为哈希空间大小，仅用于查看，检索时按需使用 idf_of）"""
+        return self.idf_of(np.arange(self.n_features))
+
+    def _apply_idf(self, matrix):
+        """返回按IDF加权的CSR矩阵副本，只计算非零元素所在特征的IDF"""
+        weighted = matrix.tocsr(copy=True)
+        weighted.data = weighted.data * self.idf_of(weighted.indices).astype(weighted.dtype, copy=False)
+        return weighted
+
+    def _weight(self, counts):
+        """对词频矩阵应用IDF权重并按行L2归一化"""
+        return normalize(self._apply_idf(counts), norm='l2', copy=False).tocsr()
+
+    def transform(self, texts):
+        """
+        使用当前的IDF将文本转换为L2归一化的TF-IDF向量
+        :param texts: 文本列表
+        :return: TF-IDF稀疏矩阵
+        """
+        return self._weight(self.hasher.transform(texts))
+
+    def query_weights(self, query_vectors):
+        """
+        将 transform 得到的查询向量再乘一次IDF，与 document_vectors 的点积即为余弦相似度
+        :param query_vectors: 查询的TF-IDF稀疏矩阵
+        :return: 稀疏矩阵
+        """
+        return self._apply_idf(query_vectors)
+
+    def tfidf_vectors(self, rows):
+        """
+        将 document_vectors 中的行还原为L2归一化的TF-IDF向量（例如用于降维或近似索引）
+        :param rows: document_vectors 的若干行
+        :return: TF-IDF稀疏矩阵
+        """
+        return self._weight(rows)
+
+    def renormalize(self):
+        """按当前IDF就地重算所有文档的模长，代价为一次遍历非零元素，不复制矩阵"""
+        if self.nnz:
+            data = self._data[:self.nnz]
+            indptr = self._indptr[:self.n_docs + 1]
+            data /= self._row_norms(data, self._indices[:self.nnz], indptr)
+        self._normalized_docs = self.n_docs
+
+    @property
+    def document_vectors(self):
+        """
+        所有文档的词频矩阵，每行已除以该文档按IDF加权后的L2模长（IDF本身不乘入），
+        与 query_weights 的结果做点积即得余弦相似度。返回的是缓冲区上的视图，不复制数据；
+        文档数比上次整体归一化时增长超过 renormalize_growth 后先就地重算旧文档的模长
+        """
+        if not self.n_docs:
+            return None
+        if self.n_docs > (1 + self.renormalize_growth) * self._normalized_docs:
+            self.renormalize()
+        return csr_view(self._data[:self.nnz], self._indices[:self.nnz], self._indptr[:self.n_docs + 1],
+                        (self.n_docs, self.n_features))
+
+    def memory_usage(self):
+        """文档频率计数和文档矩阵缓冲区中尚未使用的预留空间占用的字节数"""
+        spare = ((len(self._data) - self.nnz) * (self._data.itemsize + self._indices.itemsize)
+                 + (len(self._indptr) - self.n_docs - 1) * self._indptr.itemsize)
+        return self.doc_freqs.nbytes + spare
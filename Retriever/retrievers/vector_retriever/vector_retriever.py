@@ -2,22 +2,44 @@
 Vector Retriever（向量检索器）示例脚本
 功能：
 1. 密集型检索，基于向量相似度
+2. 增量模式：基于哈希向量化追加文档，无需重新拟合整个语料
 """
 
+import os
+import sys
+
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+# 添加检索器根目录到Python路径中；以脚本方式运行时还要移除脚本所在目录，
+# 否则本目录下的 vector_retriever.py 会遮蔽同名的 vector_retriever 包
+if __name__ == "__main__":
+    sys.path = [path for path in sys.path
+                if os.path.abspath(path or os.curdir) != os.path.dirname(os.path.abspath(__file__))]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from vector_retriever.tfidf_index import IncrementalTfidf, compact_matrix, create_vectorizer, memory_report, release_vocabulary_stats
+
 
 class VectorRetriever:
-    def __init__(self, documents=None):
+    def __init__(self, documents=None, incremental=False, min_df=1, max_df=1.0, max_features=None,
+                 low_memory=False):
         """
         初始化向量检索器
         :param documents: 文档集合
+        :param incremental: 是否使用增量TF-IDF，开启后 add_documents 只处理新文档
+        :param min_df: 文档频率下限，低于该值的词不进入词表
+        :param max_df: 文档频率上限，高于该值的词不进入词表
+        :param max_features: 词表最多保留的词数
+        :param low_memory: 是否以float32数据和int32下标存储文档向量
         """
-        self.documents = documents or []
-        self.vectorizer = TfidfVectorizer()
+        self.documents = list(documents) if documents else []
+        self.incremental = incremental
+        self.low_memory = low_memory
+        # norm='l2' 保证每个文档向量在入库时即被归一化
+        self.vectorizer = self._create_vectorizer(min_df, max_df, max_features)
         self.document_vectors = None
+        self.normalized = False  # 文档向量是否已L2归一化
         self.fit()
     
     def fit(self):
@@ -25,6 +47,66 @@ class VectorRetriever:
         if self.documents:
             contents = [doc.get('content', '') for doc in self.documents]
             self.document_vectors = self.vectorizer.fit_transform(contents)
+            self.normalized = self.vectorizer.norm == 'l2'
+            if self.low_memory:
+                self.document_vectors = compact_matrix(self.document_vectors)
+                release_vocabulary_stats(self.vectorizer)
+    
+    def _create_vectorizer(self, min_df, max_df, max_features):
+        """创建向量化器，增量模式使用哈希特征，没有可裁剪的词表"""
+        if not self.incremental:
+            return create_vectorizer(min_df, max_df, max_features, self.low_memory)
+        if min_df != 1 or max_df != 1.0 or max_features is not None:
+            raise ValueError("增量模式使用哈希特征，不支持 min_df / max_df / max_features 词表裁剪")
+        return IncrementalTfidf(dtype=np.float32 if self.low_memory else np.float64)
+    
+    def add_documents(self, documents):
+        """
+        追加文档
+        增量模式下只向量化并归一化新文档，IDF在检索时由查询一侧应用；
+        否则在全部文档上重新训练
+        :param documents: 待添加的文档列表
+        """
+        documents = list(documents)
+        self.documents.extend(documents)
+        if not self.incremental:
+            self.fit()
+            return
+        self.vectorizer.partial_fit([doc.get('content', '') for doc in documents])
+        self.document_vectors = None
+        self.normalized = True
+    
+    def _refresh_vectors(self):
+        """增量模式下取回文档矩阵（缓冲区上的视图，文档集合未变化时直接复用）"""
+        if self.incremental and self.document_vectors is None:
+            self.document_vectors = self.vectorizer.document_vectors
+    
+    def _scoring_vectors(self, query_vectors):
+        """增量模式的文档矩阵不含IDF权重，由查询一侧补乘"""
+        return self.vectorizer.query_weights(query_vectors) if self.incremental else query_vectors
+    
+    def memory_usage(self):
+        """
+        统计索引的内存占用
+        :return: 文档向量矩阵、词表和向量化器状态的字节数
+        """
+        self._refresh_vectors()
+        return memory_report(self.vectorizer, self.document_vectors)
+    
+    def _similarities(self, query_vectors, dense_output=True):
+        """
+        计算查询向量与所有文档向量的余弦相似度
+        :param query_vectors: 查询的TF-IDF稀疏矩阵
+        :param dense_output: 是否返回稠密矩阵，为False时返回CSR稀疏矩阵（只保存非零相似度）
+        :return: 形状为 (查询数, 文档数) 的相似度矩阵
+        """
+        self._refresh_vectors()
+        if not self.normalized:
+            return cosine_similarity(query_vectors, self.document_vectors, dense_output=dense_output)
+        
+        # 查询和文档向量均为单位向量，点积即余弦相似度，无需再计算模长
+        similarities = (self._scoring_vectors(query_vectors) @ self.document_vectors.T).tocsr()
+        return similarities.toarray() if dense_output else similarities
     
     def search(self, query, top_k=10):
         """
@@ -33,17 +115,18 @@ class VectorRetriever:
         :param top_k: 返回结果数量
         :return: 检索结果列表
         """
-        if not self.document_vectors:
+        self._refresh_vectors()
+        if self.document_vectors is None:
             return []
         
         # 将查询转换为向量
         query_vector = self.vectorizer.transform([query])
         
         # 计算余弦相似度
-        similarities = cosine_similarity(query_vector, self.document_vectors).flatten()
+        similarities = self._similarities(query_vector).flatten()
         
-        # 获取前top_k个结果
-        top_indices = similarities.argsort()[-top_k:][::-1]
+        # 获取前top_k个结果，只对候选部分排序
+        top_indices = self._top_k(similarities, top_k)
         
         results = []
         for i in top_indices:
@@ -54,6 +137,52 @@ class VectorRetriever:
                 })
         
         return results
+    
+    @staticmethod
+    def _top_k(scores, top_k):
+        """用 argpartition 选出得分最高的top_k个下标，按得分从高到低排列，得分相同时下标小的在前"""
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+    
+    def search_batch(self, queries, top_k=10, batch_size=1024):
+        """
+        批量执行向量检索
+        一次性转换一批查询，与文档矩阵做一次稀疏矩阵乘法，再对每行的非零相似度用 argpartition 选出top_k
+        :param queries: 查询字符串列表
+        :param top_k: 每个查询返回的结果数量
+        :param batch_size: 每次矩阵乘法处理的查询数，控制结果矩阵的内存占用
+        :return: (indices, scores)，形状均为 (查询数, top_k) 的数组，按相似度从高到低排列；
+            indices 为文档在 self.documents 中的下标，相似度为0的位置下标为-1
+        """
+        indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.zeros((len(queries), top_k), dtype=np.float64)
+        self._refresh_vectors()
+        if self.document_vectors is None or top_k <= 0:
+            return indices, scores
+        
+        for start in range(0, len(queries), batch_size):
+            batch = list(queries[start:start + batch_size])
+            similarities = self._similarities(self.vectorizer.transform(batch), dense_output=False)
+            for row in range(len(batch)):
+                row_start, row_end = similarities.indptr[row], similarities.indptr[row + 1]
+                row_scores = similarities.data[row_start:row_end]
+                row_docs = similarities.indices[row_start:row_end]
+                positive = row_scores > 0
+                row_scores, row_docs = row_scores[positive], row_docs[positive]
+                
+                # 稀疏行中的文档编号未必有序，先按编号排序以保证并列时的顺序与 search 一致
+                order = np.argsort(row_docs, kind='stable')
+                row_scores, row_docs = row_scores[order], row_docs[order]
+                selected = self._top_k(row_scores, top_k)
+                indices[start + row, :len(selected)] = row_docs[selected]
+                scores[start + row, :len(selected)] = row_scores[selected]
+        
+        return indices, scores
 
 
 # 示例使用
@@ -94,4 +223,9 @@ if __name__ == "__main__":
     for i, result in enumerate(results, 1):
         doc = result['document']
         print(f"{i}. {doc['title']} (Similarity: {result['score']:.4f})")
-        print(f"   {doc['content'][:100]}...")
\ No newline at end of file
+        print(f"   {doc['content'][:100]}...")
+    
+    # 批量检索
+    batch_indices, batch_scores = retriever.search_batch([query, "computer vision images"], top_k=2)
+    print(f"\nBatch indices: {batch_indices.tolist()}")
+    print(f"Batch scores: {np.round(batch_scores, 4).tolist()}")
\ No newline at end of file
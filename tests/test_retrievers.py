@@ -0,0 +1,899 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检索器测试文件
+用于测试 Retriever/retrievers 下各检索器的功能
+"""
+
+import sys
+import os
+import random
+import tempfile
+import time
+import unittest
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.metrics.pairwise import cosine_similarity
+
+# 添加检索器目录到Python路径中
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'Retriever', 'retrievers'))
+
+from demo_all_retrievers import create_sample_documents
+from elasticsearch_retriever.bm25_retriever import BM25Retriever
+from elasticsearch_retriever.bm25_parallel import build_bm25_parallel, build_sharded_bm25
+from elasticsearch_retriever.standard_retriever import StandardRetriever
+from elasticsearch_retriever.aho_corasick import AhoCorasick
+from elasticsearch_retriever.ngram_index import NGramIndex, bounded_edit_distance
+from elasticsearch_retriever.positional_index import PositionalIndex
+from text_analyzer import Analyzer
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+from vector_retriever.vector_retriever import VectorRetriever
+from vector_retriever.knn_retriever import KNNRetriever
+from vector_retriever.tfidf_index import IncrementalTfidf
+from vector_retriever.ann_utils import SparseProjection
+from vector_retriever.hnsw_index import HNSWIndex, recall_latency_report
+from vector_retriever.ivfpq_index import IVFPQIndex
+from vector_retriever.blocked_knn import _row_block, blocked_top_k
+from hybrid_retriever.rrf_retriever import RRF_Retriever
+from hybrid_retriever.rank_fusion import document_id, fuse, normalize_scores
+from hybrid_retriever.text_similarity_reranker import TextSimilarityReranker
+
+
+def create_random_documents(n_docs=300, vocab_size=60, seed=0):
+    """生成随机文档，用于与逐文档计算的结果做对比"""
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    return [
+        {
+            "id": i,
+            "title": f"doc {i}",
+            "content": " ".join(rng.choice(vocab) for _ in range(rng.randint(1, 40)))
+        }
+        for i in range(n_docs)
+    ]
+
+
+def brute_force_bm25(retriever, query, top_k):
+    """逐文档调用 bm25_score 得到的参考结果"""
+    results = []
+    for doc in retriever.documents:
+        score = retriever.bm25_score(query, doc)
+        if score > 0:
+            results.append((doc['id'], score))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:top_k]
+
+
+class TestAnalyzer(unittest.TestCase):
+    """文本分析器测试类"""
+
+    def test_cache_and_filters(self):
+        """测试小写化、停用词过滤和分词缓存"""
+        analyzer = Analyzer(lowercase=True, stopwords={"is"}, cache_size=2)
+        self.assertEqual(analyzer.analyze("Machine Learning is Fun"), ("machine", "learning", "fun"))
+        analyzer.analyze("Machine Learning is Fun")
+        self.assertEqual(analyzer.cache_info()['hits'], 1)
+        analyzer.analyze("a")
+        analyzer.analyze("b")
+        self.assertEqual(analyzer.cache_info()['size'], 2)
+
+    def test_analyze_many_with_processes(self):
+        """测试进程池批量分词与串行分词一致"""
+        texts = [doc['content'] for doc in create_random_documents(n_docs=600)]
+        expected = [tuple(text.split()) for text in texts]
+        self.assertEqual(Analyzer().analyze_many(texts, workers=2, chunksize=100), expected)
+
+    def test_analyze_many_skips_cache(self):
+        """测试批量分词默认不写入查询缓存"""
+        analyzer = Analyzer(cache_size=10)
+        analyzer.analyze("query text")
+        analyzer.analyze_many([f"doc {i}" for i in range(50)])
+        self.assertEqual(analyzer.cache_info()['size'], 1)
+        analyzer.analyze("query text")
+        self.assertEqual(analyzer.cache_info()['hits'], 1)
+        analyzer.analyze_many(["doc 1", "doc 2"], cache=True)
+        self.assertEqual(analyzer.cache_info()['size'], 3)
+
+    @unittest.skipIf(jieba is None, "未安装jieba")
+    def test_jieba_tokenizer(self):
+        """测试jieba分词使中文查询可以命中文档"""
+        documents = [
+            {"id": 1, "content": "机器学习是人工智能的一个分支"},
+            {"id": 2, "content": "深度学习使用神经网络"},
+        ]
+        whitespace = BM25Retriever(documents)
+        self.assertEqual(whitespace.search("人工智能"), [])
+        retriever = BM25Retriever(documents, analyzer=Analyzer(tokenizer="jieba"))
+        self.assertEqual(retriever.search("人工智能")[0]['document']['id'], 1)
+
+
+class TestStandardRetriever(unittest.TestCase):
+    """标准检索器测试类"""
+
+    def test_aho_corasick_matches_str_count(self):
+        """测试多模式匹配的计数与 str.count 一致（包括重叠和互为前后缀的模式）"""
+        patterns = ["aa", "a", "aba", "ba", "abab", "中文"]
+        matcher = AhoCorasick(patterns)
+        for text in ["aaaa", "ababababa", "baabaab 中文中文", ""]:
+            expected = {pattern: text.count(pattern) for pattern in patterns if text.count(pattern)}
+            self.assertEqual(matcher.count(text), expected)
+
+    def test_search_matches_substring_count(self):
+        """测试检索结果与逐文档 str.count 的子串计数一致"""
+        documents = create_random_documents()
+        retriever = StandardRetriever(documents)
+        for query in ["w1 w2", "W3 w3 w40", "doc 1", "w5", "missing", ""]:
+            expected = []
+            for doc in documents:
+                text = (doc['title'] + ' ' + doc['content']).lower()
+                score = sum(text.count(term) for term in query.lower().split())
+                if score > 0:
+                    expected.append((doc['id'], score))
+            expected.sort(key=lambda x: x[1], reverse=True)
+            results = retriever.search(query, top_k=20)
+            self.assertEqual([(r['document']['id'], r['score']) for r in results], expected[:20])
+
+        # 含空白的查询词（自定义分析器）退化为逐文档多模式扫描
+        class PhraseAnalyzer:
+            def analyze(self, text):
+                return (text.lower(),)
+
+        retriever.analyzer = PhraseAnalyzer()
+        self.assertEqual(len(retriever.search("doc 1", top_k=300)), 111)
+
+    def test_fuzzy_search(self):
+        """测试三元组索引的候选加验证与逐词计算编辑距离一致，并能容忍拼写错误"""
+        vocabulary = ["learning", "learn", "leaning", "earning", "lerning", "machine", "machines",
+                      "mahcine", "algorithm", "algorithms", "ai", "a", "be", "中文检索", "中文检锁"]
+        index = NGramIndex(vocabulary)
+        for term in ["lerning", "machnie", "algoritm", "ai", "b", "中文检所"]:
+            for max_edits in (0, 1, 2):
+                expected = []
+                for candidate in vocabulary:
+                    distance = bounded_edit_distance(term, candidate, max_edits)
+                    if distance is not None:
+                        expected.append((candidate, distance))
+                expected.sort(key=lambda item: (item[1], item[0]))
+                self.assertEqual(index.search(term, max_edits), expected)
+        self.assertEqual(bounded_edit_distance("machine", "mahcine", 2), 1)
+        self.assertIsNone(bounded_edit_distance("machine", "learning", 2))
+
+        retriever = StandardRetriever(create_sample_documents())
+        self.assertEqual(retriever.search("machne lerning"), [])
+        results = retriever.fuzzy_search("machne lerning", top_k=3)
+        self.assertTrue(results)
+        for result in results:
+            text = (result['document']['title'] + ' ' + result['document']['content']).lower()
+            self.assertTrue("machine" in text or "learning" in text)
+        # 不允许编辑时与标准检索一致
+        self.assertEqual(retriever.fuzzy_search("machine learning", max_edits=0),
+                         retriever.search("machine learning"))
+
+
+class TestBM25Retriever(unittest.TestCase):
+    """BM25检索器测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.documents = create_random_documents()
+        self.queries = ["w1 w2 w3", "w5", "w7 w7 w8 w40 w59", "missing w0"]
+
+    def assertSameResults(self, retriever, query, top_k=10, places=9):
+        """断言检索结果与逐文档计算一致"""
+        results = retriever.search(query, top_k=top_k)
+        expected = brute_force_bm25(retriever, query, top_k)
+        self.assertEqual([r['document']['id'] for r in results], [doc_id for doc_id, _ in expected])
+        for result, (_, score) in zip(results, expected):
+            self.assertAlmostEqual(result['score'], score, places=places)
+
+    def test_inverted_index_matches_brute_force(self):
+        """测试倒排索引检索与逐文档打分一致"""
+        retriever = BM25Retriever(self.documents)
+        for query in self.queries:
+            self.assertSameResults(retriever, query)
+        self.assertEqual(retriever.search("not-in-vocabulary"), [])
+
+    def test_incremental_updates_match_rebuild(self):
+        """测试增量添加、更新、删除后的结果与全量重建一致"""
+        retriever = BM25Retriever(self.documents[:100], compact_threshold=0.5)
+        retriever.add_documents(self.documents[100:200])
+        for doc_id in range(0, 200, 7):
+            retriever.delete_document(doc_id)
+        replacement = create_random_documents(n_docs=20, seed=1)
+        for doc in replacement:
+            if doc['id'] % 7:
+                retriever.update_document(doc['id'], doc)
+        self.assertTrue(retriever.deleted)
+
+        live = {doc['id']: doc for doc in self.documents[:200] if doc['id'] % 7}
+        live.update({doc['id']: doc for doc in replacement if doc['id'] % 7})
+        rebuilt = BM25Retriever(list(live.values()))
+
+        for query in self.queries:
+            incremental = {r['document']['id']: r['score'] for r in retriever.search(query, top_k=300)}
+            expected = {r['document']['id']: r['score'] for r in rebuilt.search(query, top_k=300)}
+            self.assertEqual(incremental.keys(), expected.keys())
+            for doc_id, score in expected.items():
+                self.assertAlmostEqual(incremental[doc_id], score, places=9)
+
+        # 压缩后墓碑被清理，结果保持不变
+        retriever.compact()
+        self.assertFalse(retriever.deleted)
+        self.assertEqual(len(retriever.documents), len(live))
+        self.assertSameResults(retriever, "w1 w2 w3")
+
+        with self.assertRaises(KeyError):
+            retriever.delete_document(0)
+
+    def test_wand_matches_exhaustive(self):
+        """测试WAND剪枝与穷举打分的结果完全一致（包括并列顺序）"""
+        documents = create_random_documents(n_docs=2000, vocab_size=30, seed=2)
+        retriever = BM25Retriever(documents)
+        retriever.delete_document(5)
+        queries = self.queries + ["w0 w1 w2 w3 w4 w5 w6 w7 w8 w9", "w3 w3 w3 w29"]
+        for query in queries:
+            for top_k in (1, 5, 50):
+                self.assertEqual(
+                    retriever.search(query, top_k=top_k),
+                    retriever.search(query, top_k=top_k, use_wand=False)
+                )
+
+    def test_save_and_load(self):
+        """测试索引保存后以内存映射方式加载，检索结果不变"""
+        retriever = BM25Retriever(self.documents)
+        retriever.delete_document(4)
+        retriever.add_documents([{"id": "中文", "title": "t", "content": "w1 检索 w2"}])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            retriever.save(tmp_dir)
+            loaded = BM25Retriever.load(tmp_dir)
+            for query in self.queries + ["检索"]:
+                self.assertEqual(loaded.search(query), retriever.search(query))
+                self.assertEqual(loaded.search(query, use_wand=False), retriever.search(query, use_wand=False))
+
+            # 加载后仍然支持增量更新
+            loaded.delete_document(10)
+            retriever.delete_document(10)
+            self.assertEqual(loaded.search("w1 w2 w3"), retriever.search("w1 w2 w3"))
+
+    def test_search_batch_matches_search(self):
+        """测试稀疏矩阵批量打分与逐条检索一致"""
+        retriever = BM25Retriever(self.documents)
+        retriever.delete_document(3)
+        batch_results = retriever.search_batch(self.queries, top_k=10, batch_size=3)
+        self.assertEqual(len(batch_results), len(self.queries))
+        for query, results in zip(self.queries, batch_results):
+            # 累加顺序不同会带来末位浮点差异，因此按得分而非严格顺序比较
+            expected = retriever.search(query, top_k=10)
+            all_scores = {r['document']['id']: r['score'] for r in retriever.search(query, top_k=300)}
+            self.assertEqual(len(results), len(expected))
+            for result, reference in zip(results, expected):
+                self.assertAlmostEqual(result['score'], reference['score'], places=9)
+                self.assertAlmostEqual(result['score'], all_scores[result['document']['id']], places=9)
+
+    def test_phrase_and_proximity_search(self):
+        """测试位置索引：短语检索与子串扫描一致，邻近度加权提升相邻文档"""
+        retriever = BM25Retriever(self.documents, positions=True)
+        retriever.delete_document(7)
+        retriever.add_documents([{"id": 7, "title": "t", "content": "w1 w2 w3 w1 w2"}])
+        live = [doc for slot, doc in enumerate(retriever.documents) if slot not in retriever.deleted]
+        for phrase in ("w1 w2", "w3 w4 w5", "w7"):
+            results = retriever.phrase_search(phrase, top_k=300)
+            expected = {doc['id'] for doc in live if f" {phrase} " in f" {doc['content']} "}
+            self.assertEqual({r['document']['id'] for r in results}, expected)
+            scores = {r['document']['id']: r['score'] for r in retriever.search(phrase, top_k=300, use_wand=False)}
+            for result in results:
+                self.assertAlmostEqual(result['score'], scores[result['document']['id']], places=9)
+        counts = {r['document']['id']: r['phrase_count'] for r in retriever.phrase_search("w1 w2", top_k=300)}
+        self.assertEqual(counts[7], 2)
+
+        # 压缩后位置索引随文档重新编号
+        retriever.compact()
+        self.assertIn(7, {r['document']['id'] for r in retriever.phrase_search("w1 w2 w3", top_k=300)})
+
+        documents = [
+            {"id": "near", "content": "alpha beta x x x x x x x x"},
+            {"id": "far", "content": "alpha x x x x x x x x beta"},
+        ]
+        retriever = BM25Retriever(documents, positions=True)
+        plain = retriever.search("alpha beta")
+        self.assertAlmostEqual(plain[0]['score'], plain[1]['score'])
+        boosted = retriever.search("alpha beta", proximity_boost=1.0)
+        self.assertEqual(boosted[0]['document']['id'], "near")
+        self.assertAlmostEqual(boosted[0]['score'], 2 * plain[0]['score'])
+        windowed = retriever.search("alpha beta", proximity_boost=1.0, window=5)
+        self.assertAlmostEqual(windowed[1]['score'], plain[1]['score'])
+        with self.assertRaises(ValueError):
+            BM25Retriever(documents).phrase_search("alpha beta")
+
+        standard = StandardRetriever(create_sample_documents(), positions=True)
+        results = standard.phrase_search("Machine Learning")
+        self.assertTrue(results)
+        for result in results:
+            doc = result['document']
+            self.assertIn("machine learning", (doc['title'] + ' ' + doc['content']).lower())
+
+    def test_positional_index_layout_and_persistence(self):
+        """测试位置索引的扁平存储布局，以及保存加载后短语检索仍可用"""
+        index = PositionalIndex()
+        index.add(0, ["a", "b", "a"])
+        index.add(5, ["b", "a"])
+        index.add(2, ["a"])
+        doc_ids, offsets, data = index.postings["a"]
+        self.assertEqual(list(doc_ids), [0, 2, 5])
+        self.assertEqual(len(offsets), 4)
+        self.assertEqual(offsets[-1], len(data))
+        self.assertEqual([index.get("a", doc_id) for doc_id in (0, 2, 5)], [[0, 2], [0], [1]])
+        index.remove(2, ["a"])
+        self.assertEqual(index.get("a", 2), [])
+        self.assertEqual(index.get("a", 5), [1])
+        self.assertEqual(index.candidates(["a", "b"]), [0, 5])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index.save(tmp_dir)
+            mapped = PositionalIndex.load(tmp_dir)
+            self.assertEqual([mapped.get("a", doc_id) for doc_id in (0, 2, 5)], [[0, 2], [], [1]])
+            self.assertEqual(mapped.get("b", 0), [1])
+            self.assertEqual(mapped.candidates(["a", "b"]), [0, 5])
+            mapped.add(3, ["b", "b"])
+            self.assertIsInstance(mapped.postings, dict)
+            self.assertEqual([mapped.get("b", doc_id) for doc_id in (0, 3, 5)], [[1], [0, 1], [0]])
+
+        # 保存后加载时位置索引直接内存映射，不重新分词
+        retriever = BM25Retriever(self.documents, positions=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            retriever.save(tmp_dir)
+            with unittest.mock.patch.object(Analyzer, 'analyze_many', return_value=[]) as analyze_many:
+                loaded = BM25Retriever.load(tmp_dir)
+            self.assertFalse(any(call.args[0] for call in analyze_many.call_args_list))
+            self.assertNotIsInstance(loaded.positional.postings, dict)
+            self.assertEqual(loaded.phrase_search("w1 w2", top_k=300), retriever.phrase_search("w1 w2", top_k=300))
+            self.assertEqual(loaded.search("w1 w2", proximity_boost=1.0),
+                             retriever.search("w1 w2", proximity_boost=1.0))
+            new_document = {"id": "new", "content": "w1 w2 w1 w2"}
+            loaded.add_documents([new_document])
+            retriever.add_documents([new_document])
+            self.assertEqual(loaded.phrase_search("w1 w2", top_k=300), retriever.phrase_search("w1 w2", top_k=300))
+
+    def test_parallel_build_matches_single_process(self):
+        """测试并行分片构建（合并与分片两种模式）与单进程构建的结果一致"""
+        retriever = BM25Retriever(self.documents)
+        merged = build_bm25_parallel(self.documents, workers=2, n_shards=3)
+        self.assertEqual(merged.postings, retriever.postings)
+        self.assertEqual(merged.doc_freqs, retriever.doc_freqs)
+        self.assertEqual(merged.doc_lengths, retriever.doc_lengths)
+
+        sharded = build_sharded_bm25(self.documents, workers=2, n_shards=3)
+        self.assertEqual(len(sharded.shards), 3)
+        self.assertEqual(sharded.documents, self.documents)
+        for query in self.queries:
+            expected = retriever.search(query, top_k=20)
+            self.assertEqual(merged.search(query, top_k=20), expected)
+            results = sharded.search(query, top_k=20)
+            self.assertEqual([r['document']['id'] for r in results], [r['document']['id'] for r in expected])
+            for result, reference in zip(results, expected):
+                self.assertAlmostEqual(result['score'], reference['score'], places=9)
+
+
+class TestVectorRetrievers(unittest.TestCase):
+    """向量检索器测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.documents = create_sample_documents()
+        self.query = "machine learning artificial intelligence algorithms"
+
+    def test_vector_retriever_matches_cosine(self):
+        """测试点积得分与余弦相似度一致"""
+        retriever = VectorRetriever(self.documents)
+        self.assertTrue(retriever.normalized)
+
+        query_vector = retriever.vectorizer.transform([self.query])
+        expected = cosine_similarity(query_vector, retriever.document_vectors).flatten()
+
+        results = retriever.search(self.query, top_k=3)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            index = self.documents.index(result['document'])
+            self.assertAlmostEqual(result['score'], expected[index], places=6)
+
+    def test_vector_search_batch_matches_search(self):
+        """测试批量检索与逐条检索一致"""
+        documents = create_random_documents()
+        retriever = VectorRetriever(documents)
+        queries = ["w1 w2 w3", "w5", "missing", "w7 w7 w8 w40 w59"]
+        indices, scores = retriever.search_batch(queries, top_k=10, batch_size=3)
+        self.assertEqual(indices.shape, (len(queries), 10))
+        for row, query in enumerate(queries):
+            expected = retriever.search(query, top_k=10)
+            found = indices[row] >= 0
+            self.assertEqual(int(found.sum()), len(expected))
+            np.testing.assert_allclose(scores[row][found], [r['score'] for r in expected])
+            all_scores = {r['document']['id']: r['score'] for r in retriever.search(query, top_k=300)}
+            for index, score in zip(indices[row][found], scores[row][found]):
+                self.assertAlmostEqual(all_scores[documents[index]['id']], score)
+        self.assertTrue((indices[2] == -1).all())
+
+    def test_low_memory_index(self):
+        """测试词表裁剪和float32/int32存储：结果与默认索引接近，内存占用下降"""
+        documents = create_random_documents()
+        query = "w1 w2 w3"
+        for retriever_class in (VectorRetriever, KNNRetriever):
+            default = retriever_class(documents)
+            compact = retriever_class(documents, low_memory=True)
+            self.assertEqual(compact.document_vectors.dtype, np.float32)
+            self.assertEqual(compact.document_vectors.indices.dtype, np.int32)
+            for result, reference in zip(compact.search(query, top_k=5), default.search(query, top_k=5)):
+                self.assertAlmostEqual(float(result['score']), reference['score'], places=5)
+            self.assertLess(compact.memory_usage()['data_bytes'], default.memory_usage()['data_bytes'])
+
+        pruned = VectorRetriever(documents, max_features=20, min_df=2, max_df=0.9, low_memory=True)
+        report = pruned.memory_usage()
+        self.assertEqual(report['vocabulary_terms'], 20)
+        self.assertEqual(report['n_features'], 20)
+        self.assertLess(report['total_bytes'], VectorRetriever(documents).memory_usage()['total_bytes'])
+        self.assertIsNone(getattr(pruned.vectorizer, 'stop_words_', None))
+
+        incremental = VectorRetriever(documents, incremental=True, low_memory=True)
+        self.assertEqual(incremental.search(query)[0]['document'], VectorRetriever(documents).search(query)[0]['document'])
+        self.assertGreater(incremental.memory_usage()['vectorizer_bytes'], 0)
+        with self.assertRaises(ValueError):
+            VectorRetriever(documents, incremental=True, max_features=10)
+
+    def test_knn_retriever_matches_cosine(self):
+        """测试KNN检索返回余弦距离最近的文档"""
+        retriever = KNNRetriever(self.documents, n_neighbors=3)
+        query_vector = retriever.vectorizer.transform([self.query])
+        expected = cosine_similarity(query_vector, retriever.document_vectors).flatten()
+
+        results = retriever.search(self.query, top_k=3)
+        self.assertEqual(
+            [doc['id'] for doc in (r['document'] for r in results)],
+            [self.documents[i]['id'] for i in np.argsort(-expected)[:3]],
+        )
+        for result in results:
+            self.assertAlmostEqual(result['distance'], 1 - result['score'])
+
+    def test_blocked_knn_with_variable_k(self):
+        """测试分块并行的精确检索与整体排序一致，且检索时的k不受n_neighbors限制"""
+        rng = np.random.default_rng(0)
+        documents_matrix = rng.random((500, 16)).astype(np.float32)
+        queries = rng.random((4, 16)).astype(np.float32)
+        expected = np.argsort(-(queries @ documents_matrix.T), axis=1, kind='stable')[:, :12]
+        for block_size, workers in ((7, 3), (64, 1), (1000, None)):
+            indices, similarities = blocked_top_k(queries, documents_matrix, 12, block_size=block_size, workers=workers)
+            np.testing.assert_array_equal(indices, expected)
+            self.assertEqual(similarities.dtype, np.float32)
+        # CSR文档矩阵按 indptr 范围分块，块引用原矩阵的非零元素；默认块大小随文档数和线程数变化
+        sparse_documents = sparse.csr_matrix(np.where(documents_matrix > 0.7, documents_matrix, 0))
+        block = _row_block(sparse_documents, 100, 200)
+        self.assertTrue(np.shares_memory(block.data, sparse_documents.data))
+        np.testing.assert_array_equal(block.toarray(), sparse_documents[100:200].toarray())
+        dense_expected = blocked_top_k(queries, sparse_documents.toarray(), 12)[0]
+        for block_size, workers in ((64, 4), (None, 4)):
+            indices, similarities = blocked_top_k(sparse.csr_matrix(queries), sparse_documents, 12,
+                                                  block_size=block_size, workers=workers)
+            np.testing.assert_array_equal(indices, dense_expected)
+            self.assertEqual(similarities.dtype, np.float32)
+        # float64矩阵按块转换为float32后相乘
+        indices, similarities = blocked_top_k(sparse.csr_matrix(queries, dtype=np.float64),
+                                              sparse_documents.astype(np.float64), 12, block_size=64, workers=4)
+        np.testing.assert_array_equal(indices, dense_expected)
+        self.assertEqual(similarities.dtype, np.float32)
+        indices, similarities = blocked_top_k(queries.astype(np.float64), documents_matrix.astype(np.float64), 12)
+        np.testing.assert_array_equal(indices, expected)
+        self.assertEqual(similarities.dtype, np.float32)
+
+        documents = create_random_documents()
+        retriever = KNNRetriever(documents, n_neighbors=3, block_size=16, workers=4)
+        reference = VectorRetriever(documents)
+        self.assertEqual(len(retriever.search("w1 w2")), 3)
+        results = retriever.search("w1 w2", top_k=20)
+        self.assertEqual(len(results), 20)
+        np.testing.assert_allclose([r['score'] for r in results],
+                                   [r['score'] for r in reference.search("w1 w2", top_k=20)])
+        self.assertEqual(len(retriever.search("w1", top_k=1000)), len(documents))
+
+    def test_incremental_tfidf_matches_refit(self):
+        """测试增量追加文档后的检索结果与全量重新拟合一致"""
+        documents = create_random_documents(n_docs=120)
+        queries = ["w1 w2 w3", "w10 w10 w42", self.query]
+        for retriever_class in (VectorRetriever, KNNRetriever):
+            incremental = retriever_class(documents[:40], incremental=True)
+            incremental.add_documents(documents[40:90])
+            incremental.search("w1")
+            incremental.add_documents(documents[90:])
+            refit = retriever_class(documents)
+            for query in queries:
+                results = incremental.search(query, top_k=5)
+                expected = refit.search(query, top_k=5)
+                self.assertEqual(len(results), len(expected))
+                for result, reference in zip(results, expected):
+                    self.assertAlmostEqual(result['score'], reference['score'], places=9)
+
+        vectors = VectorRetriever(documents[:40], incremental=True)
+        vectors.add_documents(documents[40:])
+        reference = VectorRetriever(documents)
+        query_vectors = reference.vectorizer.transform(queries)
+        np.testing.assert_allclose(
+            vectors._similarities(vectors.vectorizer.transform(queries)),
+            reference._similarities(query_vectors), atol=1e-9
+        )
+
+    def test_incremental_tfidf_appends_in_place(self):
+        """测试少量追加只归一化新文档、不复制文档矩阵，整体重算模长后与重新拟合一致"""
+        documents = [doc['content'] for doc in create_random_documents(n_docs=120)]
+        vectorizer = IncrementalTfidf(renormalize_growth=0.1)
+        vectorizer.partial_fit(documents[:100])
+        before = vectorizer.document_vectors
+        old_rows = before[:100].toarray()
+        vectorizer.partial_fit(documents[100:105])
+        after = vectorizer.document_vectors
+        # 增长未超过阈值：旧文档的行保持不变，文档矩阵是缓冲区上的视图
+        np.testing.assert_array_equal(after[:100].toarray(), old_rows)
+        self.assertTrue(np.shares_memory(after.data, vectorizer._data))
+
+        reference = IncrementalTfidf().fit_transform(documents[:105])
+        queries = vectorizer.transform(["w1 w2 w3", "w10"])
+        vectorizer.renormalize()
+        np.testing.assert_allclose((vectorizer.query_weights(queries) @ vectorizer.document_vectors.T).toarray(),
+                                   (queries @ vectorizer.tfidf_vectors(reference).T).toarray(), atol=1e-9)
+        np.testing.assert_allclose(
+            np.linalg.norm(vectorizer.tfidf_vectors(vectorizer.document_vectors).toarray(), axis=1), 1.0
+        )
+
+        # 文档频率只在新文档出现的特征上累加，IDF只按用到的特征计算，与在全部词频上拟合的IDF一致
+        counts = vectorizer.hasher.transform(documents[:105])
+        features = np.unique(counts.indices)
+        np.testing.assert_array_equal(vectorizer.doc_freqs[features], np.bincount(counts.indices)[features])
+        np.testing.assert_allclose(vectorizer.idf_of(features), TfidfTransformer().fit(counts).idf_[features])
+        unseen = np.setdiff1d(np.arange(1000), features)
+        np.testing.assert_array_equal(vectorizer.idf_of(unseen), 0.0)
+
+    def test_hnsw_index(self):
+        """测试HNSW索引的召回率、增量插入以及KNN检索器的近似后端"""
+        rng = np.random.default_rng(0)
+        data = rng.standard_normal((600, 16)).astype(np.float32)
+        index = HNSWIndex(M=8, ef_construction=100, ef_search=64)
+        self.assertEqual(index.add(data[:400]).tolist(), list(range(400)))
+        self.assertEqual(index.add(data[400:]).tolist(), list(range(400, 600)))
+        queries = rng.standard_normal((20, 16)).astype(np.float32)
+        report = recall_latency_report(index, queries, k=10, ef_values=(10, 100))
+        self.assertEqual([record['ef_search'] for record in report], [10, 100])
+        self.assertGreaterEqual(report[1]['recall'], 0.95)
+        # 索引中已有的向量应找到自身
+        found, similarities = index.search(data[[3, 450]], k=1)
+        self.assertEqual(found[:, 0].tolist(), [3, 450])
+        np.testing.assert_allclose(similarities[:, 0], 1.0, atol=1e-5)
+
+        # 连接数很少的聚类数据上图不连通，可达节点不足k个时空位编号为-1，而不是重复的0号节点
+        centers = 5 * rng.standard_normal((4, 8))
+        clustered = (centers[rng.integers(0, 4, 40)] + 0.1 * rng.standard_normal((40, 8))).astype(np.float32)
+        sparse_index = HNSWIndex(M=2, ef_construction=2)
+        sparse_index.add(clustered)
+        found, similarities = sparse_index.search(clustered[:3], k=len(sparse_index))
+        self.assertTrue((found < 0).any())
+        for row, sims in zip(found, similarities):
+            reached = row[row >= 0]
+            self.assertEqual(len(set(reached.tolist())), len(reached))
+            self.assertTrue(np.all(row[len(reached):] == -1))
+            self.assertTrue(np.all(sims[len(reached):] == 0))
+
+        documents = create_random_documents(n_docs=200)
+        exact = KNNRetriever(documents, n_neighbors=5)
+        approximate = KNNRetriever(documents, n_neighbors=5, backend="hnsw", index_params={"ef_search": 200})
+        for query in ["w1 w2 w3", "w10 w10 w42", "w5"]:
+            expected = exact.search(query)
+            results = approximate.search(query)
+            np.testing.assert_allclose([r['score'] for r in results], [r['score'] for r in expected], atol=1e-9)
+        records = approximate.recall_report(["w1 w2 w3", "w5"], search_params=[{"ef_search": 200}])
+        self.assertEqual(records[0]['recall'], 1.0)
+        with self.assertRaises(ValueError):
+            approximate.recall_report([])
+        with self.assertRaises(ValueError):
+            recall_latency_report(index, np.empty((0, 16), dtype=np.float32))
+
+        incremental = KNNRetriever(documents[:100], n_neighbors=5, incremental=True, backend="hnsw",
+                                   dense_dim=32, index_params={"ef_search": 200})
+        incremental.add_documents(documents[100:])
+        self.assertEqual(len(incremental.ann_index), len(documents))
+        self.assertEqual(len(incremental.search("w1 w2 w3")), 5)
+        with self.assertRaises(ValueError):
+            KNNRetriever(documents, incremental=True, backend="hnsw")
+
+        # 创建时没有文档：第一次追加时建立近似索引，之后的检索和追加都走近似后端
+        for backend in ("hnsw", "ivfpq"):
+            empty = KNNRetriever(n_neighbors=5, incremental=True, backend=backend, dense_dim=32)
+            self.assertIsNone(empty.ann_index)
+            empty.add_documents(documents[:100])
+            self.assertEqual(len(empty.ann_index), 100)
+            empty.add_documents(documents[100:])
+            self.assertEqual(len(empty.ann_index), len(documents))
+            calls = []
+            search = empty.ann_index.search
+            empty.ann_index.search = lambda *args, **kwargs: calls.append(args) or search(*args, **kwargs)
+            self.assertEqual(len(empty.search("w1 w2 w3")), 5)
+            self.assertEqual(len(calls), 1)
+
+    def test_ivfpq_index(self):
+        """测试IVF-PQ索引：扫描全部列表并精确重排时与精确检索一致，编码远小于原始向量"""
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((10, 32))
+        data = (centers[rng.integers(0, 10, 1000)] + 0.3 * rng.standard_normal((1000, 32))).astype(np.float32)
+        index = IVFPQIndex(n_lists=16, n_subvectors=8, nprobe=4, store_vectors=True, rescore_depth=100)
+        index.add(data[:800])
+        self.assertEqual(index.add(data[800:]).tolist(), list(range(800, 1000)))
+
+        queries = data[:20] / np.linalg.norm(data[:20], axis=1, keepdims=True)
+        vectors = data / np.linalg.norm(data, axis=1, keepdims=True)
+        expected = np.argsort(-(queries @ vectors.T), axis=1, kind='stable')[:, :5]
+        found, similarities = index.search(queries, k=5, nprobe=16)
+        np.testing.assert_array_equal(found, expected)
+        np.testing.assert_allclose(similarities[:, 0], 1.0, atol=1e-5)
+
+        approximate, _ = index.search(queries, k=5, rescore=False)
+        hits = sum(len(set(row) & set(reference)) for row, reference in zip(approximate, expected))
+        self.assertGreaterEqual(hits / expected.size, 0.5)
+        usage = index.memory_usage()
+        self.assertEqual(usage['codes_bytes'], 1000 * 8)
+        self.assertLess(usage['codes_bytes'] * 10, usage['vectors_bytes'])
+
+        documents = create_random_documents(n_docs=200)
+        exact = KNNRetriever(documents, n_neighbors=5)
+        retriever = KNNRetriever(documents, n_neighbors=5, backend="ivfpq",
+                                 index_params={"n_lists": 8, "nprobe": 8}, rescore_depth=200)
+        for query in ["w1 w2 w3", "w10 w10 w42"]:
+            np.testing.assert_allclose([r['score'] for r in retriever.search(query)],
+                                       [r['score'] for r in exact.search(query)], atol=1e-9)
+        self.assertEqual([record['nprobe'] for record in retriever.recall_report(["w1"])], [1, 2, 4, 8, 16, 32])
+
+    def test_sparse_projection(self):
+        """测试降维只在出现过的特征上拟合：投影矩阵只有这些行，未出现过的特征不影响投影结果"""
+        documents = [doc['content'] for doc in create_random_documents(n_docs=200)]
+        vectorizer = IncrementalTfidf()
+        vectors = vectorizer.tfidf_vectors(vectorizer.fit_transform(documents))
+        projection = SparseProjection(16).fit(vectors)
+        np.testing.assert_array_equal(projection.columns, np.unique(vectors.indices))
+        self.assertEqual(projection.components.shape, (len(projection.columns), 16))
+        dense = projection.transform(vectors)
+        self.assertEqual(dense.shape, (len(documents), 16))
+        self.assertEqual(dense.dtype, np.float32)
+
+        unseen = np.setdiff1d(np.arange(vectorizer.n_features), projection.columns)[:3]
+        extended = vectors[:5].tolil()
+        extended[:, unseen] = 1.0
+        np.testing.assert_allclose(projection.transform(extended.tocsr()), dense[:5], atol=1e-6)
+
+        # 默认参数下增量模式的IVF-PQ后端召回率可用
+        documents = create_random_documents(n_docs=1000)
+        queries = [" ".join(doc['content'].split()[:4]) for doc in documents[:20]]
+        retriever = KNNRetriever(documents, n_neighbors=10, incremental=True, backend="ivfpq", dense_dim=64)
+        record = retriever.recall_report(queries, search_params=[{}])[0]
+        self.assertGreaterEqual(record['recall'], 0.8)
+
+
+class SlowRetriever:
+    """按固定排名返回文档并在返回前等待一段时间的模拟检索器"""
+
+    def __init__(self, documents, delay=0.0):
+        self.documents = documents
+        self.delay = delay
+        self.requested = []  # 每次调用请求的结果数
+        self.running = 0  # 正在执行的调用数
+        self.max_running = 0
+
+    def search(self, query, top_k=10):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+        finally:
+            self.running -= 1
+        self.requested.append(top_k)
+        return [{'document': doc, 'score': 1.0 / (rank + 1)} for rank, doc in enumerate(self.documents[:top_k])]
+
+
+class TestRRFRetriever(unittest.TestCase):
+    """RRF融合检索器测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.documents = create_sample_documents()
+
+    def test_parallel_fan_out_with_timeouts(self):
+        """测试检索器并发执行，超时的检索器不参与融合并在报告中列出"""
+        delay = 0.3
+        fast = SlowRetriever(self.documents, delay=delay)
+        reverse = SlowRetriever(self.documents[::-1], delay=delay)
+        retriever = RRF_Retriever([fast, reverse])
+        started = time.perf_counter()
+        report = retriever.search_with_report("query", top_k=3)
+        # 顺序执行至少需要两个延迟之和，并发时总耗时明显更短
+        self.assertLess(time.perf_counter() - started, 2 * delay)
+        self.assertEqual(report['timed_out'], [])
+        self.assertEqual(report['failed'], {})
+        self.assertEqual(len(report['results']), 3)
+
+        retriever.add_retriever(SlowRetriever(self.documents[::-1], delay=3.0), timeout=0.1)
+        started = time.perf_counter()
+        report = retriever.search_with_report("query", top_k=3)
+        self.assertLess(time.perf_counter() - started, 2 * delay)
+        self.assertEqual(report['timed_out'], [2])
+        expected = RRF_Retriever([SlowRetriever(self.documents), SlowRetriever(self.documents[::-1])]).search("query", 3)
+        self.assertEqual(report['results'], expected)
+        retriever.close()
+
+    def test_failed_retriever_is_reported(self):
+        """测试抛出异常的检索器不影响其余检索器的融合，并在报告中列出"""
+        class BrokenRetriever:
+            def search(self, query, top_k=10):
+                raise RuntimeError("index unavailable")
+
+        retriever = RRF_Retriever([SlowRetriever(self.documents), BrokenRetriever()])
+        report = retriever.search_with_report("query", top_k=3)
+        self.assertEqual(list(report['failed']), [1])
+        self.assertIsInstance(report['failed'][1], RuntimeError)
+        self.assertEqual(report['timed_out'], [])
+        self.assertEqual(report['depths'], [retriever.candidate_depth, 0])
+        self.assertEqual(report['results'], RRF_Retriever([SlowRetriever(self.documents)]).search("query", 3))
+
+        adaptive = RRF_Retriever([SlowRetriever(self.documents), BrokenRetriever()], adaptive_depth=True)
+        self.assertEqual(list(adaptive.search_with_report("query", top_k=3)['failed']), [1])
+        retriever.close()
+        adaptive.close()
+
+    def test_deadline_excludes_queueing(self):
+        """测试排队等待线程的时间不计入超时，卡住的检索占满线程时换用新的线程池"""
+        queued = RRF_Retriever([SlowRetriever(self.documents, delay=0.1), SlowRetriever(self.documents, delay=0.1)],
+                               timeout=0.15, max_workers=1)
+        self.assertEqual(queued.search_with_report("query", top_k=3)['timed_out'], [])
+        queued.close()
+
+        hung = SlowRetriever(self.documents[::-1], delay=1.0)
+        healthy = SlowRetriever(self.documents, delay=0.05)
+        retriever = RRF_Retriever([hung, healthy], timeouts=[0.1, 0.3], max_workers=2)
+        for _ in range(3):
+            self.assertEqual(retriever.search_with_report("query", top_k=3)['timed_out'], [0])
+        retriever.close()
+
+    def test_retriever_calls_are_serialized(self):
+        """测试同一个检索器不会被并发调用：超时的检索返回前，后续调用等到截止时间后记为超时，不再执行"""
+        hung = SlowRetriever(self.documents, delay=0.5)
+        other = SlowRetriever(self.documents[::-1])
+        with RRF_Retriever([hung, other], timeouts=[0.1, None]) as retriever:
+            for _ in range(3):
+                report = retriever.search_with_report("query", top_k=3)
+                self.assertEqual(report['timed_out'], [0])
+                self.assertEqual(len(report['results']), 3)
+            retriever.close(wait=True)
+            self.assertEqual(hung.running, 0)
+            self.assertEqual(len(hung.requested), 1)
+            self.assertEqual(hung.max_running, 1)
+
+        shared = SlowRetriever(self.documents, delay=0.1)
+        with RRF_Retriever([shared, shared]) as retriever, ThreadPoolExecutor(max_workers=2) as pool:
+            reports = list(pool.map(lambda _: retriever.search_with_report("query", top_k=3), range(2)))
+        self.assertEqual([len(report['results']) for report in reports], [3, 3])
+        self.assertEqual([report['timed_out'] for report in reports], [[], []])
+        self.assertEqual(shared.max_running, 1)
+        self.assertEqual(len(shared.requested), 4)
+
+    def test_fusion_methods(self):
+        """测试加权RRF、CombSUM、CombMNZ与逐项计算的结果一致"""
+        docs = [{'id': i, 'content': f"doc {i}"} for i in range(6)]
+        first = [{'document': docs[i], 'score': score} for i, score in ((0, 9.0), (1, 5.0), (2, 1.0))]
+        second = [{'document': docs[i], 'score': score} for i, score in ((2, 0.9), (3, 0.8), (0, 0.1), (2, 0.05))]
+
+        fused = fuse([first, second], top_k=10, weights=[2.0, 1.0], k=60.0)
+        expected = {0: 2 / 61 + 1 / 63, 1: 2 / 62, 2: 2 / 63 + 1 / 61, 3: 1 / 62}
+        self.assertEqual([r['document']['id'] for r in fused], sorted(expected, key=lambda i: -expected[i]))
+        for result in fused:
+            self.assertAlmostEqual(result['score'], expected[result['document']['id']])
+
+        combsum = {r['document']['id']: r['score'] for r in fuse([first, second], method="combsum")}
+        self.assertAlmostEqual(combsum[0], 1.0 + (0.1 - 0.05) / 0.85)
+        self.assertAlmostEqual(combsum[2], 0.0 + 1.0)
+        combmnz = {r['document']['id']: r['score'] for r in fuse([first, second], method="combmnz")}
+        self.assertAlmostEqual(combmnz[0], 2 * combsum[0])
+        self.assertAlmostEqual(combmnz[1], combsum[1])
+        self.assertEqual(len(fuse([first, second], top_k=2, method="combsum", normalization="zscore")), 2)
+
+        np.testing.assert_allclose(normalize_scores([1.0, 2.0, 3.0], "zscore"), [-1.2247449, 0.0, 1.2247449])
+        self.assertEqual(normalize_scores([4.0, 4.0]), [1.0, 1.0])
+        self.assertEqual(document_id({'content': "abc"}), document_id({'content': "abc"}))
+        self.assertEqual(document_id({'id': 0, 'content': "abc"}), 0)
+        with self.assertRaises(ValueError):
+            fuse([first], method="borda")
+
+        retriever = RRF_Retriever([SlowRetriever(self.documents), SlowRetriever(self.documents[::-1])],
+                                  method="combmnz", weights=[1.0, 0.5])
+        self.assertEqual(retriever.search("query", top_k=3),
+                         fuse([SlowRetriever(self.documents).search("q", 50),
+                               SlowRetriever(self.documents[::-1]).search("q", 50)],
+                              top_k=3, method="combmnz", weights=[1.0, 0.5]))
+        retriever.close()
+
+    def test_adaptive_depth_matches_full_depth(self):
+        """测试自适应候选深度的结果与直接取最大深度相同，且简单查询取的候选更少"""
+        documents = create_random_documents(n_docs=120)
+        rng = random.Random(0)
+        for trial in range(20):
+            lists = []
+            for _ in range(3):
+                ranked = list(documents)
+                # 在共同的排序上做局部扰动，模拟相关但不完全一致的检索器
+                for _ in range(rng.choice([0, 5, 40, 200])):
+                    i = rng.randrange(len(ranked) - 1)
+                    j = min(len(ranked) - 1, i + rng.randint(1, 20))
+                    ranked[i], ranked[j] = ranked[j], ranked[i]
+                lists.append(ranked[:rng.choice([8, 60, 120])])
+            weights = [rng.choice([0.5, 1.0, 2.0]) for _ in lists]
+            top_k = rng.choice([1, 3, 10])
+            full = RRF_Retriever([SlowRetriever(ranked) for ranked in lists], weights=weights)
+            adaptive = RRF_Retriever([SlowRetriever(ranked) for ranked in lists], weights=weights,
+                                     adaptive_depth=True, initial_depth=4)
+            report = adaptive.search_with_report("query", top_k=top_k)
+            self.assertEqual(report['results'], full.search("query", top_k=top_k))
+            self.assertTrue(all(depth <= 50 for depth in report['depths']))
+            full.close()
+            adaptive.close()
+
+        easy = RRF_Retriever([SlowRetriever(documents), SlowRetriever(documents)], adaptive_depth=True)
+        report = easy.search_with_report("query", top_k=3)
+        self.assertEqual(report['depths'], [10, 10])
+        self.assertEqual([r['document']['id'] for r in report['results']], [0, 1, 2])
+        easy.close()
+
+
+class TestTextSimilarityReranker(unittest.TestCase):
+    """文本相似度重排器测试类"""
+
+    def test_corpus_fitted_mode(self):
+        """测试语料拟合模式：相似度与在语料上拟合的向量一致，重排不再重新拟合"""
+        documents = create_random_documents(n_docs=100)
+        query = "w1 w2 w3"
+        reranker = TextSimilarityReranker(corpus=documents)
+        vocabulary = dict(reranker.vectorizer.vocabulary_)
+        reference = VectorRetriever(documents)
+        expected = cosine_similarity(reference.vectorizer.transform([query]), reference.document_vectors).flatten()
+
+        candidates = documents[10:30:2]
+        results = reranker.rerank(query, candidates)
+        self.assertEqual(len(results), len(candidates))
+        for result in results:
+            self.assertAlmostEqual(result['similarity_score'], expected[result['document']['id']])
+        self.assertEqual(reranker.vectorizer.vocabulary_, vocabulary)
+        self.assertEqual(reranker.document_vectors.shape[0], len(documents))
+
+        # 不在语料中的文档只在本次请求内用语料上的IDF转换，不加入缓存
+        cached_vectors = reranker.document_vectors
+        new_docs = [{'id': 'new', 'content': "w1 w2 w3 w3"}, {'id': 'other', 'content': "w4 w1"}]
+        results = reranker.rerank(query, [new_docs[0]] + candidates + [new_docs[1]])
+        self.assertIs(reranker.document_vectors, cached_vectors)
+        self.assertEqual(len(reranker.row_ids), len(documents))
+        for new_doc in new_docs:
+            new_result = next(r for r in results if r['document'] is new_doc)
+            expected_new = cosine_similarity(reference.vectorizer.transform([query]),
+                                             reference.vectorizer.transform([new_doc['content']]))[0, 0]
+            self.assertAlmostEqual(new_result['similarity_score'], expected_new)
+        for result in results:
+            if result['document'] not in new_docs:
+                self.assertAlmostEqual(result['similarity_score'], expected[result['document']['id']])
+
+        compact = TextSimilarityReranker(corpus=documents, low_memory=True)
+        self.assertEqual(compact.document_vectors.dtype, np.float32)
+        for result, reference_result in zip(compact.rerank(query, candidates), reranker.rerank(query, candidates)):
+            self.assertAlmostEqual(float(result['similarity_score']), reference_result['similarity_score'], places=5)
+        self.assertGreater(compact.memory_usage()['data_bytes'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+相似度算法测试文件
+验证批量、检索等实现与逐对计算的纯Python版本结果一致
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+# 添加4.3目录到Python路径中
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '4.3'))
+
+from similarity_algorithms import (
+    cosine_similarity,
+    dot_product,
+    euclidean_distance,
+    batch_cosine_similarity,
+    batch_dot_product,
+    batch_euclidean_distance,
+    NormalizedVectors,
+)
+from top_k_search import top_k_search
+from quantization import QuantizedIndex, quantize_int8, hamming_distance, quantize_binary
+from benchmark_similarity import compare_reports, run_benchmarks
+
+
+class TestBatchSimilarity(unittest.TestCase):
+    """批量相似度计算测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        rng = np.random.default_rng(0)
+        self.queries = rng.standard_normal((3, 16)).astype(np.float32)
+        self.corpus = rng.standard_normal((50, 16)).astype(np.float32)
+        # 加入零向量和与查询相同的向量，覆盖边界情况
+        self.corpus[7] = 0.0
+        self.corpus[11] = self.queries[0]
+
+    def _check_against_scalar(self, batch_func, scalar_func):
+        """逐元素对比批量结果与标量结果"""
+        # 使用较小的分块，确保跨分块拼接正确
+        result = batch_func(self.queries, self.corpus, block_size=7)
+        self.assertEqual(result.shape, (3, 50))
+        self.assertEqual(result.dtype, np.float32)
+        for i, query in enumerate(self.queries.tolist()):
+            for j, doc in enumerate(self.corpus.tolist()):
+                self.assertAlmostEqual(result[i, j], scalar_func(query, doc), places=4)
+
+    def test_batch_cosine_similarity(self):
+        """测试批量余弦相似度"""
+        self._check_against_scalar(batch_cosine_similarity, cosine_similarity)
+
+    def test_batch_dot_product(self):
+        """测试批量点积"""
+        self._check_against_scalar(batch_dot_product, dot_product)
+
+    def test_batch_euclidean_distance(self):
+        """测试批量欧几里得距离"""
+        self._check_against_scalar(batch_euclidean_distance, euclidean_distance)
+        result = batch_euclidean_distance(self.queries[0], self.corpus)
+        self.assertEqual(result[0, 11], 0.0)
+
+    def test_dimension_mismatch(self):
+        """测试维度不匹配时抛出异常"""
+        with self.assertRaises(ValueError):
+            batch_cosine_similarity(self.queries, self.corpus[:, :8])
+
+
+class TestNormalizedVectors(unittest.TestCase):
+    """预归一化向量容器测试类"""
+
+    def test_cosine_on_normalized_corpus(self):
+        """测试预归一化语料上的余弦相似度与原始结果一致"""
+        rng = np.random.default_rng(2)
+        queries = rng.standard_normal((2, 8)).astype(np.float32)
+        corpus = rng.standard_normal((20, 8)).astype(np.float32)
+        corpus[3] = 0.0
+
+        normalized = NormalizedVectors(corpus)
+        np.testing.assert_allclose(np.linalg.norm(normalized.vectors[0]), 1.0, rtol=1e-6)
+        np.testing.assert_array_equal(normalized.vectors[3], 0.0)
+        np.testing.assert_allclose(
+            batch_cosine_similarity(queries, normalized),
+            batch_cosine_similarity(queries, corpus),
+            atol=1e-6,
+        )
+        indices, _ = top_k_search(queries, normalized, k=5)
+        expected, _ = top_k_search(queries, corpus, k=5)
+        np.testing.assert_array_equal(indices, expected)
+
+
+class TestTopKSearch(unittest.TestCase):
+    """精确Top-K检索测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        rng = np.random.default_rng(1)
+        self.queries = rng.standard_normal((4, 32)).astype(np.float32)
+        self.corpus = rng.standard_normal((1000, 32)).astype(np.float32)
+
+    def _expected(self, metric, k):
+        """通过完整排序得到的期望结果"""
+        if metric == "cosine":
+            scores = batch_cosine_similarity(self.queries, self.corpus)
+            return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        if metric == "dot":
+            scores = batch_dot_product(self.queries, self.corpus)
+            return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        scores = batch_euclidean_distance(self.queries, self.corpus)
+        return np.argsort(scores, axis=1, kind="stable")[:, :k]
+
+    def test_matches_full_sort(self):
+        """测试分块检索结果与完整排序一致"""
+        for metric in ("cosine", "dot", "euclidean"):
+            indices, scores = top_k_search(
+                self.queries, self.corpus, k=10, metric=metric, block_size=64
+            )
+            np.testing.assert_array_equal(indices, self._expected(metric, 10))
+            self.assertEqual(scores.shape, (4, 10))
+
+    def test_memory_mapped_files(self):
+        """测试从 .npy 与原始float32文件流式检索"""
+        expected = self._expected("cosine", 5)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            npy_path = os.path.join(tmp_dir, "corpus.npy")
+            raw_path = os.path.join(tmp_dir, "corpus.f32")
+            np.save(npy_path, self.corpus)
+            self.corpus.tofile(raw_path)
+
+            indices, _ = top_k_search(self.queries, npy_path, k=5, block_size=100)
+            np.testing.assert_array_equal(indices, expected)
+            indices, _ = top_k_search(self.queries, raw_path, k=5, block_size=100, dim=32)
+            np.testing.assert_array_equal(indices, expected)
+
+    def test_k_larger_than_corpus(self):
+        """测试k大于语料大小时返回全部文档"""
+        indices, _ = top_k_search(self.queries, self.corpus[:3], k=10)
+        self.assertEqual(indices.shape, (4, 3))
+
+
+class TestQuantizedIndex(unittest.TestCase):
+    """量化检索测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        rng = np.random.default_rng(3)
+        self.corpus = rng.standard_normal((2000, 64)).astype(np.float32)
+        self.queries = self.corpus[:3] + 0.05 * rng.standard_normal((3, 64)).astype(np.float32)
+
+    def test_int8_roundtrip(self):
+        """测试int8量化误差在一个量化步长以内"""
+        codes, scales = quantize_int8(self.corpus)
+        self.assertEqual(codes.dtype, np.int8)
+        restored = codes.astype(np.float32) * scales[:, None]
+        self.assertTrue(np.all(np.abs(restored - self.corpus) <= scales[:, None] * 0.5 + 1e-6))
+
+    def test_hamming_distance(self):
+        """测试打包后的汉明距离与逐位比较一致"""
+        codes = quantize_binary(self.corpus[:10])
+        distances = hamming_distance(codes[:2], codes)
+        expected = ((self.corpus[:2, None, :] > 0) != (self.corpus[None, :10, :] > 0)).sum(axis=2)
+        np.testing.assert_array_equal(distances, expected)
+
+    def test_full_rescore_is_exact(self):
+        """测试重排深度覆盖全部语料时结果与精确检索一致"""
+        for method in ("int8", "binary"):
+            for metric in ("cosine", "dot", "euclidean"):
+                index = QuantizedIndex(self.corpus, method=method, metric=metric, block_size=300)
+                indices, scores = index.search(self.queries, k=5, rescore_depth=len(self.corpus))
+                expected, expected_scores = top_k_search(self.queries, self.corpus, k=5, metric=metric)
+                np.testing.assert_array_equal(indices, expected)
+                np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-4)
+
+    def test_shortlist_recall(self):
+        """测试重排深度远小于语料规模时的召回率"""
+        rng = np.random.default_rng(4)
+        # 聚类数据上近邻关系明确，量化候选列表才有稳定的召回
+        centers = rng.standard_normal((40, 64)).astype(np.float32)
+        corpus = centers[rng.integers(0, 40, 2000)] + 0.3 * rng.standard_normal((2000, 64)).astype(np.float32)
+        queries = corpus[:20] + 0.05 * rng.standard_normal((20, 64)).astype(np.float32)
+        expected, _ = top_k_search(queries, corpus, k=5)
+
+        for method, min_recall in (("int8", 0.95), ("binary", 0.9)):
+            index = QuantizedIndex(corpus, method=method, block_size=300)
+            indices, scores = index.search(queries, k=5, rescore_depth=50)
+            recall = np.mean([len(set(found) & set(exact)) / 5 for found, exact in zip(indices, expected)])
+            self.assertGreaterEqual(recall, min_recall, method)
+            # 返回的分数来自float32精确重排
+            exact_scores = batch_cosine_similarity(queries, corpus)
+            np.testing.assert_allclose(
+                scores, np.take_along_axis(exact_scores, indices, axis=1), rtol=1e-4, atol=1e-4
+            )
+
+    def test_memory_usage(self):
+        """测试量化编码的压缩比"""
+        self.assertAlmostEqual(QuantizedIndex(self.corpus, method="binary").memory_usage()["compression_ratio"], 32.0)
+        self.assertGreater(QuantizedIndex(self.corpus, method="int8").memory_usage()["compression_ratio"], 3.5)
+
+
+class TestBenchmark(unittest.TestCase):
+    """基准测试脚本冒烟测试类"""
+
+    def test_run_and_compare(self):
+        """测试小规模基准测试能跑通并检测到吞吐量回退"""
+        methods = ["python", "batch", "topk", "quantized"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report = run_benchmarks([8], [50], n_queries=3, k=5, methods=methods, work_dir=tmp_dir)
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+        self.assertEqual(len(report["results"]), 11)
+        for record in report["results"]:
+            self.assertGreater(record["vectors_per_sec"], 0)
+            self.assertGreaterEqual(record["peak_memory_mb"], 0)
+            self.assertLessEqual(record["latency_ms"]["p50"], record["latency_ms"]["p99"])
+
+        self.assertEqual(compare_reports(report, report), [])
+        slower = {"results": [dict(record, vectors_per_sec=record["vectors_per_sec"] / 2)
+                              for record in report["results"]]}
+        self.assertEqual(len(compare_reports(report, slower)), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()